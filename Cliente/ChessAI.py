@@ -0,0 +1,395 @@
+''' Oponente do computador: negamax com poda alfa-beta, aprofundamento iterativo, busca de
+quiescência e tabela de transposição, sempre dentro de um limite de tempo ou de nós por lance.
+Usa só a interface do GameState (getValidMoves/makeMove/undoMove) '''
+
+import argparse
+import random
+import time
+
+import ChessBook
+import ChessEngine
+import ChessTablebase
+
+CHECKMATE = 100000
+STALEMATE = 0
+MATE_THRESHOLD = CHECKMATE - 1000  # pontuações acima disso são mates em N lances
+
+pieceValues = {'K': 0, 'Q': 900, 'R': 500, 'B': 330, 'N': 320, 'P': 100}
+
+# tabelas de posição do ponto de vista das brancas, casa 0 = a8 (igual ao tabuleiro do GameState).
+# Para as pretas a tabela é espelhada na vertical (casa ^ 56)
+pieceSquareTables = {
+    'P': [0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0],
+    'N': [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    'B': [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    'R': [0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0],
+    'Q': [-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20],
+    'K': [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20],
+}
+
+# valor de cada peça em cada casa (material + tabela), já espelhado para as pretas
+_squareScores = {}
+for _kind, _table in pieceSquareTables.items():
+    _squareScores['w' + _kind] = [pieceValues[_kind] + _table[sq] for sq in range(64)]
+    _squareScores['b' + _kind] = [pieceValues[_kind] + _table[sq ^ 56] for sq in range(64)]
+
+
+def evaluate(gs):  # avaliação estática do ponto de vista de quem joga
+    if not gs.useBitboards:
+        return _evaluateBoard(gs)  # sem bitboards eles não acompanham os movimentos
+    pieces = gs.bitboards.pieces
+    score = 0
+    for piece, scores in _squareScores.items():
+        bb = pieces[piece]
+        total = 0
+        while bb:
+            low = bb & -bb
+            total += scores[low.bit_length() - 1]
+            bb ^= low
+        score += total if piece[0] == 'w' else -total
+    return score if gs.whiteToMove else -score
+
+
+def _evaluateBoard(gs):  # a mesma avaliação percorrendo a lista 8x8
+    score = 0
+    for r, row in enumerate(gs.board):
+        for c, piece in enumerate(row):
+            if piece != '--':
+                value = _squareScores[piece][r * 8 + c]
+                score += value if piece[0] == 'w' else -value
+    return score if gs.whiteToMove else -score
+
+
+# tabela de transposição: tipo do valor guardado
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult():
+    def __init__(self, bestMove, score, pv, depth, nodes, seconds, timedOut, fromBook=False):
+        self.bestMove = bestMove
+        self.score = score
+        self.pv = pv  # variação principal (lista de Move)
+        self.depth = depth  # última profundidade completa
+        self.nodes = nodes
+        self.seconds = seconds
+        self.nps = nodes / seconds if seconds > 0 else 0.0
+        self.timedOut = timedOut
+        self.fromBook = fromBook  # lance do livro de aberturas, sem busca
+        self.iterations = []  # (profundidade, valor, pv) de cada iteração completa
+
+    def __repr__(self):
+        return 'SearchResult(%s, score=%d, depth=%d, nodes=%d, nps=%.0f, pv=%s)' % (
+            self.bestMove, self.score, self.depth, self.nodes, self.nps,
+            ' '.join(m.getChessNot() for m in self.pv))
+
+
+class Searcher():
+    def __init__(self, maxTime=1.0, maxNodes=None, maxDepth=64, ttSize=1 << 18):
+        self.maxTime = maxTime  # segundos por lance (None = sem limite de tempo)
+        self.maxNodes = maxNodes  # nós por lance (None = sem limite de nós)
+        self.maxDepth = maxDepth
+        self.ttSize = ttSize
+        self.tt = {}  # hash de Zobrist -> (profundidade, valor, tipo, moveID do melhor movimento)
+        self.nodes = 0
+        self.deadline = None
+        self.nodeLimit = None
+        self.tablebase = None  # o gs.tablebase da busca atual
+
+    def search(self, gs, rootMoves=None):
+        # rootMoves restringe a busca a alguns movimentos da raiz (usado na busca paralela)
+        if rootMoves is None:
+            bookMove = gs.getBookMove()  # no começo da partida o livro responde sem busca
+            if bookMove is not None:
+                return SearchResult(bookMove, 0, [bookMove], 0, 0, 0.0, False, True)
+        self.tablebase = gs.tablebase
+        if self.tablebase is not None and rootMoves is None:
+            hit = self.tablebase.bestMove(gs)  # final com três peças: resultado exato, sem busca
+            if hit is not None:
+                move, result, plies = hit
+                return SearchResult(move, tablebaseScore(result, plies, 0), [move], 0, 0, 0.0, False)
+        moves = gs.getValidMoves()
+        if rootMoves is not None:
+            moves = [m for m in moves if m in rootMoves]
+        if not moves:
+            return None
+        # a busca chama getValidMoves em posições finais, o que marcaria xeque-mate no jogo real
+        checkMate, stalemate = gs.checkMate, gs.stalemate
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + self.maxTime if self.maxTime is not None else None
+        self.nodeLimit = self.maxNodes
+        if len(self.tt) > self.ttSize:
+            self.tt.clear()
+
+        best = SearchResult(moves[0], 0, [moves[0]], 0, 0, 0.0, False)
+        iterations = []
+        timedOut = False
+        try:
+            for depth in range(1, self.maxDepth + 1):
+                score, pv = self.searchRoot(gs, moves, depth)
+                iterations.append((depth, score, pv))
+                best = SearchResult(pv[0], score, pv, depth, self.nodes, time.perf_counter() - start, False)
+                # coloca o melhor movimento primeiro para a próxima iteração
+                moves.remove(pv[0])
+                moves.insert(0, pv[0])
+                if abs(score) >= MATE_THRESHOLD or (len(moves) == 1 and rootMoves is None):
+                    break
+        except SearchTimeout:
+            timedOut = True
+        finally:
+            gs.checkMate, gs.stalemate = checkMate, stalemate
+        best.nodes = self.nodes
+        best.seconds = time.perf_counter() - start
+        best.nps = best.nodes / best.seconds if best.seconds > 0 else 0.0
+        best.timedOut = timedOut
+        best.iterations = iterations
+        return best
+
+    def checkBudget(self):
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            raise SearchTimeout()
+        if self.deadline is not None and not self.nodes & 255 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def searchRoot(self, gs, moves, depth):
+        alpha, beta = -CHECKMATE - 1, CHECKMATE + 1
+        bestPv = None
+        for move in moves:
+            gs.makeMove(move)
+            try:
+                score, pv = self.negamax(gs, depth - 1, -beta, -alpha, 1)
+            finally:
+                gs.undoMove()
+            score = -score
+            if bestPv is None or score > alpha:
+                alpha = score
+                bestPv = [move] + pv
+        return alpha, bestPv
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        self.nodes += 1
+        self.checkBudget()
+        if gs.repetitionCount() >= 2:
+            return 0, []
+        if self.tablebase is not None:
+            hit = self.tablebase.probe(gs)
+            if hit is not None:
+                return tablebaseScore(hit[0], hit[1], ply), []
+        if depth <= 0:
+            return self.quiescence(gs, alpha, beta, ply), []
+
+        originalAlpha = alpha
+        entry = self.tt.get(gs.zobristKey)
+        ttMove = None
+        if entry is not None:
+            ttDepth, ttScore, ttFlag, ttMove = entry
+            ttScore = scoreFromTT(ttScore, ply)
+            if ttDepth >= depth:
+                if ttFlag == EXACT:
+                    return ttScore, []
+                if ttFlag == LOWER:
+                    alpha = max(alpha, ttScore)
+                elif ttFlag == UPPER:
+                    beta = min(beta, ttScore)
+                if alpha >= beta:
+                    return ttScore, []
+
+        moves = gs.getValidMoves()
+        if not moves:
+            return (-CHECKMATE + ply if gs.inCheck() else STALEMATE), []
+
+        bestScore = -CHECKMATE - 1
+        bestPv = []
+        bestMove = None
+        for move in self.orderMoves(moves, ttMove):
+            gs.makeMove(move)
+            try:
+                score, pv = self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                gs.undoMove()
+            score = -score
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                bestPv = [move] + pv
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if bestScore <= originalAlpha:
+            flag = UPPER
+        elif bestScore >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt[gs.zobristKey] = (depth, scoreToTT(bestScore, ply), flag, bestMove.moveID)
+        return bestScore, bestPv
+
+    def quiescence(self, gs, alpha, beta, ply):
+        # só capturas e promoções, até a posição ficar quieta
+        self.nodes += 1
+        self.checkBudget()
+        if self.tablebase is not None:
+            hit = self.tablebase.probe(gs)
+            if hit is not None:
+                return tablebaseScore(hit[0], hit[1], ply)
+        standPat = evaluate(gs)
+        if standPat >= beta:
+            return standPat
+        alpha = max(alpha, standPat)
+        moves = [m for m in gs.getValidMoves() if m.pieceCaptured != '--' or m.isPawnPromotion]
+        for move in self.orderMoves(moves, None):
+            gs.makeMove(move)
+            try:
+                score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            finally:
+                gs.undoMove()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def orderMoves(self, moves, ttMove):
+        # movimento da tabela primeiro, depois capturas (vítima mais valiosa, atacante menos valioso)
+        def priority(move):
+            if move.moveID == ttMove:
+                return -100000
+            score = 0
+            if move.pieceCaptured != '--':
+                score -= 10 * pieceValues[move.pieceCaptured[1]] - pieceValues[move.pieceMoved[1]]
+            if move.isPawnPromotion:
+                score -= pieceValues['Q']
+            return score
+        return sorted(moves, key=priority)
+
+
+def scoreToTT(score, ply):
+    # mates são guardados a partir do nó (mate em N lances daqui), não da raiz: a mesma posição
+    # alcançada em outro ply tem de dar a distância certa até o mate
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def scoreFromTT(score, ply):  # o inverso de scoreToTT, de volta para a distância da raiz
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def tablebaseScore(result, plies, ply):
+    # resultado da tablebase na mesma escala dos mates da busca (mate mais perto vale mais)
+    if result == ChessTablebase.WIN:
+        return CHECKMATE - ply - plies
+    if result == ChessTablebase.LOSS:
+        return -CHECKMATE + ply + plies
+    return STALEMATE
+
+
+def findBestMove(gs, maxTime=1.0, maxNodes=None, maxDepth=64):
+    return Searcher(maxTime, maxNodes, maxDepth).search(gs)
+
+
+def playGame(white, black, fen=ChessEngine.STARTING_FEN, maxPlies=300, openingPlies=0, rng=None, book=None,
+             tablebase=None):
+    # partida entre dois Searcher sem interface nem servidor; retorna ('1-0' | '0-1' | '1/2-1/2', lances).
+    # openingPlies lances aleatórios no início variam as partidas de treino; book é um OpeningBook e
+    # tablebase uma Tablebase
+    gs = ChessEngine.GameState()
+    gs.loadFEN(fen)
+    gs.book = book
+    gs.tablebase = tablebase
+    rng = rng or random.Random()
+    for ply in range(maxPlies):
+        moves = gs.getValidMoves()
+        if not moves:
+            if gs.inCheck():
+                return ('0-1' if gs.whiteToMove else '1-0'), gs.moveLog
+            return '1/2-1/2', gs.moveLog
+        if gs.repetitionCount() >= 3:
+            return '1/2-1/2', gs.moveLog
+        if ply < openingPlies:
+            move = rng.choice(moves)
+        else:
+            move = (white if gs.whiteToMove else black).search(gs).bestMove
+        gs.makeMove(move)
+    return '1/2-1/2', gs.moveLog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Partidas do computador contra ele mesmo')
+    parser.add_argument('--games', type=int, default=1)
+    parser.add_argument('--time', type=float, default=0.5, help='segundos por lance')
+    parser.add_argument('--nodes', type=int, help='limite de nós por lance')
+    parser.add_argument('--fen', default=ChessEngine.STARTING_FEN)
+    parser.add_argument('--random-plies', type=int, default=2)
+    parser.add_argument('--book', metavar='ARQ', help='livro de aberturas (ChessBook)')
+    parser.add_argument('--tablebases', metavar='PASTA', help='tablebases de finais (ChessTablebase)')
+    args = parser.parse_args(argv)
+
+    book = ChessBook.OpeningBook(args.book) if args.book else None
+    tablebase = ChessTablebase.Tablebase(args.tablebases) if args.tablebases else None
+
+    results = {'1-0': 0, '0-1': 0, '1/2-1/2': 0}
+    for game in range(args.games):
+        white = Searcher(args.time, args.nodes)
+        black = Searcher(args.time, args.nodes)
+        result, moves = playGame(white, black, args.fen, openingPlies=args.random_plies, book=book,
+                                 tablebase=tablebase)
+        results[result] += 1
+        print('partida %d: %s em %d lances' % (game + 1, result, len(moves)))
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
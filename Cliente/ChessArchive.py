@@ -0,0 +1,325 @@
+''' Arquivo de partidas do servidor, só de acréscimo. Cada processo do servidor grava na própria
+pasta (shard-N) três arquivos:
+
+- journal.dat: cada lance assim que é aceito (id u32, lance u16, movimento u16), para não perder
+  as partidas em andamento se o processo cair; é reaproveitado na próxima abertura e reescrito só
+  com as partidas abertas quando as terminadas passam a ocupar a maior parte dele
+- games.dat: cada partida terminada como um bloco contínuo de movimentos de 2 bytes (os 12 bits
+  do protocolo: casa inicial << 6 | casa final; a promoção é sempre para rainha)
+- games.idx: índice endereçado direto pelo contador do id da partida, 16 bytes por partida
+  (posição no games.dat, lances, resultado, estado << 4 | motivo e horário)
+
+A leitura usa mmap nos dois últimos: achar uma partida é uma conta e abrir uma posição é refazer
+só os lances até ela, com memória constante qualquer que seja o tamanho do arquivo '''
+
+import argparse
+import collections
+import mmap
+import os
+import struct
+import sys
+import time
+
+import ChessEngine
+
+WORKER_BITS = 24  # o mesmo do servidor: id = (processo << WORKER_BITS) | contador
+COUNTER_MASK = (1 << WORKER_BITS) - 1
+
+_journal = struct.Struct('<IHH')
+COMPACT_RECORDS = 1 << 16  # registros de partidas terminadas tolerados no journal antes de reescrevê-lo
+_index = struct.Struct('<QHBBI')  # posição, lances, resultado, estado << 4 | motivo, horário
+
+# estado da entrada do índice
+MISSING = 0
+FINISHED = 1
+INTERRUPTED = 2  # recuperada do journal: o processo parou antes do fim da partida
+
+# resultados, os mesmos números do protocolo (WHITE_WINS, BLACK_WINS, DRAW); 255 = sem resultado
+NO_RESULT = 255
+RESULTS = {0: '1-0', 1: '0-1', 2: '1/2-1/2'}
+
+GameRecord = collections.namedtuple('GameRecord', 'gameId moves result reason status endTime')
+
+
+def shardPath(root, worker):
+    return os.path.join(root, 'shard-%d' % worker)
+
+
+class ArchiveWriter():
+    # uma pasta (shard) por processo do servidor; nenhum outro processo escreve nela
+    def __init__(self, path, sync=False):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.sync = sync  # fsync do journal a cada lance (mais lento, sobrevive a queda da máquina)
+        self.games = open(os.path.join(path, 'games.dat'), 'ab')
+        indexPath = os.path.join(path, 'games.idx')
+        self.index = open(indexPath, 'r+b' if os.path.exists(indexPath) else 'w+b')
+        self.active = {}  # id -> lista de movimentos das partidas em andamento
+        self.activeMoves = 0  # lances das partidas em andamento, todos também no journal
+        self.journalRecords = 0  # registros no journal, dessas partidas e das que já terminaram
+        self.recover()
+        self.journal = open(os.path.join(path, 'journal.dat'), 'ab')
+
+    def nextCounter(self):  # primeiro contador livre, para os ids continuarem depois de reiniciar
+        self.index.seek(0, os.SEEK_END)
+        return max(self.index.tell() // _index.size, 1)
+
+    def recover(self):
+        # partidas do journal que não chegaram ao índice entram como interrompidas
+        journalPath = os.path.join(self.path, 'journal.dat')
+        if not os.path.exists(journalPath):
+            return
+        pending = collections.OrderedDict()
+        with open(journalPath, 'rb') as f:
+            data = f.read()
+        for gameId, ply, code in _journal.iter_unpack(data[:len(data) - len(data) % _journal.size]):
+            moves = pending.setdefault(gameId, [])
+            if ply == len(moves):
+                moves.append(code)
+        for gameId, moves in pending.items():
+            if self.entry(gameId)[4] == MISSING:
+                self.writeGame(gameId, moves, NO_RESULT, 0, INTERRUPTED)
+        self.games.flush()
+        self.index.flush()
+        os.truncate(journalPath, 0)
+
+    def entry(self, gameId):
+        self.index.seek((gameId & COUNTER_MASK) * _index.size)
+        data = self.index.read(_index.size)
+        return _unpackEntry(data, 0) if len(data) == _index.size else (0, 0, 0, 0, MISSING, 0)
+
+    def recordMove(self, gameId, ply, code):
+        moves = self.active.setdefault(gameId, [])
+        if ply != len(moves):
+            raise ValueError('lance %d fora de ordem na partida %d' % (ply, gameId))
+        moves.append(code)
+        self.activeMoves += 1
+        self.journalRecords += 1
+        self.journal.write(_journal.pack(gameId, ply, code))
+        self.journal.flush()
+        if self.sync:
+            os.fsync(self.journal.fileno())
+
+    def finishGame(self, gameId, result=NO_RESULT, reason=0):
+        moves = self.active.pop(gameId, [])
+        self.activeMoves -= len(moves)
+        self.writeGame(gameId, moves, result, reason, FINISHED)
+        self.games.flush()
+        self.index.flush()
+        if self.journalRecords - self.activeMoves > max(self.activeMoves, COMPACT_RECORDS) or not self.active:
+            self.compact()
+
+    def compact(self):
+        # reescreve o journal só com os lances das partidas em andamento; as terminadas já estão no
+        # games.dat (com sync, gravadas no disco antes de saírem do journal)
+        if self.sync:
+            os.fsync(self.games.fileno())
+            os.fsync(self.index.fileno())
+        journalPath = os.path.join(self.path, 'journal.dat')
+        with open(journalPath + '.tmp', 'wb') as f:
+            for gameId, moves in self.active.items():
+                f.write(b''.join(_journal.pack(gameId, ply, code) for ply, code in enumerate(moves)))
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+        self.journal.close()
+        os.replace(journalPath + '.tmp', journalPath)  # uma queda no meio deixa o journal antigo inteiro
+        self.journal = open(journalPath, 'ab')
+        self.journalRecords = self.activeMoves
+
+    def writeGame(self, gameId, moves, result, reason, status):
+        offset = self.games.tell()
+        self.games.write(struct.pack('<%dH' % len(moves), *moves))
+        self.index.seek((gameId & COUNTER_MASK) * _index.size)
+        self.index.write(_index.pack(offset, len(moves), result, status << 4 | reason, int(time.time())))
+
+    def close(self):
+        # partidas ainda abertas ficam no journal e voltam como interrompidas na próxima abertura
+        self.journal.close()
+        self.games.close()
+        self.index.close()
+
+
+class ArchiveShard():
+    # leitura de uma pasta com mmap; refresh() mapeia de novo quando os arquivos crescem
+    def __init__(self, path):
+        self.path = path
+        self.games = self.index = None
+        self.gamesFile = self.indexFile = None
+        self.refresh()
+
+    def refresh(self):
+        self.close()
+        self.gamesFile = open(os.path.join(self.path, 'games.dat'), 'rb')
+        self.indexFile = open(os.path.join(self.path, 'games.idx'), 'rb')
+        self.games = _map(self.gamesFile)
+        self.index = _map(self.indexFile)
+
+    def entries(self):
+        return len(self.index) // _index.size
+
+    def entry(self, counter):
+        if counter >= self.entries():
+            if os.path.getsize(os.path.join(self.path, 'games.idx')) > len(self.index):
+                self.refresh()
+            if counter >= self.entries():
+                return None
+        entry = _unpackEntry(self.index, counter * _index.size)
+        if entry[4] == MISSING:
+            return None
+        if entry[0] + 2 * entry[1] > len(self.games):
+            self.refresh()
+        return entry
+
+    def moves(self, entry, plies=None):  # tupla de códigos, só dos primeiros plies lances se pedido
+        offset, count = entry[0], entry[1]
+        count = count if plies is None else min(plies, count)
+        return struct.unpack_from('<%dH' % count, self.games, offset)
+
+    def close(self):
+        for handle in (self.games, self.index, self.gamesFile, self.indexFile):
+            if handle is not None and not isinstance(handle, bytes):
+                handle.close()
+
+
+def _unpackEntry(data, offset):  # (posição, lances, resultado, motivo, estado, horário)
+    position, plies, result, state, endTime = _index.unpack_from(data, offset)
+    return position, plies, result, state & 15, state >> 4, endTime
+
+
+def _map(f):
+    # mmap não aceita arquivo vazio: nesse caso um bytes vazio faz o mesmo papel
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ArchiveReader():
+    # root é a pasta do arquivo (com as pastas shard-N) ou a pasta de um shard
+    def __init__(self, root):
+        self.root = root
+        self.shards = {}
+        if os.path.exists(os.path.join(root, 'games.idx')):
+            self.shards[0] = ArchiveShard(root)
+        else:
+            for name in sorted(os.listdir(root)):
+                if name.startswith('shard-') and os.path.exists(os.path.join(root, name, 'games.idx')):
+                    self.shards[int(name[6:])] = ArchiveShard(os.path.join(root, name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+
+    def _entry(self, gameId):
+        shard = self.shards.get(gameId >> WORKER_BITS)
+        if shard is None:
+            return None, None
+        return shard, shard.entry(gameId & COUNTER_MASK)
+
+    def game(self, gameId, plies=None):  # GameRecord ou None
+        shard, entry = self._entry(gameId)
+        if entry is None:
+            return None
+        offset, count, result, reason, status, endTime = entry
+        return GameRecord(gameId, shard.moves(entry, plies), result, reason, status, endTime)
+
+    def gameIds(self):  # ids de todas as partidas gravadas, shard por shard, sem carregar os lances
+        for worker, shard in sorted(self.shards.items()):
+            for counter in range(shard.entries()):
+                if shard.index[counter * _index.size + 11] >> 4 != MISSING:
+                    yield worker << WORKER_BITS | counter
+
+    def games(self, gameIds=None):
+        for gameId in (self.gameIds() if gameIds is None else gameIds):
+            record = self.game(gameId)
+            if record is not None:
+                yield record
+
+    def replay(self, gameId, ply=None):
+        # GameState na posição depois de ply lances (o fim da partida se ply for None)
+        record = self.game(gameId, ply)
+        if record is None:
+            raise KeyError('partida %d não está no arquivo' % gameId)
+        gs = ChessEngine.GameState(moveCacheSize=0)
+        for move in replayMoves(gs, record.moves):
+            gs.makeMove(move)
+        return gs
+
+
+def replayMoves(gs, codes):
+    # gera os Move de cada código na posição de gs; quem chama faz o makeMove de cada um
+    for ply, code in enumerate(codes):
+        legal = {move.moveID: move for move in gs.getValidMoves()}
+        if code not in legal:
+            raise ValueError('lance %d inválido no arquivo' % ply)
+        yield legal[code]
+
+
+def gamePGN(record, event='FNRC', site='?'):
+    # texto PGN de uma partida, com os lances em SAN
+    gs = ChessEngine.GameState(moveCacheSize=0)
+    result = RESULTS.get(record.result, '*')
+    date = time.strftime('%Y.%m.%d', time.gmtime(record.endTime)) if record.endTime else '????.??.??'
+    lines = ['[Event "%s"]' % event, '[Site "%s"]' % site, '[Date "%s"]' % date,
+             '[Round "%d"]' % record.gameId, '[White "?"]', '[Black "?"]', '[Result "%s"]' % result, '']
+    tokens = []
+    for ply, move in enumerate(replayMoves(gs, record.moves)):
+        if ply % 2 == 0:
+            tokens.append('%d.' % (ply // 2 + 1))
+        tokens.append(gs.getSAN(move))
+        gs.makeMove(move)
+    tokens.append(result)
+    line = ''
+    for token in tokens:  # linhas de até 80 colunas
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+def exportPGN(reader, out, gameIds=None):
+    # escreve as partidas em out uma por vez (memória constante); devolve quantas foram escritas
+    count = 0
+    for record in reader.games(gameIds):
+        out.write(gamePGN(record))
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Arquivo de partidas do servidor')
+    parser.add_argument('archive', help='pasta do arquivo')
+    parser.add_argument('--game', type=int, help='id da partida')
+    parser.add_argument('--ply', type=int, help='mostra a posição (FEN) depois deste lance')
+    parser.add_argument('--pgn', metavar='ARQ', help="exporta em PGN ('-' para a saída padrão)")
+    args = parser.parse_args(argv)
+
+    with ArchiveReader(args.archive) as reader:
+        if args.pgn:
+            ids = [args.game] if args.game is not None else None
+            out = sys.stdout if args.pgn == '-' else open(args.pgn, 'w')
+            try:
+                count = exportPGN(reader, out, ids)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            print('%d partidas exportadas' % count, file=sys.stderr)
+        elif args.game is not None:
+            print(reader.replay(args.game, args.ply).getFEN())
+        else:
+            for record in reader.games():
+                print('%d\t%d lances\t%s%s' % (record.gameId, len(record.moves), RESULTS.get(record.result, '*'),
+                                               '\tinterrompida' if record.status == INTERRUPTED else ''))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+''' Avaliação estática de muitas posições de uma vez com NumPy: cada posição vira uma linha de 12
+bitboards (uint64, na ordem de ChessBitboard.PIECES) e todos os termos são calculados para o lote
+inteiro em operações vetorizadas, sem laço em Python por posição ou por casa:
+
+- material e tabelas de posição: os mesmos valores de ChessAI.evaluate, somados por consulta a uma
+  tabela com o valor de cada byte de cada bitboard;
+- mobilidade aproximada: casas atacadas por cada tipo de peça (cavalo, bispo, torre, dama) que não
+  estão ocupadas por peças da mesma cor, com os ataques deslizantes calculados por preenchimento
+  (Kogge-Stone) nos próprios bitboards. É a união dos ataques de cada tipo, não a soma peça a peça;
+- estrutura de peões: peões dobrados, isolados e passados (bônus conforme o avanço).
+
+evaluateReference faz a mesma conta em Python puro, posição por posição, e serve de conferência
+(--check na linha de comando) e de alternativa quando o NumPy não está instalado.
+
+Na linha de comando a colocação das peças é lida direto do texto (parseFEN/packSquares), sem montar
+um GameState por linha, e cada linha de entrada sai como veio, seguida da avaliação.
+
+Uso: python ChessBatchEval.py ARQUIVO [-o SAIDA] [--terms material,mobility,pawns] [--chunk N] [--check] '''
+
+import argparse
+import sys
+
+try:
+    import numpy as np
+except ImportError:  # sem NumPy só a avaliação em Python puro (evaluateReference) funciona
+    np = None
+
+import ChessAI
+import ChessBitboard
+import ChessEngine
+import ChessPipeline
+from ChessBitboard import FILE_A, FILE_H, FULL, PIECES
+
+TERMS = ('material', 'mobility', 'pawns')
+
+MOBILITY_WEIGHT = {'N': 4, 'B': 4, 'R': 2, 'Q': 1}  # centipeões por casa atacada
+DOUBLED_PAWN = -15  # por peão além do primeiro na coluna
+ISOLATED_PAWN = -12  # por peão sem peões da mesma cor nas colunas vizinhas
+# bônus do peão passado pela linha do tabuleiro (linha 0 = oitava fileira), do ponto de vista das brancas
+PASSED_PAWN = (0, 100, 65, 40, 25, 15, 10, 0)
+
+FILE_B = FILE_A << 1
+FILE_G = FILE_H >> 1
+# deslocamento e máscara contra a volta pela borda: positivo é <<, negativo é >>.
+# Casa = linha * 8 + coluna, então -8 é uma linha para cima (na direção das pretas)
+ROOK_SHIFTS = ((-8, FULL), (8, FULL), (1, ~FILE_A & FULL), (-1, ~FILE_H & FULL))
+BISHOP_SHIFTS = ((-7, ~FILE_A & FULL), (-9, ~FILE_H & FULL), (9, ~FILE_A & FULL), (7, ~FILE_H & FULL))
+KNIGHT_SHIFTS = ((10, ~(FILE_A | FILE_B) & FULL), (6, ~(FILE_G | FILE_H) & FULL),
+                 (17, ~FILE_A & FULL), (15, ~FILE_H & FULL),
+                 (-6, ~(FILE_A | FILE_B) & FULL), (-10, ~(FILE_G | FILE_H) & FULL),
+                 (-15, ~FILE_A & FULL), (-17, ~FILE_H & FULL))
+
+_PIECE_INDEX = {piece: i for i, piece in enumerate(PIECES)}
+
+
+def _squareTable():
+    # 12 x 64: material + tabela de posição de cada peça em cada casa, positivo para as brancas
+    table = []
+    for piece in PIECES:
+        scores = ChessAI._squareScores[piece]
+        table.append(scores if piece[0] == 'w' else [-s for s in scores])
+    return table
+
+
+# ---- empacotamento ----
+
+def _position(gs):
+    # bitboards do GameState; com useBitboards desligado eles não acompanham os lances e são
+    # montados a partir da lista 8x8
+    return gs.bitboards if gs.useBitboards else ChessBitboard.BitboardPosition.fromBoard(gs.board)
+
+
+def pack(states):
+    # (bitboards N x 12 uint64, vez das brancas N bool) a partir de GameStates (ou BitboardPositions
+    # junto com a vez, em pares)
+    rows = []
+    sides = []
+    for state in states:
+        if isinstance(state, tuple):
+            position, whiteToMove = state
+        else:
+            position, whiteToMove = _position(state), state.whiteToMove
+        pieces = position.pieces
+        rows.append([pieces[piece] for piece in PIECES])
+        sides.append(whiteToMove)
+    return np.array(rows, dtype=np.uint64).reshape(-1, 12), np.array(sides, dtype=bool)
+
+
+# dígito da FEN -> casas vazias ('.'), para cada fileira virar exatamente 8 caracteres
+_EXPAND = str.maketrans({str(n): '.' * n for n in range(1, 9)})
+# letra da FEN -> índice em PIECES
+_FEN_PIECES = {piece[1] if piece[0] == 'w' else piece[1].lower(): i for i, piece in enumerate(PIECES)}
+_SQUARE_CHARS = frozenset(_FEN_PIECES) | {'.'}
+
+
+def _charIndex():  # byte ASCII -> índice em PIECES, 12 para as casas vazias
+    table = np.full(256, 12, dtype=np.uint8)
+    for letter, i in _FEN_PIECES.items():
+        table[ord(letter)] = i
+    return table
+
+
+_CHAR_INDEX = _charIndex() if np is not None else None
+
+
+def parseFEN(text):
+    # (64 caracteres da casa 0 (a8) à 63 (h1), '.' nas vazias; vez das brancas) dos dois primeiros
+    # campos de uma FEN ou EPD, sem montar um GameState. ValueError nas posições que loadFEN recusaria
+    # pelo tabuleiro ou pela vez (roque e en passant não entram na avaliação e não são conferidos)
+    fields = text.split(None, 2)
+    if len(fields) < 2 or fields[1] not in ('w', 'b') or '.' in fields[0]:
+        raise ValueError('FEN inválida: ' + text)
+    ranks = fields[0].translate(_EXPAND).split('/')
+    squares = ''.join(ranks)
+    if len(ranks) != 8 or any(len(rank) != 8 for rank in ranks) or not _SQUARE_CHARS.issuperset(squares):
+        raise ValueError('FEN inválida: ' + text)
+    if squares.count('K') != 1 or squares.count('k') != 1:
+        raise ValueError('FEN sem um rei de cada cor: ' + text)
+    if 'P' in squares[:8] + squares[56:] or 'p' in squares[:8] + squares[56:]:
+        raise ValueError('FEN com peão na primeira ou na última fileira: ' + text)
+    return squares, fields[1] == 'w'
+
+
+def packSquares(squares, whiteToMove):
+    # o mesmo resultado de pack a partir das saídas de parseFEN: os caracteres de todas as posições
+    # viram um só array N x 64 e cada bitboard sai de packbits, sem laço por posição
+    codes = np.frombuffer(''.join(squares).encode('ascii'), dtype=np.uint8).reshape(-1, 64)
+    index = _CHAR_INDEX[codes]  # N x 64, 12 nas casas vazias
+    bits = index[:, None, :] == np.arange(12, dtype=np.uint8)[None, :, None]  # N x 12 x 64
+    packed = np.packbits(bits, axis=-1, bitorder='little')  # N x 12 x 8 bytes, casa 0 no bit 0
+    bitboards = packed.view('<u8').reshape(-1, 12).astype(np.uint64)
+    return bitboards, np.array(whiteToMove, dtype=bool).reshape(-1)
+
+
+def packFEN(fens):
+    # pack direto de textos FEN/EPD
+    parsed = [parseFEN(fen) for fen in fens]
+    return packSquares([squares for squares, _ in parsed], [side for _, side in parsed])
+
+
+def planes(bitboards):
+    # N x K x 64 uint8 (1 onde há a peça) a partir de N x K bitboards; o bit 0 é a casa 0 (a8).
+    # Não é usado na avaliação: é o formato de entrada para quem treina redes com as posições
+    bits = np.unpackbits(np.ascontiguousarray(bitboards, dtype='<u8').view(np.uint8), axis=-1, bitorder='little')
+    return bits.reshape(bitboards.shape[0], -1, 64)
+
+
+def popCount(bb):  # número de bits ligados de cada elemento
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bb).astype(np.int32)
+    bits = np.unpackbits(np.ascontiguousarray(bb, dtype='<u8').view(np.uint8).reshape(bb.shape + (8,)), axis=-1)
+    return bits.sum(axis=-1, dtype=np.int32)
+
+
+def _shift(bb, amount, mask):
+    if amount > 0:
+        return (bb << np.uint64(amount)) & mask
+    return (bb >> np.uint64(-amount)) & mask
+
+
+# ---- termos ----
+
+def _slidingAttacks(sliders, empty, shifts):
+    # preenchimento de Kogge-Stone: em três passos cada direção anda até a primeira peça, inclusive
+    attacks = np.zeros_like(sliders)
+    for amount, mask in shifts:
+        mask = np.uint64(mask)
+        generated = sliders
+        propagate = empty & mask
+        generated = generated | (propagate & _shift(generated, amount, FULL))
+        propagate = propagate & _shift(propagate, amount, FULL)
+        generated = generated | (propagate & _shift(generated, 2 * amount, FULL))
+        propagate = propagate & _shift(propagate, 2 * amount, FULL)
+        generated = generated | (propagate & _shift(generated, 4 * amount, FULL))
+        attacks |= _shift(generated, amount, mask)
+    return attacks
+
+
+def _knightAttacks(knights):
+    attacks = np.zeros_like(knights)
+    for amount, mask in KNIGHT_SHIFTS:
+        attacks |= _shift(knights, amount, np.uint64(mask))
+    return attacks
+
+
+def _byteTable():
+    # 96 x 256: para cada peça e cada byte do bitboard (8 casas), a soma das casas de cada valor do
+    # byte. Com isso o material é uma consulta por byte em vez de desempacotar os 768 bits
+    squares = _squareTable()
+    table = []
+    for piece in range(12):
+        for byte in range(8):
+            scores = squares[piece][byte * 8:byte * 8 + 8]
+            table.append([sum(scores[bit] for bit in range(8) if value >> bit & 1) for value in range(256)])
+    return np.array(table, dtype=np.int32)
+
+
+_BYTE_TABLE = None
+
+
+def _material(bitboards):
+    global _BYTE_TABLE
+    if _BYTE_TABLE is None:
+        _BYTE_TABLE = _byteTable()
+    values = np.ascontiguousarray(bitboards, dtype='<u8').view(np.uint8)  # N x 96
+    return _BYTE_TABLE[np.arange(96), values].sum(axis=1, dtype=np.int32)
+
+
+def _mobility(bitboards):
+    occupied = np.bitwise_or.reduce(bitboards, axis=1)
+    empty = ~occupied
+    score = np.zeros(bitboards.shape[0], dtype=np.int32)
+    for colour, sign in (('w', 1), ('b', -1)):
+        base = 0 if colour == 'w' else 6
+        own = np.bitwise_or.reduce(bitboards[:, base:base + 6], axis=1)
+        notOwn = ~own
+        knights, bishops, rooks, queens = (bitboards[:, base + _PIECE_INDEX['w' + kind]] for kind in 'NBRQ')
+        attacks = {'N': _knightAttacks(knights),
+                   'B': _slidingAttacks(bishops, empty, BISHOP_SHIFTS),
+                   'R': _slidingAttacks(rooks, empty, ROOK_SHIFTS),
+                   'Q': _slidingAttacks(queens, empty, BISHOP_SHIFTS) | _slidingAttacks(queens, empty, ROOK_SHIFTS)}
+        for kind, weight in MOBILITY_WEIGHT.items():
+            score += sign * weight * popCount(attacks[kind] & notOwn)
+    return score
+
+
+def _fill(bb, amount):  # bb espalhado por toda a coluna na direção do deslocamento (8 ou -8)
+    for step in (1, 2, 4):
+        bb = bb | _shift(bb, amount * step, FULL)
+    return bb
+
+
+def _pawnScore(pawns, enemy, forward):
+    # peões de um lado (que andam no sentido forward, -8 para as brancas) contra os peões inimigos
+    files = np.stack([popCount(pawns & np.uint64(FILE_A << c)) for c in range(8)], axis=1)  # N x 8
+    doubled = np.maximum(files - 1, 0).sum(axis=1)
+    present = files > 0
+    neighbours = np.zeros_like(present)
+    neighbours[:, 1:] |= present[:, :-1]
+    neighbours[:, :-1] |= present[:, 1:]
+    isolated = (files * ~neighbours).sum(axis=1)
+    # casas à frente de cada peão inimigo, do ponto de vista dele, e nas colunas vizinhas: o peão é
+    # passado se não está em nenhuma delas
+    front = _fill(_shift(enemy, -forward, FULL), -forward)
+    front |= _shift(front, 1, np.uint64(~FILE_A & FULL)) | _shift(front, -1, np.uint64(~FILE_H & FULL))
+    passed = pawns & ~front
+    bonus = np.zeros(pawns.shape[0], dtype=np.int32)
+    for r in range(8):
+        row = r if forward < 0 else 7 - r  # linha do ponto de vista das brancas
+        if PASSED_PAWN[row]:
+            bonus += PASSED_PAWN[row] * popCount(passed & np.uint64(0xFF << (8 * r)))
+    return DOUBLED_PAWN * doubled + ISOLATED_PAWN * isolated + bonus
+
+
+def _pawns(bitboards):
+    white = bitboards[:, _PIECE_INDEX['wP']]
+    black = bitboards[:, _PIECE_INDEX['bP']]
+    return _pawnScore(white, black, -8) - _pawnScore(black, white, 8)
+
+
+_TERM_FUNCTIONS = {'material': _material, 'mobility': _mobility, 'pawns': _pawns}
+
+
+def evaluateBatch(bitboards, whiteToMove, terms=TERMS):
+    # int32 N: avaliação de cada posição do ponto de vista de quem joga (como ChessAI.evaluate).
+    # Só com 'material' o resultado é exatamente o de ChessAI.evaluate
+    score = np.zeros(bitboards.shape[0], dtype=np.int32)
+    for term in terms:
+        score += _TERM_FUNCTIONS[term](bitboards).astype(np.int32)
+    return np.where(whiteToMove, score, -score)
+
+
+def evaluateStates(states, terms=TERMS):
+    # lista de avaliações de GameStates; sem NumPy cai na avaliação posição a posição
+    states = list(states)
+    if np is None:
+        return [evaluateReference(gs, terms) for gs in states]
+    if not states:
+        return []
+    return evaluateBatch(*pack(states), terms).tolist()
+
+
+# ---- referência em Python puro ----
+
+def evaluateReference(gs, terms=TERMS):
+    # os mesmos termos de evaluateBatch, um GameState por vez com os bitboards do ChessBitboard
+    position = _position(gs)
+    pieces = position.pieces
+    score = 0
+    if 'material' in terms:
+        score += ChessAI.evaluate(gs) * (1 if gs.whiteToMove else -1)
+    if 'mobility' in terms:
+        for colour, sign in (('w', 1), ('b', -1)):
+            notOwn = ~position.colours[colour] & FULL
+            attacks = dict.fromkeys(MOBILITY_WEIGHT, 0)
+            for sq in ChessBitboard.iterBits(pieces[colour + 'N']):
+                attacks['N'] |= ChessBitboard.KNIGHT_ATTACKS[sq]
+            for sq in ChessBitboard.iterBits(pieces[colour + 'B']):
+                attacks['B'] |= ChessBitboard.bishopAttacks(sq, position.occupied)
+            for sq in ChessBitboard.iterBits(pieces[colour + 'R']):
+                attacks['R'] |= ChessBitboard.rookAttacks(sq, position.occupied)
+            for sq in ChessBitboard.iterBits(pieces[colour + 'Q']):
+                attacks['Q'] |= ChessBitboard.queenAttacks(sq, position.occupied)
+            for kind, weight in MOBILITY_WEIGHT.items():
+                score += sign * weight * ChessBitboard.popCount(attacks[kind] & notOwn)
+    if 'pawns' in terms:
+        score += _pawnReference(pieces['wP'], pieces['bP'], 'w') - _pawnReference(pieces['bP'], pieces['wP'], 'b')
+    return score if gs.whiteToMove else -score
+
+
+def _pawnReference(pawns, enemy, colour):
+    squares = [ChessBitboard.rowCol(sq) for sq in ChessBitboard.iterBits(pawns)]
+    enemySquares = [ChessBitboard.rowCol(sq) for sq in ChessBitboard.iterBits(enemy)]
+    files = [0] * 8
+    for r, c in squares:
+        files[c] += 1
+    score = 0
+    for c in range(8):
+        if files[c]:
+            score += DOUBLED_PAWN * (files[c] - 1)
+            if not (c > 0 and files[c - 1]) and not (c < 7 and files[c + 1]):
+                score += ISOLATED_PAWN * files[c]
+    for r, c in squares:
+        if colour == 'w':
+            blocked = any(er < r and abs(ec - c) <= 1 for er, ec in enemySquares)
+        else:
+            blocked = any(er > r and abs(ec - c) <= 1 for er, ec in enemySquares)
+        if not blocked:
+            score += PASSED_PAWN[r if colour == 'w' else 7 - r]
+    return score
+
+
+# ---- linha de comando ----
+
+def _readPositions(records):
+    # (número, texto, parseFEN do texto, erro): só a colocação das peças e a vez são lidas, sem
+    # GameState por linha; None nas linhas inválidas
+    for number, text in records:
+        try:
+            yield number, text, parseFEN(text), None
+        except ValueError as error:
+            yield number, text, None, str(error)
+
+
+def _reference(text, terms):  # evaluateReference de uma linha (--check e sem NumPy)
+    gs = ChessEngine.GameState(moveCacheSize=0)
+    ChessPipeline.loadLine(gs, text)
+    return evaluateReference(gs, terms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Avalia em lote posições FEN/EPD, uma por linha')
+    parser.add_argument('input', help="arquivo com uma posição por linha ('-' para a entrada padrão, .gz aceito)")
+    parser.add_argument('-o', '--output', default='-')
+    parser.add_argument('--terms', default=','.join(TERMS), help='termos separados por vírgula: %s' % ','.join(TERMS))
+    parser.add_argument('--chunk', type=int, default=10000, help='posições avaliadas por lote')
+    parser.add_argument('--check', action='store_true', help='confere cada valor com evaluateReference')
+    args = parser.parse_args(argv)
+
+    terms = tuple(term for term in args.terms.split(',') if term)
+    unknown = [term for term in terms if term not in TERMS]
+    if unknown:
+        parser.error('termos desconhecidos: %s' % ','.join(unknown))
+    if np is None:
+        print('NumPy não instalado: avaliando posição por posição', file=sys.stderr)
+
+    count = mismatches = 0
+    source = ChessPipeline.openText(args.input)
+    out = ChessPipeline.openText(args.output, 'w')
+    try:
+        for batch in ChessPipeline.chunks(_readPositions(ChessPipeline.readLines(source)), args.chunk):
+            valid = [parsed for _, _, parsed, _ in batch if parsed is not None]
+            if np is not None and valid:
+                scores = iter(evaluateBatch(*packSquares(*zip(*valid)), terms).tolist())
+            for number, text, parsed, error in batch:
+                if parsed is not None and np is None:
+                    try:
+                        score = _reference(text, terms)
+                    except (ValueError, KeyError, IndexError) as exception:
+                        parsed, error = None, str(exception)
+                elif parsed is not None:
+                    score = next(scores)
+                if parsed is None:
+                    out.write('# linha %d: %s\n' % (number, error))
+                    continue
+                if args.check:
+                    try:
+                        expected = _reference(text, terms)
+                    except (ValueError, KeyError, IndexError) as exception:
+                        expected = exception
+                    if score != expected:
+                        mismatches += 1
+                        print('linha %d: %d != %s' % (number, score, expected), file=sys.stderr)
+                # a própria linha de entrada, sem passar a posição de volta para FEN
+                out.write('%s\t%d\n' % (text, score))
+                count += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    if args.check:
+        print('%d posições, %d diferenças' % (count, mismatches), file=sys.stderr)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
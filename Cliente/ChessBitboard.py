@@ -0,0 +1,513 @@
+''' Representação da posição em bitboards: um inteiro de 64 bits para cada peça/cor,
+máscaras de ocupação e iteração por varredura de bits (bit-scan).
+A casa de índice 0 é a8 (linha 0, coluna 0) e a casa 63 é h1, seguindo a mesma
+orientação do tabuleiro em lista de listas usado pelo GameState '''
+
+PIECES = ("wP", "wR", "wN", "wB", "wQ", "wK",
+          "bP", "bR", "bN", "bB", "bQ", "bK")
+EMPTY = '--'
+FULL = 0xFFFFFFFFFFFFFFFF
+
+
+def square(r, c):  # linha e coluna para o índice da casa
+    return r * 8 + c
+
+
+def rowCol(sq):  # índice da casa para linha e coluna
+    return sq >> 3, sq & 7
+
+
+# tuplas (linha, coluna) já prontas para cada casa, evitando recriá-las na geração de movimentos
+CELLS = [(sq >> 3, sq & 7) for sq in range(64)]
+
+
+def iterBits(bb):  # percorre os índices dos bits ligados, do menor para o maior
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def lsb(bb):  # índice do bit menos significativo
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb):  # índice do bit mais significativo
+    return bb.bit_length() - 1
+
+
+def popCount(bb):
+    return bin(bb).count('1')
+
+
+def _leaperAttacks(offsets):
+    table = []
+    for sq in range(64):
+        r, c = rowCol(sq)
+        attacks = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                attacks |= 1 << square(r + dr, c + dc)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _leaperAttacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                                 (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _leaperAttacks(((-1, -1), (1, -1), (1, 1), (-1, 1),
+                               (-1, 0), (0, -1), (1, 0), (0, 1)))
+# casas atacadas por um peão da cor indicada (o branco anda para linhas menores)
+PAWN_ATTACKS = {'w': _leaperAttacks(((-1, -1), (-1, 1))),
+                'b': _leaperAttacks(((1, -1), (1, 1)))}
+
+# direções dos raios: as quatro primeiras são da torre e as quatro últimas do bispo
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (1, -1), (1, 1), (-1, 1))
+
+
+def _rays(direction):
+    dr, dc = direction
+    table = []
+    for sq in range(64):
+        r, c = rowCol(sq)
+        ray = 0
+        r, c = r + dr, c + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            ray |= 1 << square(r, c)
+            r, c = r + dr, c + dc
+        table.append(ray)
+    return table
+
+
+# para cada direção: (raios, True se a direção aumenta o índice da casa)
+ROOK_RAYS = [(_rays(d), d[0] * 8 + d[1] > 0) for d in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(_rays(d), d[0] * 8 + d[1] > 0) for d in BISHOP_DIRECTIONS]
+
+
+def _slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            # corta o raio depois da primeira peça encontrada no caminho
+            ray ^= table[lsb(blockers) if positive else msb(blockers)]
+        attacks |= ray
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, ROOK_RAYS)
+
+
+def bishopAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+def queenAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, ROOK_RAYS) | _slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+def _between():
+    # BETWEEN[a][b]: casas estritamente entre a e b quando estão na mesma linha, coluna ou diagonal
+    table = [[0] * 64 for _ in range(64)]
+    for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+        for sq in range(64):
+            r, c = rowCol(sq)
+            path = 0
+            r, c = r + dr, c + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                table[sq][square(r, c)] = path
+                path |= 1 << square(r, c)
+                r, c = r + dr, c + dc
+    return table
+
+
+BETWEEN = _between()
+
+
+RANK_8 = 0xFF
+RANK_1 = RANK_8 << 56
+RANK_7 = RANK_8 << 8   # linha 1 (casa inicial dos peões pretos)
+RANK_2 = RANK_8 << 48  # linha 6 (casa inicial dos peões brancos)
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+
+
+class BitboardPosition():
+    def __init__(self):
+        # um bitboard por peça, a ocupação por cor e total
+        self.pieces = dict.fromkeys(PIECES, 0)
+        self.colours = {'w': 0, 'b': 0}
+        self.occupied = 0
+        # espelho casa -> peça para descobrir rapidamente o que está numa casa
+        self.squares = [EMPTY] * 64
+
+    @classmethod
+    def fromBoard(cls, board):  # converte a lista 8x8 de strings em bitboards
+        position = cls()
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] != EMPTY:
+                    position.setSquare(square(r, c), board[r][c])
+        return position
+
+    def copy(self):
+        position = BitboardPosition()
+        position.pieces = dict(self.pieces)
+        position.colours = dict(self.colours)
+        position.occupied = self.occupied
+        position.squares = self.squares[:]
+        return position
+
+    def toBoard(self):  # converte de volta para a lista 8x8 usada pela interface e pelo socket
+        return [self.squares[r * 8:r * 8 + 8] for r in range(8)]
+
+    def pieceAt(self, sq):
+        return self.squares[sq]
+
+    def setSquare(self, sq, piece):  # coloca a peça na casa, removendo o que estiver lá
+        old = self.squares[sq]
+        if old == piece:
+            return
+        mask = 1 << sq
+        if old != EMPTY:
+            self.pieces[old] ^= mask
+            self.colours[old[0]] ^= mask
+            self.occupied ^= mask
+        if piece != EMPTY:
+            self.pieces[piece] |= mask
+            self.colours[piece[0]] |= mask
+            self.occupied |= mask
+        self.squares[sq] = piece
+
+    def updateSquares(self, board, cells):  # sincroniza as casas (r, c) alteradas na lista
+        for r, c in cells:
+            self.setSquare(r * 8 + c, board[r][c])
+
+    def generateMoves(self, whiteToMove, enpassantPossible=()):
+        # movimentos pseudo-legais (sem roque), no mesmo formato de getAllPossibleMoves:
+        # lista de (casaInicial, casaFinal, isEnpassantMove)
+        colour, opp = ('w', 'b') if whiteToMove else ('b', 'w')
+        own = self.colours[colour]
+        enemy = self.colours[opp]
+        empty = ~self.occupied & FULL
+        pieces = self.pieces
+        moves = []
+        append = moves.append
+
+        epMask = 1 << square(*enpassantPossible) if enpassantPossible else 0
+
+        # peões: avanço de uma casa, duas casas a partir da linha inicial e capturas
+        if whiteToMove:
+            pawns = pieces['wP']
+            single = (pawns >> 8) & empty
+            double = ((single & (RANK_2 >> 8)) >> 8) & empty
+            for to in iterBits(single):
+                append((to + 8, to, False))
+            for to in iterBits(double):
+                append((to + 16, to, False))
+        else:
+            pawns = pieces['bP']
+            single = (pawns << 8) & empty
+            double = ((single & (RANK_7 << 8)) << 8) & empty
+            for to in iterBits(single):
+                append((to - 8, to, False))
+            for to in iterBits(double):
+                append((to - 16, to, False))
+        pawnAttacks = PAWN_ATTACKS[colour]
+        for frm in iterBits(pawns):
+            attacks = pawnAttacks[frm]
+            for to in iterBits(attacks & enemy):
+                append((frm, to, False))
+            if attacks & epMask:
+                append((frm, lsb(epMask), True))
+
+        notOwn = ~own & FULL
+        occupied = self.occupied
+        for frm in iterBits(pieces[colour + 'N']):
+            targets = KNIGHT_ATTACKS[frm] & notOwn
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False))
+                targets ^= low
+        for frm in iterBits(pieces[colour + 'B'] | pieces[colour + 'Q']):
+            targets = _slidingAttacks(frm, occupied, BISHOP_RAYS) & notOwn
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False))
+                targets ^= low
+        for frm in iterBits(pieces[colour + 'R'] | pieces[colour + 'Q']):
+            targets = _slidingAttacks(frm, occupied, ROOK_RAYS) & notOwn
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False))
+                targets ^= low
+        for frm in iterBits(pieces[colour + 'K']):
+            targets = KING_ATTACKS[frm] & notOwn
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False))
+                targets ^= low
+        return moves
+
+    def attackersTo(self, sq, byColour, occupied=None):
+        # peças da cor byColour que atacam a casa sq (para o xeque, com a ocupação indicada)
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces
+        defender = 'b' if byColour == 'w' else 'w'
+        return ((KNIGHT_ATTACKS[sq] & pieces[byColour + 'N'])
+                | (KING_ATTACKS[sq] & pieces[byColour + 'K'])
+                | (PAWN_ATTACKS[defender][sq] & pieces[byColour + 'P'])
+                | (_slidingAttacks(sq, occupied, BISHOP_RAYS) & (pieces[byColour + 'B'] | pieces[byColour + 'Q']))
+                | (_slidingAttacks(sq, occupied, ROOK_RAYS) & (pieces[byColour + 'R'] | pieces[byColour + 'Q'])))
+
+    def attackedSquares(self, byColour, occupied):
+        # todas as casas atacadas pela cor, separando os ataques dos peões
+        pieces = self.pieces
+        attacks = 0
+        for sq in iterBits(pieces[byColour + 'N']):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in iterBits(pieces[byColour + 'B'] | pieces[byColour + 'Q']):
+            attacks |= _slidingAttacks(sq, occupied, BISHOP_RAYS)
+        for sq in iterBits(pieces[byColour + 'R'] | pieces[byColour + 'Q']):
+            attacks |= _slidingAttacks(sq, occupied, ROOK_RAYS)
+        for sq in iterBits(pieces[byColour + 'K']):
+            attacks |= KING_ATTACKS[sq]
+        pawns = pieces[byColour + 'P']
+        if byColour == 'w':
+            pawnAttacks = ((pawns >> 9) & ~FILE_H) | ((pawns >> 7) & ~FILE_A)
+        else:
+            pawnAttacks = ((pawns << 7) & ~FILE_H & FULL) | ((pawns << 9) & ~FILE_A & FULL)
+        return attacks, pawnAttacks
+
+    def pawnPushTargets(self, byColour):
+        # casas vazias onde um peão da cor pode chegar avançando (uma ou duas casas)
+        empty = ~self.occupied & FULL
+        if byColour == 'w':
+            single = (self.pieces['wP'] >> 8) & empty
+            return single | (((single & (RANK_2 >> 8)) >> 8) & empty)
+        single = (self.pieces['bP'] << 8) & empty
+        return single | (((single & (RANK_7 << 8)) << 8) & empty)
+
+    def squareUnderAttack(self, sq, byColour, enpassantPossible=()):
+        # consulta reversa equivalente ao squareUnderAttack original do GameState: a casa conta se
+        # algum movimento pseudo-legal da cor byColour termina nela. Por isso numa casa vazia vale o
+        # avanço do peão e não a captura diagonal (a não ser na casa do en passant)
+        mask = 1 << sq
+        if self.colours[byColour] & mask:
+            return False
+        pieces = self.pieces
+        if (KNIGHT_ATTACKS[sq] & pieces[byColour + 'N']) or (KING_ATTACKS[sq] & pieces[byColour + 'K']):
+            return True
+        occupied = self.occupied
+        if _slidingAttacks(sq, occupied, BISHOP_RAYS) & (pieces[byColour + 'B'] | pieces[byColour + 'Q']):
+            return True
+        if _slidingAttacks(sq, occupied, ROOK_RAYS) & (pieces[byColour + 'R'] | pieces[byColour + 'Q']):
+            return True
+        pawns = pieces[byColour + 'P']
+        if not pawns:
+            return False
+        defender = 'b' if byColour == 'w' else 'w'
+        if occupied & mask or (enpassantPossible and sq == square(*enpassantPossible)):
+            if PAWN_ATTACKS[defender][sq] & pawns:
+                return True
+        if not occupied & mask:
+            step = 8 if byColour == 'w' else -8  # o peão vem da casa sq + step
+            one = sq + step
+            if 0 <= one < 64:
+                if pawns & (1 << one):
+                    return True
+                two = one + step
+                startRank = RANK_2 if byColour == 'w' else RANK_7
+                if 0 <= two < 64 and not occupied & (1 << one) and pawns & startRank & (1 << two):
+                    return True
+        return False
+
+    def generateLegalMoves(self, whiteToMove, enpassantPossible=(), kingside=False, queenside=False):
+        # movimentos legais calculando xeques e cravadas uma única vez por posição,
+        # lista de (casaInicial, casaFinal, isEnpassantMove, isCastleMove).
+        # Retorna None se não houver rei da cor que joga
+        colour, opp = ('w', 'b') if whiteToMove else ('b', 'w')
+        pieces = self.pieces
+        kings = pieces[colour + 'K']
+        if not kings:
+            return None
+        king = lsb(kings)
+        own = self.colours[colour]
+        enemy = self.colours[opp]
+        occupied = self.occupied
+        notOwn = ~own & FULL
+        moves = []
+        append = moves.append
+
+        checkers = self.attackersTo(king, opp)
+        # ataques do adversário sem o rei no tabuleiro, para o rei não fugir na linha do xeque
+        attacks, pawnAttacks = self.attackedSquares(opp, occupied ^ kings)
+        targets = KING_ATTACKS[king] & notOwn & ~(attacks | pawnAttacks)
+        while targets:
+            low = targets & -targets
+            append((king, low.bit_length() - 1, False, False))
+            targets ^= low
+
+        if checkers & (checkers - 1):  # xeque duplo: só o rei pode se mover
+            return moves
+
+        # com um xeque, as outras peças só podem capturar a peça que dá xeque ou bloquear
+        if checkers:
+            checker = lsb(checkers)
+            checkMask = checkers | BETWEEN[king][checker]
+        else:
+            checkMask = FULL
+
+        # peças cravadas: só podem andar na linha entre o rei e a peça que crava
+        pinned = {}
+        snipers = ((_slidingAttacks(king, 0, ROOK_RAYS) & (pieces[opp + 'R'] | pieces[opp + 'Q']))
+                   | (_slidingAttacks(king, 0, BISHOP_RAYS) & (pieces[opp + 'B'] | pieces[opp + 'Q'])))
+        for sniper in iterBits(snipers):
+            blockers = BETWEEN[king][sniper] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned[lsb(blockers)] = BETWEEN[king][sniper] | (1 << sniper)
+
+        allowed = notOwn & checkMask
+        occupied = self.occupied
+        for frm in iterBits(pieces[colour + 'N']):
+            if frm in pinned:  # um cavalo cravado nunca consegue se mover
+                continue
+            targets = KNIGHT_ATTACKS[frm] & allowed
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False, False))
+                targets ^= low
+        for frm in iterBits(pieces[colour + 'B'] | pieces[colour + 'Q']):
+            targets = _slidingAttacks(frm, occupied, BISHOP_RAYS) & allowed & pinned.get(frm, FULL)
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False, False))
+                targets ^= low
+        for frm in iterBits(pieces[colour + 'R'] | pieces[colour + 'Q']):
+            targets = _slidingAttacks(frm, occupied, ROOK_RAYS) & allowed & pinned.get(frm, FULL)
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False, False))
+                targets ^= low
+
+        # peões
+        empty = ~occupied & FULL
+        pawns = pieces[colour + 'P']
+        pawnCaptures = PAWN_ATTACKS[colour]
+        step, startRank = (-8, RANK_2) if whiteToMove else (8, RANK_7)
+        for frm in iterBits(pawns):
+            frmMask = pinned.get(frm, FULL) & checkMask
+            one = frm + step
+            if (1 << one) & empty:
+                if (1 << one) & frmMask:
+                    append((frm, one, False, False))
+                two = one + step
+                if (1 << frm) & startRank and (1 << two) & empty & frmMask:
+                    append((frm, two, False, False))
+            targets = pawnCaptures[frm] & enemy & frmMask
+            while targets:
+                low = targets & -targets
+                append((frm, low.bit_length() - 1, False, False))
+                targets ^= low
+
+        # en passant: simula a jogada para pegar xeques descobertos (inclusive na horizontal)
+        if enpassantPossible:
+            ep = enpassantPossible[0] * 8 + enpassantPossible[1]
+            captured = ep - step
+            for frm in iterBits(PAWN_ATTACKS[opp][ep] & pawns):
+                after = (self.occupied ^ (1 << frm) ^ (1 << captured)) | (1 << ep)
+                oppPawns = pieces[opp + 'P'] & ~(1 << captured)
+                if not ((KNIGHT_ATTACKS[king] & pieces[opp + 'N'])
+                        | (PAWN_ATTACKS[colour][king] & oppPawns)
+                        | (_slidingAttacks(king, after, BISHOP_RAYS) & (pieces[opp + 'B'] | pieces[opp + 'Q']))
+                        | (_slidingAttacks(king, after, ROOK_RAYS) & (pieces[opp + 'R'] | pieces[opp + 'Q']))):
+                    append((frm, ep, True, False))
+
+        # roque: as casas de passagem seguem a regra de squareUnderAttack, em que conta
+        # tudo o que o adversário consegue alcançar (inclusive o avanço de peões), mas não a
+        # captura diagonal de um peão numa casa vazia
+        if not checkers and (kingside or queenside):
+            passing = attacks | self.pawnPushTargets(opp)
+            landing = passing | pawnAttacks
+            r, c = rowCol(king)
+            if kingside and c + 2 <= 7:
+                if not (3 << (king + 1)) & occupied and not (1 << (king + 1)) & passing \
+                        and not (1 << (king + 2)) & landing:
+                    append((king, king + 2, False, True))
+            if queenside and c - 3 >= 0:
+                if not (7 << (king - 3)) & occupied and not (1 << (king - 1)) & passing \
+                        and not (1 << (king - 2)) & landing:
+                    append((king, king - 2, False, True))
+        return moves
+
+
+class AttackMap():
+    # casas atacadas por cada peça, atualizadas de forma incremental: a cada movimento só são
+    # recalculadas as peças das casas alteradas e as peças deslizantes cujo raio passa por elas
+    def __init__(self, position):
+        self.position = position
+        self.attacksFrom = [0] * 64
+        self.history = []  # só dos movimentos feitos depois que o mapa foi criado
+        self.rebuild()
+
+    def rebuild(self):  # recalcula todas as casas a partir da posição atual
+        for sq in range(64):
+            self.attacksFrom[sq] = self.pieceAttacks(sq)
+
+    def pieceAttacks(self, sq):
+        piece = self.position.squares[sq]
+        if piece == EMPTY:
+            return 0
+        kind = piece[1]
+        if kind == 'P':
+            return PAWN_ATTACKS[piece[0]][sq]
+        if kind == 'N':
+            return KNIGHT_ATTACKS[sq]
+        if kind == 'K':
+            return KING_ATTACKS[sq]
+        occupied = self.position.occupied
+        if kind == 'B':
+            return _slidingAttacks(sq, occupied, BISHOP_RAYS)
+        if kind == 'R':
+            return _slidingAttacks(sq, occupied, ROOK_RAYS)
+        return queenAttacks(sq, occupied)
+
+    def update(self, cells):  # chamado depois que a posição já foi alterada
+        changed = 0
+        for r, c in cells:
+            changed |= 1 << (r * 8 + c)
+        pieces = self.position.pieces
+        sliders = (pieces['wB'] | pieces['wR'] | pieces['wQ'] | pieces['bB'] | pieces['bR'] | pieces['bQ'])
+        affected = changed
+        for sq in iterBits(sliders & ~changed):
+            if self.attacksFrom[sq] & changed:
+                affected |= 1 << sq
+        saved = []
+        for sq in iterBits(affected):
+            saved.append((sq, self.attacksFrom[sq]))
+            self.attacksFrom[sq] = self.pieceAttacks(sq)
+        self.history.append(saved)
+
+    def undo(self):  # chamado depois que a posição já foi restaurada
+        if not self.history:
+            # movimento feito antes de o mapa ser ligado: não há o que restaurar, recalcula tudo
+            self.rebuild()
+            return
+        for sq, attacks in self.history.pop():
+            self.attacksFrom[sq] = attacks
+
+    def attacked(self, colour):  # união das casas atacadas pela cor
+        attacks = 0
+        for sq in iterBits(self.position.colours[colour]):
+            attacks |= self.attacksFrom[sq]
+        return attacks
+
+    def isAttacked(self, sq, byColour):
+        mask = 1 << sq
+        for frm in iterBits(self.position.colours[byColour]):
+            if self.attacksFrom[frm] & mask:
+                return True
+        return False
@@ -0,0 +1,306 @@
+''' Livro de aberturas: tabela ordenada de registros de 12 bytes (hash de Zobrist u64, movimento
+u16, peso u16, big-endian) lida com mmap e busca binária. Abrir o livro não lê nada: o arquivo só é
+mapeado na primeira consulta, e cada consulta custa ~log2(registros) leituras de 12 bytes.
+
+O construtor lê partidas em fluxo (do arquivo do servidor ou de PGN), junta os pares (posição,
+movimento) em memória até um limite, grava blocos ordenados em arquivos temporários e no fim
+intercala os blocos somando os pesos, então a memória usada não depende do número de partidas '''
+
+import argparse
+import heapq
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+
+import ChessEngine
+
+RECORD = struct.Struct('>QHH')
+BOOK_PLIES = 12  # lances do começo da partida em que o livro é consultado
+MAX_WEIGHT = 0xFFFF
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+
+# peso de cada ocorrência para quem jogou o lance, pelo resultado da partida
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+
+class OpeningBook():
+    def __init__(self, path=DEFAULT_PATH, maxPlies=BOOK_PLIES):
+        self.path = path
+        self.maxPlies = maxPlies
+        self.data = None  # mmap do arquivo, aberto na primeira consulta
+        self.file = None
+
+    def open(self):
+        if self.data is not None:
+            return
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < RECORD.size:
+            self.data = b''  # sem livro: toda consulta volta vazia
+            return
+        self.file = open(self.path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self.file is not None:
+            self.data.close()
+            self.file.close()
+        self.data = self.file = None
+
+    def __len__(self):
+        self.open()
+        return len(self.data) // RECORD.size
+
+    def probe(self, key):
+        # [(código do movimento, peso)] da posição; busca binária pelo primeiro registro com a chave
+        self.open()
+        data = self.data
+        lo, hi = 0, len(data) // RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(data, mid * RECORD.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        for offset in range(lo * RECORD.size, len(data), RECORD.size):
+            recordKey, code, weight = RECORD.unpack_from(data, offset)
+            if recordKey != key:
+                break
+            entries.append((code, weight))
+        return entries
+
+    def choose(self, gs, rng=None, best=False):
+        # um movimento do livro para a posição de gs, sorteado pelo peso (ou o de maior peso).
+        # Só valem códigos que são movimentos legais da posição: uma colisão de hash ou um arquivo
+        # corrompido nunca vira um lance ilegal. Cada código é conferido sozinho, sem gerar os
+        # movimentos da posição
+        entries = self.probe(gs.zobristKey)
+        candidates = []
+        for code, weight in entries:
+            move = moveFromCode(gs, code) if weight > 0 else None
+            if move is not None and isLegal(gs, move):
+                candidates.append((move, weight))
+        if not candidates:
+            return None
+        if best:
+            return max(candidates, key=lambda c: c[1])[0]
+        rng = rng or random
+        return rng.choices([c[0] for c in candidates], [c[1] for c in candidates])[0]
+
+
+def defaultBook():  # livro ao lado do módulo; não custa nada se o arquivo não existir
+    return OpeningBook(DEFAULT_PATH)
+
+
+def moveFromCode(gs, code):
+    # Move a partir do código de 12 bits (casa inicial << 6 | casa final) sem gerar os movimentos
+    # da posição: as flags de roque e en passant saem da peça e das casas. None se a casa inicial não
+    # tem peça de quem joga ou se a final tem peça dele. Não confere a legalidade (ver isLegal)
+    startRow, startCol, endRow, endCol = code >> 9 & 7, code >> 6 & 7, code >> 3 & 7, code & 7
+    colour = 'w' if gs.whiteToMove else 'b'
+    piece = gs.board[startRow][startCol]
+    if piece[0] != colour or gs.board[endRow][endCol][0] == colour:
+        return None
+    isCastle = piece[1] == 'K' and abs(endCol - startCol) == 2
+    isEnpassant = piece[1] == 'P' and startCol != endCol and (endRow, endCol) == gs.enpassantPossible
+    return ChessEngine.Move((startRow, startCol), (endRow, endCol), gs.board, isEnpassant, isCastle)
+
+
+def isLegal(gs, move):
+    # confere um lance de moveFromCode gerando só os movimentos da peça movida (com o roque, se for
+    # o rei) e testando se ele deixa o próprio rei em xeque, como getValidMovesByFiltering
+    r, c = move.startRow, move.startCol
+    moves = []
+    gs.moveFunctions[move.pieceMoved[1]](r, c, moves)
+    if move.pieceMoved[1] == 'K':
+        gs.getCastleMoves(r, c, moves)
+    if move not in moves:
+        return False
+    gs.makeMove(move)
+    gs.whiteToMove = not gs.whiteToMove
+    legal = not gs.inCheck()
+    gs.whiteToMove = not gs.whiteToMove
+    gs.undoMove()
+    return legal
+
+
+def readPGN(lines):
+    # gera (resultado, [lances em SAN], FEN inicial) de cada partida, lendo linha a linha; a FEN é
+    # None sem a tag [FEN]. Comentários entre chaves e variantes entre parênteses podem ocupar
+    # várias linhas; ';' comenta o resto da linha
+    result, tokens, fen, inComment, depth = '*', [], None, False, 0
+    for line in lines:
+        line = line.strip()
+        if line.startswith('[') and not inComment:
+            if tokens:
+                yield result, tokens, fen
+                result, tokens, fen = '*', [], None
+            depth = 0  # variante sem fechar na partida anterior não passa para a próxima
+            if line.startswith('[Result '):
+                result = line.split('"')[1]
+            elif line.startswith('[FEN '):
+                fen = line.split('"')[1]
+            continue
+        for char in '(){};':
+            line = line.replace(char, ' %s ' % char)
+        for token in line.split():
+            if inComment:
+                inComment = token != '}'
+            elif token == ';':
+                break
+            elif token == '{':
+                inComment = True
+            elif token == '(':
+                depth += 1  # variantes ficam de fora
+            elif token == ')':
+                depth = max(depth - 1, 0)
+            elif depth == 0 and not token[0].isdigit() and token[0] not in '$*':
+                tokens.append(token.split('.')[-1])
+            elif depth == 0 and '.' in token and not token.endswith('.'):
+                tokens.append(token.split('.')[-1])  # '1.e4' sem espaço
+    if tokens:
+        yield result, tokens, fen
+
+
+def entriesFromPGN(lines, maxPlies=BOOK_PLIES):
+    # gera (hash, código, peso) dos lances feitos antes do lance maxPlies de cada partida. Partidas
+    # com [FEN] começam da posição dada (e só entram se ela ainda estiver dentro do livro)
+    gs = ChessEngine.GameState(moveCacheSize=0)
+    for result, sans, fen in readPGN(lines):
+        if fen is None:
+            gs.setPosition(ChessEngine.STARTING_BOARD, True)
+        else:
+            try:
+                gs.loadFEN(fen)
+            except ValueError:
+                continue  # FEN inválida: a partida inteira fica de fora
+        points = RESULT_POINTS.get(result, (1, 1))
+        for san in sans:
+            if gs.ply() >= maxPlies:
+                break
+            move = gs.findSAN(san)
+            if move is None:
+                break  # lance ilegal ou promoção que o motor não tem: o resto da partida fica de fora
+            yield gs.zobristKey, move.moveID, points[0 if gs.whiteToMove else 1]
+            gs.makeMove(move)
+
+
+def entriesFromArchive(reader, maxPlies=BOOK_PLIES):
+    # o mesmo a partir do ChessArchive (os lances já foram validados pelo servidor)
+    import ChessArchive
+    gs = ChessEngine.GameState(moveCacheSize=0)
+    for record in reader.games():
+        gs.setPosition(ChessEngine.STARTING_BOARD, True)
+        points = RESULT_POINTS.get(ChessArchive.RESULTS.get(record.result), (1, 1))
+        for ply, code in enumerate(record.moves[:maxPlies]):
+            move = moveFromCode(gs, code)
+            if move is None:
+                break
+            yield gs.zobristKey, code, points[ply % 2]
+            gs.makeMove(move)
+
+
+class BookBuilder():
+    def __init__(self, chunkSize=1 << 20, tempDir=None):
+        self.chunkSize = chunkSize  # pares (posição, movimento) em memória antes de gravar um bloco
+        self.tempDir = tempDir
+        self.weights = {}
+        self.runs = []
+
+    def add(self, key, code, weight):
+        pair = (key, code)
+        self.weights[pair] = self.weights.get(pair, 0) + weight
+        if len(self.weights) >= self.chunkSize:
+            self.spill()
+
+    def addAll(self, entries):
+        for key, code, weight in entries:
+            self.add(key, code, weight)
+
+    def spill(self):  # grava o bloco atual ordenado num arquivo temporário
+        run = tempfile.TemporaryFile(dir=self.tempDir)
+        for (key, code), weight in sorted(self.weights.items()):
+            run.write(_runRecord.pack(key, code, weight))
+        run.seek(0)
+        self.runs.append(run)
+        self.weights = {}
+
+    def write(self, path, minWeight=1):
+        # intercala os blocos somando os pesos do mesmo par e grava o livro; devolve os registros
+        if self.weights or not self.runs:
+            self.spill()
+        count = 0
+        current, total = None, 0
+        with open(path + '.tmp', 'wb') as out:
+            for key, code, weight in heapq.merge(*(_readRun(run) for run in self.runs)):
+                if (key, code) != current:
+                    if current is not None and total >= minWeight:
+                        out.write(RECORD.pack(current[0], current[1], min(total, MAX_WEIGHT)))
+                        count += 1
+                    current, total = (key, code), 0
+                total += weight
+            if current is not None and total >= minWeight:
+                out.write(RECORD.pack(current[0], current[1], min(total, MAX_WEIGHT)))
+                count += 1
+        os.replace(path + '.tmp', path)  # quem estiver lendo o livro antigo não vê um arquivo pela metade
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        return count
+
+
+_runRecord = struct.Struct('>QHI')  # nos blocos o peso ainda não foi limitado a 16 bits
+
+
+def _readRun(run):
+    while True:
+        data = run.read(_runRecord.size * 4096)
+        if not data:
+            return
+        yield from _runRecord.iter_unpack(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Livro de aberturas')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='monta o livro a partir de partidas')
+    build.add_argument('book', nargs='?', default=DEFAULT_PATH)
+    build.add_argument('--archive', action='append', default=[], metavar='PASTA', help='arquivo do servidor')
+    build.add_argument('--pgn', action='append', default=[], metavar='ARQ', help="PGN ('-' para a entrada padrão)")
+    build.add_argument('--plies', type=int, default=BOOK_PLIES)
+    build.add_argument('--min-weight', type=int, default=2)
+    build.add_argument('--chunk', type=int, default=1 << 20, help='pares em memória antes de gravar um bloco')
+    probe = sub.add_parser('probe', help='lances do livro para uma posição')
+    probe.add_argument('book', nargs='?', default=DEFAULT_PATH)
+    probe.add_argument('--fen', default=ChessEngine.STARTING_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == 'probe':
+        gs = ChessEngine.GameState()
+        gs.loadFEN(args.fen)
+        book = OpeningBook(args.book)
+        for code, weight in sorted(book.probe(gs.zobristKey), key=lambda e: -e[1]):
+            move = moveFromCode(gs, code)
+            if move is not None and not isLegal(gs, move):
+                move = None  # '?': código que não é lance válido (colisão ou arquivo ruim)
+            print('%s\t%d' % (gs.getSAN(move) if move is not None else '?', weight))
+        return 0
+
+    import ChessArchive
+    builder = BookBuilder(args.chunk)
+    for path in args.archive:
+        with ChessArchive.ArchiveReader(path) as reader:
+            builder.addAll(entriesFromArchive(reader, args.plies))
+    for path in args.pgn:
+        source = sys.stdin if path == '-' else open(path, errors='replace')
+        with source:
+            builder.addAll(entriesFromPGN(source, args.plies))
+    count = builder.write(args.book, args.min_weight)
+    print('%d registros em %s' % (count, args.book))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,19 +3,44 @@ e também é responsável por determinar os movimentos válidos do jogo '''
 
 import math
 import copy
+import ChessBitboard
+import ChessZobrist
 from socketCliente import clienteSocket
 
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+STARTING_BOARD = [
+    ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+    ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
+    ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
+_startingBitboards = ChessBitboard.BitboardPosition.fromBoard(STARTING_BOARD)
+
 
 class GameState():
-    def __init__(self):
+    def __init__(self, useBitboards=True, moveCacheSize=4096, connect=False, watch=None):
         # A tábua é possui lista de 8x8 e cada casa possui um elemento de dois caractere
         # O primeiro caractere representa a cor da peça "W" para white(Branco) e "B" para Black(Preto)
         # O segundo caractere representa o tipo da peça nas seguinte ordem: Torre, Cavalo, Bispo, Rainha, Rei, Bispo, Cavalo, Torre
         # '--' significa espaço vazio
 
-        self.socket = clienteSocket.socketClient()
+        # o estado da posição fica no GameState; o socket só é criado para jogar em rede (connect=True)
+        # e entrega a posição enviada pelo servidor, aplicada no fim do __init__; com watch (id da
+        # partida) a conexão só assiste
+        self.socket = clienteSocket.socketClient(watch=watch) if connect else None
+        self.board = [row[:] for row in STARTING_BOARD]
+        self.whiteToMove = True
+
+        # espelho da posição em bitboards, mantido junto com a lista 8x8 em makeMove/undoMove
+        self.useBitboards = useBitboards
+        self.bitboards = _startingBitboards.copy()
+        self.attackMap = None
 
         self.moveLog = []
+        self.firstPly = 0
         self.moveFunctions = {'P': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
                               'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
         # usado para identificar checks validos ou invalidos
@@ -27,17 +52,42 @@ class GameState():
 
         self.enpassantPossible = ()  # cordinadas para o quadrado onde o en passant é possivel
 
+        self.enpassantPossibleLog = [self.enpassantPossible]
+
         self.currentCastlingRight = castleRights(True, True, True, True)
         self.castleRightsLog = [castleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
                                              self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
 
+        # hash de Zobrist da posição, atualizado em makeMove/undoMove, e o histórico para repetições
+        self.zobristKey = _startingKey
+        self.zobristLog = []
+        # cache dos movimentos válidos por posição (None desliga)
+        self.moveCache = ChessZobrist.PositionCache(moveCacheSize) if moveCacheSize else None
+        # livro de aberturas (ChessBook.OpeningBook) consultado por getBookMove; None desliga
+        self.book = None
+        # tablebases de finais (ChessTablebase.Tablebase) consultadas pela busca; None desliga
+        self.tablebase = None
+
+        if self.socket is not None and self.socket.snapshot is not None:
+            self.setPosition(*self.socket.takeSnapshot())
+
     def makeMove(self, move):  # Faz os movimentos
+        # tira do hash as casas que vão mudar, o turno, o roque e o en passant atuais
+        cells = self.changedSquares(move)
+        board = self.board
+        key = self.zobristKey
+        self.zobristLog.append(key)
+        for r, c in cells:
+            key ^= ChessZobrist.PIECE_KEYS[board[r][c]][r * 8 + c]
+        key ^= ChessZobrist.SIDE_KEY ^ ChessZobrist.CASTLE_KEYS[ChessZobrist.castleIndex(self.currentCastlingRight)] \
+            ^ ChessZobrist.enpassantKey(self.enpassantPossible)
+
         # movendo a peça
-        self.socket.board[move.endRow][move.endCol] = move.pieceMoved
+        self.board[move.endRow][move.endCol] = move.pieceMoved
         # faz o quadrado começar vazio
-        self.socket.board[move.startRow][move.startCol] = '--'
+        self.board[move.startRow][move.startCol] = '--'
         self.moveLog.append(move)
-        self.socket.whiteToMove = not self.socket.whiteToMove  # mudando os turnos
+        self.whiteToMove = not self.whiteToMove  # mudando os turnos
         # checando se os reis foram movidos para atualizar sua localização
         if move.pieceMoved == 'wK':
             self.whiteKingLocation = (move.endRow, move.endCol)
@@ -46,11 +96,11 @@ class GameState():
 
         # promoção do peao
         if move.isPawnPromotion:
-            self.socket.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
 
         # enpassant
         if move.isEnpassantMove:
-            self.socket.board[move.startRow][move.endCol] = '--'
+            self.board[move.startRow][move.endCol] = '--'
         if move.pieceMoved[1] == 'P' and abs(move.startRow - move.endRow) == 2:
             self.enpassantPossible = (
                 (move.startRow + move.endRow) // 2, move.startCol)
@@ -60,25 +110,38 @@ class GameState():
         if move.isCastleMove:
             # movimento roque (castle) no lado do rei
             if move.endCol - move.startCol == 2:
-                self.socket.board[move.endRow][move.endCol -
-                                               1] = self.socket.board[move.endRow][move.endCol+1]
-                self.socket.board[move.endRow][move.endCol+1] = '--'
+                self.board[move.endRow][move.endCol -
+                                               1] = self.board[move.endRow][move.endCol+1]
+                self.board[move.endRow][move.endCol+1] = '--'
             else:  # movimento roque (castle) no lado da rainha
-                self.socket.board[move.endRow][move.endCol +
-                                               1] = self.socket.board[move.endRow][move.endCol-2]
-                self.socket.board[move.endRow][move.endCol-2] = '--'
+                self.board[move.endRow][move.endCol +
+                                               1] = self.board[move.endRow][move.endCol-2]
+                self.board[move.endRow][move.endCol-2] = '--'
+
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+
+        if self.useBitboards:
+            self.bitboards.updateSquares(board, cells)
+            if self.attackMap is not None:
+                self.attackMap.update(cells)
 
         # atualiza o castling rights - sempre que um rei ou torre for movida
         self.updateCastleRights(move)
         self.castleRightsLog.append(castleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
                                                  self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
 
+        # coloca no hash o novo conteúdo das casas, o roque e o en passant
+        for r, c in cells:
+            key ^= ChessZobrist.PIECE_KEYS[board[r][c]][r * 8 + c]
+        self.zobristKey = key ^ ChessZobrist.CASTLE_KEYS[ChessZobrist.castleIndex(self.currentCastlingRight)] \
+            ^ ChessZobrist.enpassantKey(self.enpassantPossible)
+
     def undoMove(self):  # desfazendo o movimento
         if len(self.moveLog) != 0:  # certificando que tem um movimento para desfazer
             move = self.moveLog.pop()  # voltando a açao
-            self.socket.board[move.startRow][move.startCol] = move.pieceMoved
-            self.socket.board[move.endRow][move.endCol] = move.pieceCaptured
-            self.socket.whiteToMove = not self.socket.whiteToMove   # trocando o turno
+            self.board[move.startRow][move.startCol] = move.pieceMoved
+            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            self.whiteToMove = not self.whiteToMove   # trocando o turno
             # checando se os reis foram movidos para atualizar sua localização
             if move.pieceMoved == 'wK':
                 self.whiteKingLocation = (move.startRow, move.startCol)
@@ -87,27 +150,260 @@ class GameState():
 
             # desfazendo o movimento de enpassant
             if move.isEnpassantMove:
-                self.socket.board[move.endRow][move.endCol] = '--'
-                self.socket.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            # desfaz um avanço de peão de 2 casas
-            if move.pieceMoved[1] == 'P' and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
+                self.board[move.endRow][move.endCol] = '--'
+                self.board[move.startRow][move.endCol] = move.pieceCaptured
+            # volta a casa de en passant que existia antes do movimento
+            self.enpassantPossibleLog.pop()
+            self.enpassantPossible = self.enpassantPossibleLog[-1]
 
             # desfazendo o movimento castle
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2:  # lado do rei
-                    self.socket.board[move.endRow][move.endCol +
-                                                   1] = self.socket.board[move.endRow][move.endCol-1]
-                    self.socket.board[move.endRow][move.endCol-1] = '--'
+                    self.board[move.endRow][move.endCol +
+                                                   1] = self.board[move.endRow][move.endCol-1]
+                    self.board[move.endRow][move.endCol-1] = '--'
                 else:  # lado da rainha
-                    self.socket.board[move.endRow][move.endCol -
-                                                   2] = self.socket.board[move.endRow][move.endCol+1]
-                    self.socket.board[move.endRow][move.endCol+1] = '--'
+                    self.board[move.endRow][move.endCol -
+                                                   2] = self.board[move.endRow][move.endCol+1]
+                    self.board[move.endRow][move.endCol+1] = '--'
+
+            if self.useBitboards:
+                self.bitboards.updateSquares(self.board, self.changedSquares(move))
+                if self.attackMap is not None:
+                    self.attackMap.undo()
 
             # desfazendo castling rights
             self.castleRightsLog.pop()
-            self.currentCastlingRight = self.castleRightsLog[-1]
+            # cópia, para que o próximo updateCastleRights não altere a entrada guardada no log
+            lastRights = self.castleRightsLog[-1]
+            self.currentCastlingRight = castleRights(lastRights.wks, lastRights.bks,
+                                                     lastRights.wqs, lastRights.bqs)
+            self.zobristKey = self.zobristLog.pop()
+
+    # casas alteradas por um movimento (inclui o peão capturado no en passant e a torre do roque)
+    def changedSquares(self, move):
+        cells = [(move.startRow, move.startCol), (move.endRow, move.endCol)]
+        if move.isEnpassantMove:
+            cells.append((move.startRow, move.endCol))
+        elif move.isCastleMove:
+            if move.endCol - move.startCol == 2:
+                cells += [(move.endRow, move.endCol - 1), (move.endRow, move.endCol + 1)]
+            else:
+                cells += [(move.endRow, move.endCol + 1), (move.endRow, move.endCol - 2)]
+        return cells
+
+    # reconstrói os bitboards e o hash caso a posição tenha sido alterada por fora de makeMove/undoMove
+    def syncPosition(self):
+        self.bitboards = ChessBitboard.BitboardPosition.fromBoard(self.board)
+        if self.attackMap is not None:
+            self.enableAttackMap()
+        self.zobristKey = ChessZobrist.computeHash(self.board, self.whiteToMove,
+                                                   self.currentCastlingRight, self.enpassantPossible)
+
+    # carrega uma posição em notação FEN; o contador de meio-lances é ignorado e o número do lance
+    # (se houver) vira o ply() da posição
+    def loadFEN(self, fen):
+        fields = fen.split()
+        if len(fields) < 4 or len(fields) > 6:
+            raise ValueError('FEN inválida: ' + fen)
+        board = []
+        for rank in fields[0].split('/'):
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row += ['--'] * int(ch)
+                elif ch.upper() in 'PRNBQK':
+                    row.append(('w' if ch.isupper() else 'b') + ch.upper())
+                else:
+                    raise ValueError('FEN inválida: ' + fen)
+            if len(row) != 8:
+                raise ValueError('FEN inválida: ' + fen)
+            board.append(row)
+        if len(board) != 8 or fields[1] not in ('w', 'b'):
+            raise ValueError('FEN inválida: ' + fen)
+        pieces = [piece for row in board for piece in row]
+        if pieces.count('wK') != 1 or pieces.count('bK') != 1:
+            raise ValueError('FEN sem um rei de cada cor: ' + fen)
+        if any(piece[1] == 'P' for piece in board[0] + board[7]):
+            raise ValueError('FEN com peão na primeira ou na última fileira: ' + fen)
+
+        rights = fields[2]
+        if rights != '-' and (not rights or any(ch not in 'KQkq' for ch in rights)):
+            raise ValueError('FEN inválida: ' + fen)
+        if fields[3] != '-':
+            if len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or fields[3][1] not in '36':
+                raise ValueError('FEN inválida: ' + fen)
+            enpassant = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        else:
+            enpassant = ()
+        ply = 0
+        if len(fields) == 6:
+            if not fields[5].isdigit():
+                raise ValueError('FEN inválida: ' + fen)
+            ply = max(int(fields[5]) - 1, 0) * 2 + (fields[1] == 'b')
+        # direitos de roque só valem com o rei e a torre nas casas iniciais; os outros são descartados
+        castling = tuple(right in rights and board[row][4] == colour + 'K' and board[row][col] == colour + 'R'
+                         for right, colour, row, col in (('K', 'w', 7, 7), ('k', 'b', 0, 7),
+                                                         ('Q', 'w', 7, 0), ('q', 'b', 0, 0)))
+        self.setPosition(board, fields[1] == 'w', castling, enpassant, ply)
+
+    # carrega uma linha EPD (os quatro primeiros campos da FEN seguidos de operações 'opcode
+    # operandos;') e devolve as operações como {opcode: [operandos]}; 'fmvn' dá o número do lance
+    def loadEPD(self, epd):
+        fields = epd.split(None, 4)
+        if len(fields) < 4:
+            raise ValueError('EPD inválida: ' + epd)
+        operations = parseEPDOperations(fields[4] if len(fields) == 5 else '')
+        fullmove = operations.get('fmvn', ['1'])[0]
+        self.loadFEN(' '.join(fields[:4]) + ' 0 ' + fullmove)
+        return operations
+
+    # posição atual em EPD, com as operações dadas ({opcode: [operandos]}) no fim
+    def getEPD(self, operations=None):
+        epd = ' '.join(self.getFEN().split()[:4])
+        if operations:
+            epd += ' ' + formatEPDOperations(operations)
+        return epd
+
+    # troca a posição inteira (usada pelo FEN e pelo snapshot do servidor); castling é (wks, bks, wqs, bqs)
+    # e ply é o número do lance da posição na partida, que continua contando a partir dele
+    def setPosition(self, board, whiteToMove, castling=(True, True, True, True), enpassantPossible=(), ply=0):
+        self.board = [row[:] for row in board]
+        self.whiteToMove = whiteToMove
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == 'wK':
+                    self.whiteKingLocation = (r, c)
+                elif board[r][c] == 'bK':
+                    self.blackKingLocation = (r, c)
+        self.currentCastlingRight = castleRights(*castling)
+        self.castleRightsLog = [castleRights(*castling)]
+        self.enpassantPossible = tuple(enpassantPossible)
+        self.enpassantPossibleLog = [self.enpassantPossible]
+        self.moveLog = []
+        self.firstPly = ply
+        self.zobristLog = []
+        self.checkMate = False
+        self.stalemate = False
+        self.syncPosition()
+
+    # posição no formato do snapshot do servidor: (tabuleiro, whiteToMove, roques, en passant, lance)
+    def getPosition(self):
+        rights = self.currentCastlingRight
+        return (self.board, self.whiteToMove, (rights.wks, rights.bks, rights.wqs, rights.bqs),
+                self.enpassantPossible, self.ply())
+
+    # número do próximo lance da partida (0 no começo), mesmo depois de um setPosition
+    def ply(self):
+        return self.firstPly + len(self.moveLog)
+
+    # posição atual em FEN (o contador de meio-lances não é controlado pelo motor e sai sempre 0)
+    def getFEN(self):
+        ranks = []
+        for row in self.board:
+            text = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += piece[1] if piece[0] == 'w' else piece[1].lower()
+            if empty:
+                text += str(empty)
+            ranks.append(text)
+        rights = self.currentCastlingRight
+        castling = ''.join(flag for flag, allowed in (('K', rights.wks), ('Q', rights.wqs),
+                                                      ('k', rights.bks), ('q', rights.bqs)) if allowed)
+        if self.enpassantPossible:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        else:
+            enpassant = '-'
+        return '%s %s %s %s 0 %d' % ('/'.join(ranks), 'w' if self.whiteToMove else 'b', castling or '-',
+                                     enpassant, self.ply() // 2 + 1)
+
+    # movimento válido com a notação de getChessNot (por exemplo 'e2e4'), ou None
+    def findMove(self, notation):
+        for move in self.getValidMoves():
+            if move.getChessNot() == notation:
+                return move
+        return None
+
+    # notação algébrica (SAN) de um movimento válido na posição atual, como 'Nbd2', 'exd5', 'O-O'
+    # ou 'e8=Q+'; validMoves evita gerar de novo os movimentos da posição
+    def getSAN(self, move, validMoves=None):
+        if validMoves is None:
+            validMoves = self.getValidMoves()
+        if move.isCastleMove:
+            san = 'O-O' if move.endCol == 6 else 'O-O-O'
+        else:
+            target = move.getRankFile(move.endRow, move.endCol)
+            capture = 'x' if move.pieceCaptured != '--' else ''
+            if move.pieceMoved[1] == 'P':
+                san = (move.colsToFiles[move.startCol] if capture else '') + capture + target
+                if move.isPawnPromotion:
+                    san += '=Q'
+            else:
+                # outra peça igual que também chega na casa: coluna, linha ou as duas
+                rivals = [m for m in validMoves if m.pieceMoved == move.pieceMoved and m.endRow == move.endRow
+                          and m.endCol == move.endCol and m != move]
+                origin = ''
+                if rivals:
+                    if all(m.startCol != move.startCol for m in rivals):
+                        origin = move.colsToFiles[move.startCol]
+                    elif all(m.startRow != move.startRow for m in rivals):
+                        origin = move.rowsToRanks[move.startRow]
+                    else:
+                        origin = move.getRankFile(move.startRow, move.startCol)
+                san = move.pieceMoved[1] + origin + capture + target
+        checkMate, stalemate = self.checkMate, self.stalemate
+        self.makeMove(move)
+        if self.inCheck():
+            san += '+' if self.getValidMoves() else '#'
+        self.undoMove()
+        self.checkMate, self.stalemate = checkMate, stalemate
+        return san
+
+    # movimento válido escrito em SAN ('Nf3', 'exd5', 'O-O', 'e8=Q+'), ou None; como o motor só
+    # promove para rainha, outras promoções não são encontradas
+    def findSAN(self, san):
+        san = san.rstrip('+#!?')
+        if san in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+            col = 6 if len(san) == 3 else 2
+            for move in self.getValidMoves():
+                if move.isCastleMove and move.endCol == col:
+                    return move
+            return None
+        if '=' in san:
+            if san[san.index('=') + 1:] != 'Q':
+                return None
+            san = san[:san.index('=')]
+        piece = san[0] if san[:1] in ('K', 'Q', 'R', 'B', 'N') else 'P'
+        body = (san[1:] if piece != 'P' else san).replace('x', '')
+        if len(body) < 2 or body[-2] not in Move.filesToCols or body[-1] not in Move.ranksToRows:
+            return None
+        endRow, endCol = Move.ranksToRows[body[-1]], Move.filesToCols[body[-2]]
+        origin = body[:-2]  # desambiguação: coluna, linha ou casa de saída
+        for move in self.getValidMoves():
+            if move.pieceMoved[1] != piece or move.endRow != endRow or move.endCol != endCol:
+                continue
+            if any((ch in Move.filesToCols and move.startCol != Move.filesToCols[ch])
+                   or (ch in Move.ranksToRows and move.startRow != Move.ranksToRows[ch]) for ch in origin):
+                continue
+            return move
+        return None
+
+    # lance do livro de aberturas para a posição atual (None fora do livro ou sem livro)
+    def getBookMove(self, rng=None):
+        if self.book is None or self.ply() >= self.book.maxPlies:
+            return None
+        return self.book.choose(self, rng)
+
+    # quantas vezes a posição atual já apareceu no jogo (contando a atual)
+    def repetitionCount(self):
+        return self.zobristLog.count(self.zobristKey) + 1
 
     # atualiza o castle rights (roque) á peça movida
     def updateCastleRights(self, move):
@@ -132,13 +428,65 @@ class GameState():
                     self.currentCastlingRight.bks = False  # torre da direita
 
     def getValidMoves(self):  # todos os movimentos validos (maquina)
+        if self.moveCache is not None:
+            entry = self.moveCache.get(self.zobristKey)
+            if entry is not None:
+                moves, checkMate, stalemate = entry
+                self.checkMate = self.checkMate or checkMate
+                self.stalemate = self.stalemate or stalemate
+                return list(moves)
+        moves = None
+        if self.useBitboards:
+            moves = self.getLegalMoves()
+            if moves is not None:
+                # verifica se não há movimentos válidos (seja: impasse ou xeque-mate)
+                if len(moves) == 0:
+                    if self.inCheck():
+                        self.checkMate = True
+                    else:
+                        self.stalemate = True
+        if moves is None:
+            moves = self.getValidMovesByFiltering()
+        if self.moveCache is not None:
+            inCheck = len(moves) == 0 and self.inCheck()
+            self.moveCache.put(self.zobristKey, (tuple(moves), inCheck, len(moves) == 0 and not inCheck))
+        return moves
+
+    # gera só os movimentos legais, calculando xeques e cravadas uma vez por posição
+    # (None quando não há rei no tabuleiro)
+    def getLegalMoves(self):
+        if self.whiteToMove:
+            kingside, queenside = self.currentCastlingRight.wks, self.currentCastlingRight.wqs
+        else:
+            kingside, queenside = self.currentCastlingRight.bks, self.currentCastlingRight.bqs
+        legal = self.bitboards.generateLegalMoves(self.whiteToMove, self.enpassantPossible,
+                                                  kingside, queenside)
+        if legal is None:
+            return None
+        squares = self.bitboards.squares
+        fromSquares = Move.fromSquares
+        moves = []
+        for start, end, isEnpassant, isCastle in legal:
+            piece = squares[start]
+            if isEnpassant:
+                moves.append(fromSquares(start, end, piece, 'bP' if piece == 'wP' else 'wP', Move.ENPASSANT))
+            elif isCastle:
+                moves.append(fromSquares(start, end, piece, squares[end], Move.CASTLE))
+            elif piece[1] == 'P' and (end < 8 or end >= 56):
+                moves.append(fromSquares(start, end, piece, squares[end], Move.PROMOTION))
+            else:
+                moves.append(fromSquares(start, end, piece, squares[end]))
+        return moves
+
+    # versão original: gera os pseudo-legais e descarta os que deixam o rei em xeque
+    def getValidMovesByFiltering(self):
         tempEnpassantPossible = self.enpassantPossible
         tempCastleRights = castleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
                                         self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
         # pega todos os movimentos
         moves = self.getAllPossibleMoves()
 
-        if self.socket.whiteToMove:
+        if self.whiteToMove:
             self.getCastleMoves(
                 self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
         else:
@@ -149,12 +497,12 @@ class GameState():
         for i in range(len(moves)-1, -1, -1):
             # faz o movimento e troca de turno
             self.makeMove(moves[i])
-            self.socket.whiteToMove = not self.socket.whiteToMove
+            self.whiteToMove = not self.whiteToMove
             if self.inCheck():
                 # vê se o movimento anterior coloca o jogador em xeque
                 moves.remove(moves[i])
             # troca de turno e desfaz o movimento
-            self.socket.whiteToMove = not self.socket.whiteToMove
+            self.whiteToMove = not self.whiteToMove
             self.undoMove()
         # verifica se não há movimentos válidos (seja: impasse ou xeque-mate)
         if len(moves) == 0:
@@ -170,8 +518,12 @@ class GameState():
         return moves
 
     def inCheck(self):
+        if self.attackMap is not None:
+            # com o mapa de ataques a consulta é só olhar quem ataca a casa do rei
+            r, c = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+            return self.attackMap.isAttacked(r * 8 + c, 'b' if self.whiteToMove else 'w')
         # verifica qual o turno
-        if self.socket.whiteToMove:
+        if self.whiteToMove:
             # retorna um booleano e verifica se o rei branco está sob ataque
             return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
         else:
@@ -179,77 +531,125 @@ class GameState():
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
     def squareUnderAttack(self, r, c):
-        # ve os movimentos do oponente mudando o turno, pegando todos os movimentos e mundando o turno novamente
-        self.socket.whiteToMove = not self.socket.whiteToMove
-        oppMoves = self.getAllPossibleMoves()
-        self.socket.whiteToMove = not self.socket.whiteToMove
-        # verifica todos os movimentos e ve se o ultimo quadrado é um quadrado interado na função
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
+        # olha a partir da casa para fora (raios, saltos de cavalo, rei e peões) procurando peças do
+        # oponente que terminem nela, sem montar a lista de movimentos do oponente.
+        # Vale a mesma regra de antes: numa casa vazia conta o avanço do peão, e não a captura diagonal
+        attacker = 'b' if self.whiteToMove else 'w'
+        if self.useBitboards:
+            return self.bitboards.squareUnderAttack(r * 8 + c, attacker, self.enpassantPossible)
+        board = self.board
+        target = board[r][c]
+        if target[0] == attacker:
+            return False
+        for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)):
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8 and board[r + dr][c + dc] == attacker + 'N':
+                return True
+        for dr, dc in ((-1, -1), (1, -1), (1, 1), (-1, 1), (-1, 0), (0, -1), (1, 0), (0, 1)):
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8 and board[r + dr][c + dc] == attacker + 'K':
                 return True
+        for directions, sliders in ((((-1, 0), (0, -1), (1, 0), (0, 1)), ('R', 'Q')),
+                                    (((-1, -1), (1, -1), (1, 1), (-1, 1)), ('B', 'Q'))):
+            for dr, dc in directions:
+                endRow, endCol = r + dr, c + dc
+                while 0 <= endRow < 8 and 0 <= endCol < 8:
+                    piece = board[endRow][endCol]
+                    if piece != '--':
+                        if piece[0] == attacker and piece[1] in sliders:
+                            return True
+                        break
+                    endRow, endCol = endRow + dr, endCol + dc
+        # peões: o branco chega vindo da linha de baixo (r + 1) e o preto da linha de cima (r - 1)
+        pawnRow = r + 1 if attacker == 'w' else r - 1
+        if 0 <= pawnRow < 8:
+            if target != '--' or (r, c) == self.enpassantPossible:
+                for dc in (-1, 1):
+                    if 0 <= c + dc < 8 and board[pawnRow][c + dc] == attacker + 'P':
+                        return True
+            if target == '--':
+                if board[pawnRow][c] == attacker + 'P':
+                    return True
+                startRow = 6 if attacker == 'w' else 1
+                if pawnRow + (pawnRow - r) == startRow and board[pawnRow][c] == '--' \
+                        and board[startRow][c] == attacker + 'P':
+                    return True
         return False
 
+    # mapa de ataques mantido incrementalmente em makeMove/undoMove (opcional)
+    def enableAttackMap(self):
+        self.attackMap = ChessBitboard.AttackMap(self.bitboards)
+
+    def disableAttackMap(self):
+        self.attackMap = None
+
     def getAllPossibleMoves(self):  # todos os movimentos possiveis
+        if self.useBitboards:
+            return self.getBitboardMoves()
         moves = []
-        for r in range(len(self.socket.board)):  # numeros de linhas
+        for r in range(len(self.board)):  # numeros de linhas
             # numeros de coluna da linha
-            for c in range(len(self.socket.board[r])):
-                turn = self.socket.board[r][c][0]
+            for c in range(len(self.board[r])):
+                turn = self.board[r][c][0]
                 # checando a cor da peça
-                if (turn == 'w' and self.socket.whiteToMove) or (turn == 'b' and not self.socket.whiteToMove):
-                    piece = self.socket.board[r][c][1]
+                if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
+                    piece = self.board[r][c][1]
                     self.moveFunctions[piece](r, c, moves)
         return moves
 
+    def getBitboardMoves(self):  # mesmos movimentos de getAllPossibleMoves, gerados pelos bitboards
+        board = self.board
+        cells = ChessBitboard.CELLS
+        return [Move(cells[start], cells[end], board, isEnpassant)
+                for start, end, isEnpassant in self.bitboards.generateMoves(self.whiteToMove, self.enpassantPossible)]
+
     def getPawnMoves(self, r, c, moves):
         # Movimento da peça branca
-        if self.socket.whiteToMove:
+        if self.whiteToMove:
             # checando se o quadrado está vazio
-            if self.socket.board[r-1][c] == '--':
-                moves.append(Move((r, c), (r-1, c), self.socket.board))
-                if r == 6 and self.socket.board[r-2][c] == '--':
-                    moves.append(Move((r, c), (r-2, c), self.socket.board))
+            if self.board[r-1][c] == '--':
+                moves.append(Move((r, c), (r-1, c), self.board))
+                if r == 6 and self.board[r-2][c] == '--':
+                    moves.append(Move((r, c), (r-2, c), self.board))
             # capturando para esquerda
             if c - 1 >= 0:
-                if self.socket.board[r-1][c-1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c-1), self.socket.board))
+                if self.board[r-1][c-1][0] == 'b':
+                    moves.append(Move((r, c), (r-1, c-1), self.board))
                 elif (r-1, c-1) == self.enpassantPossible:
                     moves.append(
-                        Move((r, c), (r-1, c-1), self.socket.board, isEnpassantMove=True))
+                        Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
             # capturando para direita
             if c + 1 <= 7:
-                if self.socket.board[r-1][c+1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c+1), self.socket.board))
+                if self.board[r-1][c+1][0] == 'b':
+                    moves.append(Move((r, c), (r-1, c+1), self.board))
                 elif (r-1, c+1) == self.enpassantPossible:
                     moves.append(
-                        Move((r, c), (r-1, c+1), self.socket.board, isEnpassantMove=True))
+                        Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
 
         # Movimento da peça preta
         else:
-            if self.socket.board[r + 1][c] == '--':
+            if self.board[r + 1][c] == '--':
                 # checando se o quadrado está vazio
-                moves.append(Move((r, c), (r + 1, c), self.socket.board))
-                if r == 1 and self.socket.board[r + 2][c] == '--':
-                    moves.append(Move((r, c), (r+2, c), self.socket.board))
+                moves.append(Move((r, c), (r + 1, c), self.board))
+                if r == 1 and self.board[r + 2][c] == '--':
+                    moves.append(Move((r, c), (r+2, c), self.board))
             # capturando para esquerda
             if c - 1 >= 0:
-                if self.socket.board[r + 1][c - 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c-1), self.socket.board))
+                if self.board[r + 1][c - 1][0] == 'w':
+                    moves.append(Move((r, c), (r + 1, c-1), self.board))
                 elif (r + 1, c - 1) == self.enpassantPossible:
                     moves.append(Move((r, c), (r + 1, c - 1),
-                                 self.socket.board, isEnpassantMove=True))
+                                 self.board, isEnpassantMove=True))
             # capturando para direita
             if c + 1 <= 7:
-                if self.socket.board[r + 1][c + 1][0] == 'w':
-                    moves.append(Move((r, c), (r+1, c+1), self.socket.board))
+                if self.board[r + 1][c + 1][0] == 'w':
+                    moves.append(Move((r, c), (r+1, c+1), self.board))
                 elif (r + 1, c + 1) == self.enpassantPossible:
                     moves.append(Move((r, c), (r + 1, c + 1),
-                                 self.socket.board, isEnpassantMove=True))
+                                 self.board, isEnpassantMove=True))
 
     def getRookMoves(self, r, c, moves):
         # cima baixo direita e esquerda
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
-        oppColour = 'b' if self.socket.whiteToMove else 'w'
+        oppColour = 'b' if self.whiteToMove else 'w'
         # passa por cada direção
         for d in directions:
             # faz um loop 8 vezes o comprimento/largura do tabuleiro, pois uma torre pode se mover 8 casas
@@ -257,13 +657,13 @@ class GameState():
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.socket.board[endRow][endCol]
+                    endPiece = self.board[endRow][endCol]
                     if endPiece == '--':  # Espaço vazio válido
                         moves.append(
-                            Move((r, c), (endRow, endCol), self.socket.board))
+                            Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == oppColour:
                         moves.append(
-                            Move((r, c), (endRow, endCol), self.socket.board))
+                            Move((r, c), (endRow, endCol), self.board))
                         break
                     else:  # peça amiga invalida
                         break
@@ -274,7 +674,7 @@ class GameState():
     def getBishopMoves(self, r, c, moves):
         # direções em que o bispo pode se mover (diagonais)
         directions = ((-1, -1), (1, -1), (1, 1), (-1, 1))
-        oppColour = 'b' if self.socket.whiteToMove else 'w'
+        oppColour = 'b' if self.whiteToMove else 'w'
         # passa por cada direção
         for d in directions:
             # interage 8 vezes
@@ -282,14 +682,14 @@ class GameState():
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.socket.board[endRow][endCol]
+                    endPiece = self.board[endRow][endCol]
                     if endPiece == '--':  # Espaço vazio válido
                         moves.append(
-                            Move((r, c), (endRow, endCol), self.socket.board))
+                            Move((r, c), (endRow, endCol), self.board))
                     # se houver uma peça do oponente, podemos pegá-la e sair dessa direção
                     elif endPiece[0] == oppColour:
                         moves.append(
-                            Move((r, c), (endRow, endCol), self.socket.board))
+                            Move((r, c), (endRow, endCol), self.board))
                         break
                     # peça amiga invalida
                     else:
@@ -305,51 +705,51 @@ class GameState():
     def getKnightMoves(self, r, c, moves):
         knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
                        (1, -2), (1, 2), (2, -1), (2, 1))
-        allyColour = 'w' if self.socket.whiteToMove else 'b'
+        allyColour = 'w' if self.whiteToMove else 'b'
         for m in knightMoves:
             endRow = r + m[0]
             endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.socket.board[endRow][endCol]
+                endPiece = self.board[endRow][endCol]
                 if endPiece[0] != allyColour:
                     moves.append(
-                        Move((r, c), (endRow, endCol), self.socket.board))
+                        Move((r, c), (endRow, endCol), self.board))
 
     def getKingMoves(self, r, c, moves):
         directions = ((-1, -1), (1, -1), (1, 1), (-1, 1),
                       (-1, 0), (0, -1), (1, 0), (0, 1))
-        allyColour = 'w' if self.socket.whiteToMove else 'b'
+        allyColour = 'w' if self.whiteToMove else 'b'
         for d in directions:
             endRow = r + d[0]
             endCol = c + d[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.socket.board[endRow][endCol]
+                endPiece = self.board[endRow][endCol]
                 # Não for um aliado (casa vazia ou peça inimiga)
                 if endPiece[0] != allyColour:
                     moves.append(
-                        Move((r, c), (endRow, endCol), self.socket.board))
+                        Move((r, c), (endRow, endCol), self.board))
 
     def getCastleMoves(self, r, c, moves):
         # não posso fazer castle se um quadrado estiver sob ataque
         if self.squareUnderAttack(r, c):
             return
         # pode se mover para lá
-        if (self.socket.whiteToMove and self.currentCastlingRight.wks) or (not self.socket.whiteToMove and self.currentCastlingRight.bks):
+        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
             self.getKingsideCastleMoves(r, c, moves)
-        if (self.socket.whiteToMove and self.currentCastlingRight.wqs) or (not self.socket.whiteToMove and self.currentCastlingRight.bqs):
+        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
             self.getQueensideCastleMoves(r, c, moves)
 
     def getKingsideCastleMoves(self, r, c, moves):
-        if self.socket.board[r][c + 1] == '--' and self.socket.board[r][c + 2] == '--':
+        if self.board[r][c + 1] == '--' and self.board[r][c + 2] == '--':
             if not self.squareUnderAttack(r, c + 1) and not self.squareUnderAttack(r, c + 2):
                 moves.append(
-                    Move((r, c), (r, c + 2), self.socket.board, isCastleMove=True))
+                    Move((r, c), (r, c + 2), self.board, isCastleMove=True))
 
     def getQueensideCastleMoves(self, r, c, moves):
-        if self.socket.board[r][c - 1] == '--' and self.socket.board[r][c - 2] == '--' and self.socket.board[r][c - 3] == '--':
+        if self.board[r][c - 1] == '--' and self.board[r][c - 2] == '--' and self.board[r][c - 3] == '--':
             if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
                 moves.append(
-                    Move((r, c), (r, c - 2), self.socket.board, isCastleMove=True))
+                    Move((r, c), (r, c - 2), self.board, isCastleMove=True))
 
 
 class castleRights():
@@ -362,6 +762,11 @@ class castleRights():
 
 
 class Move():
+    # objeto compacto: sem __dict__, e com o movimento inteiro também disponível como um
+    # inteiro empacotado (casa inicial, casa final, peça movida, peça capturada e flags)
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol',
+                 'pieceMoved', 'pieceCaptured', 'moveID', 'flags')
+
     # Numerando as linhas e colunas de 1 a 8
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
                    "5": 3, "6": 2, "7": 1, "8": 0}
@@ -371,6 +776,14 @@ class Move():
                    "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
+    PROMOTION = 1
+    ENPASSANT = 2
+    CASTLE = 4
+
+    # índice de cada peça no inteiro empacotado ('--' é o 12)
+    pieceCodes = {piece: i for i, piece in enumerate(ChessBitboard.PIECES + (ChessBitboard.EMPTY,))}
+    codePieces = ChessBitboard.PIECES + (ChessBitboard.EMPTY,)
+
     def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
         # começo e fim da localizaçao/quadrado
         self.startRow = startSq[0]
@@ -381,25 +794,67 @@ class Move():
         self.pieceMoved = board[self.startRow][self.startCol]
         # Onde a peça será movida
         self.pieceCaptured = board[self.endRow][self.endCol]
-        # booleano para ver se o peão preto ou branco foi movido para a linha final
-        self.isPawnPromotion = ((self.pieceMoved == 'wP' and self.endRow == 0) or (
-            self.pieceMoved == 'bP' and self.endRow == 7))
+        # promoção quando o peão preto ou branco foi movido para a linha final
+        self.flags = 0
+        if (self.pieceMoved == 'wP' and self.endRow == 0) or (self.pieceMoved == 'bP' and self.endRow == 7):
+            self.flags = Move.PROMOTION
 
-        self.isEnpassantMove = isEnpassantMove
-
-        if self.isEnpassantMove:
+        if isEnpassantMove:
+            self.flags |= Move.ENPASSANT
             self.pieceCaptured = 'wP' if self.pieceMoved == 'bP' else 'bP'
 
-        self.isCastleMove = isCastleMove
-
-        # comparando os movimentos
-        self.moveID = self.startRow * 1000 + self.startCol * \
-            100 + self.endRow * 10 + self.endCol
+        if isCastleMove:
+            self.flags |= Move.CASTLE
+
+        # comparando os movimentos: casa inicial e final em 12 bits
+        self.moveID = (self.startRow * 8 + self.startCol) << 6 | (self.endRow * 8 + self.endCol)
+
+    @classmethod
+    def fromSquares(cls, start, end, pieceMoved, pieceCaptured, flags=0):
+        # construção direta a partir dos índices das casas (0 = a8), usada pelos geradores de bitboard
+        move = cls.__new__(cls)
+        move.startRow = start >> 3
+        move.startCol = start & 7
+        move.endRow = end >> 3
+        move.endCol = end & 7
+        move.pieceMoved = pieceMoved
+        move.pieceCaptured = pieceCaptured
+        move.flags = flags
+        move.moveID = start << 6 | end
+        return move
+
+    @classmethod
+    def decode(cls, code):  # reconstrói o movimento a partir de encode()
+        return cls.fromSquares(code >> 6 & 63, code & 63, cls.codePieces[code >> 12 & 15],
+                               cls.codePieces[code >> 16 & 15], code >> 20)
+
+    def encode(self):  # o movimento inteiro num int: casas, peça movida, peça capturada e flags
+        return (self.moveID | self.pieceCodes[self.pieceMoved] << 12
+                | self.pieceCodes[self.pieceCaptured] << 16 | self.flags << 20)
+
+    @property
+    def isPawnPromotion(self):
+        return bool(self.flags & Move.PROMOTION)
+
+    @property
+    def isEnpassantMove(self):
+        return bool(self.flags & Move.ENPASSANT)
+
+    @property
+    def isCastleMove(self):
+        return bool(self.flags & Move.CASTLE)
 
     # igualdade do objeto da class move
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.moveID == other.moveID
+        return NotImplemented
+
+    def __hash__(self):
+        return self.moveID
+
+    def __repr__(self):
+        return 'Move(%s)' % self.getChessNot()
 
     # Essa função retorna a posição da casa e da coluna
     def getChessNot(self):
@@ -407,3 +862,51 @@ class Move():
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
+
+
+def parseEPDOperations(text):
+    # 'bm Nf3; id "posição 1";' -> {'bm': ['Nf3'], 'id': ['posição 1']}; aspas protegem espaços e ';'
+    operations = {}
+    words = []
+    word = ''
+    quoted = False
+    for ch in text + ';':
+        if quoted:
+            if ch == '"':
+                quoted = False
+                words.append(word)
+                word = ''
+            else:
+                word += ch
+        elif ch == '"':
+            quoted = True
+        elif ch.isspace() or ch == ';':
+            if word:
+                words.append(word)
+                word = ''
+            if ch == ';' and words:
+                operations[words[0]] = words[1:]
+                words = []
+        else:
+            word += ch
+    if quoted:
+        raise ValueError('EPD com aspas sem fechar: ' + text)
+    return operations
+
+
+def formatEPDOperations(operations):
+    parts = []
+    for opcode, operands in operations.items():
+        if isinstance(operands, (str, int, float)):
+            operands = [operands]
+        text = [opcode]
+        for operand in operands:
+            operand = str(operand)
+            text.append('"%s"' % operand if not operand or any(ch.isspace() or ch == ';' for ch in operand)
+                        else operand)
+        parts.append(' '.join(text) + ';')
+    return ' '.join(parts)
+
+
+# hash da posição inicial, reaproveitado por todo GameState criado sem conexão
+_startingKey = ChessZobrist.computeHash(STARTING_BOARD, True, castleRights(True, True, True, True), ())
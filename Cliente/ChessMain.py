@@ -1,146 +1,345 @@
+import ChessAI
+import ChessBook
 import ChessEngine
+import ChessPonder
+import ChessSprites
+import ChessTablebase
 import pygame as p
 import math
+import argparse
+import threading
+from socketCliente import protocol
 
 
 width = height = 500
 dim = 8  # Dimensions (8x8)
 sqsize = height // dim
-maxfps = 20
-images = {}
+images = {}  # peça -> Surface do tamanho atual da casa, vindas do atlas
+sprites = ChessSprites.SpriteAtlas()
+networkEvent = p.USEREVENT + 1  # algo chegou do servidor (lance, posição, fim da partida)
+# a janela foi descoberta ou restaurada e precisa ser redesenhada inteira
+exposeEvents = (p.VIDEOEXPOSE, getattr(p, 'WINDOWEXPOSED', p.VIDEOEXPOSE))
+# textos do GAME_OVER do servidor: resultado e motivo
+resultTexts = {protocol.WHITE_WINS: 'O BRANCO VENCEU', protocol.BLACK_WINS: 'O PRETO VENCEU',
+               protocol.DRAW: 'EMPATE', protocol.ABANDONED: 'PARTIDA ABANDONADA'}
+reasonTexts = {protocol.CHECKMATE: 'POR CHECKMATE', protocol.STALEMATE: 'POR AFOGAMENTO',
+               protocol.REPETITION: 'POR REPETIÇÃO', protocol.DISCONNECTED: 'POR ABANDONO'}
 
 
-def loadImages():
-    pieces = ["wP", "wR", "wN", "wB", "wQ",
-              "wK", "bP", "bR", "bN", "bB", "bQ", "bK"]
-    for piece in pieces:
-        images[piece] = p.transform.scale(p.image.load(
-            "images/" + piece + ".png"), (sqsize, sqsize))
+def loadImages():  # troca as imagens pelas do tamanho atual (geradas uma vez por tamanho)
+    images.clear()
+    images.update(sprites.sprites(sqsize))
 
 
-def main():
+def resize(size):  # a janela mudou de tamanho: o tabuleiro ocupa o maior quadrado que cabe nela
+    global width, height, sqsize
+    width, height = size
+    sqsize = max(min(width, height) // dim, 1)
+    screen = p.display.set_mode((width, height), p.RESIZABLE)
+    loadImages()
+    return screen
+
+
+def main(botTime=None, watch=None):
+    # com botTime (segundos por lance) o jogo é contra o computador, que fica com as pretas,
+    # sem precisar do servidor; com watch (id da partida, 0 = a mais assistida) só assiste
     p.init()
-    screen = p.display.set_mode((width, height))
+    screen = p.display.set_mode((width, height), p.RESIZABLE)
     clock = p.time.Clock()
     screen.fill(p.Color("White"))
+    renderer = BoardRenderer(screen)
     gameOver = False
-    gs = ChessEngine.GameState()
+    bot = botTime is not None
+    gs = ChessEngine.GameState(connect=not bot, watch=watch)
+    searcher = ChessAI.Searcher(maxTime=botTime) if bot else None
+    if bot:
+        gs.book = ChessBook.defaultBook()  # as primeiras jogadas do computador saem do livro, se houver
+        gs.tablebase = ChessTablebase.defaultTablebase()  # e os finais de três peças, das tablebases
     validMoves = gs.getValidMoves()
     moveMade = False
     loadImages()
     running = True
     animate = False
     sqSelected = ()
+    playerClicks = []  # cliques do jogador local
+    # contra outro jogador, a vez do adversário é usada para calcular as respostas dele num processo
+    # à parte; a tecla H mostra o lance sugerido por esse cálculo. Espectadores (e quem não conseguiu
+    # entrar numa partida) nunca jogam e não precisam dele
+    ponderer = ChessPonder.Ponderer() if gs.socket is not None and isPlayer(gs) else None
+    showHint = False
+
+    # a thread do socket acorda o laço com um evento quando chega algo do servidor; um evento só
+    # fica pendente por vez, mesmo que cheguem vários lances antes do laço acordar
+    notified = threading.Event()
+    if gs.socket is not None:
+        gs.socket.setListener(lambda: notifyNetwork(notified))
+        notifyNetwork(notified)  # o que chegou antes do listener
+    p.event.set_blocked(p.MOUSEMOTION)
 
     while running:
-        for e in p.event.get():
-            if e.type == p.QUIT:
-                gs.socket.close()
+        # parado, o laço dorme em event.wait até um clique, uma mensagem do servidor ou a janela
+        # precisar ser redesenhada; só não dorme quando é a vez do computador
+        busy = bot and not gs.whiteToMove and not gameOver
+        events = p.event.get() if busy else [p.event.wait()] + p.event.get()
+        for e in events:
+            if e.type == networkEvent:
+                notified.clear()  # o que chegar depois daqui gera um evento novo
+
+            elif e.type == p.QUIT:
+                if gs.socket is not None:
+                    gs.socket.close()
+                if ponderer is not None:
+                    ponderer.close()
                 running = False
 
-            elif e.type == p.MOUSEBUTTONDOWN and ((gs.socket.turn and gs.socket.player == '0') or (gs.socket.turn and gs.socket.player == '1')):
+            elif e.type == p.KEYDOWN and e.key == p.K_h:
+                showHint = not showHint
+
+            elif e.type in exposeEvents:
+                renderer.invalidate()
+
+            elif e.type == p.VIDEORESIZE:
+                renderer.resize(resize(e.size))
+
+            elif e.type == p.MOUSEBUTTONDOWN and isHumanTurn(gs, bot):
                 if not gameOver:
                     location = p.mouse.get_pos()
                     col = location[0]//sqsize
                     row = location[1]//sqsize
-                    if sqSelected == (row, col):
+                    if row >= dim or col >= dim:
+                        pass  # fora do tabuleiro (sobra da janela redimensionada)
+                    elif sqSelected == (row, col):
                         sqSelected = ()
-                        gs.socket.playerClicks = []
+                        playerClicks = []
                     else:
                         sqSelected = (row, col)
-                        gs.socket.playerClicks.append(sqSelected)
+                        playerClicks.append(sqSelected)
 
-                    if len(gs.socket.playerClicks) == 2:
+                    if len(playerClicks) == 2:
                         move = ChessEngine.Move(
-                            gs.socket.playerClicks[0], gs.socket.playerClicks[1], gs.socket.board)
+                            playerClicks[0], playerClicks[1], gs.board)
                         if move in validMoves:
-                            gs.makeMove(move)
+                            # usa o movimento gerado pelo motor, que já vem com as flags de roque e en passant
+                            gs.makeMove(validMoves[validMoves.index(move)])
                             moveMade = True
                             animate = True
                             sqSelected = ()
-                            gs.socket.clicks(gs.socket.playerClicks)
-                            gs.socket.turn = not gs.socket.turn
-                            gs.socket.playerClicks = []
+                            if gs.socket is not None:
+                                gs.socket.clicks(playerClicks, gs.ply() - 1)
+                                gs.socket.setTurn(False)
+                            playerClicks = []
                         if not moveMade:
-                            gs.socket.playerClicks = [sqSelected]
+                            playerClicks = [sqSelected]
+
+        # posição completa do servidor (volta à partida ou movimento recusado) substitui a local
+        snapshot = gs.socket.takeSnapshot() if gs.socket is not None else None
+        if snapshot is not None:
+            gs.setPosition(*snapshot)
+            validMoves = gs.getValidMoves()
+            sqSelected = ()
+            playerClicks = []
+            gameOver = False
 
-        if len(gs.socket.playerClicks) == 2 and not (gs.socket.turn):
-            move = ChessEngine.Move(
-                gs.socket.playerClicks[0], gs.socket.playerClicks[1], gs.socket.board)
+        # lances validados pelo servidor; um espectador pode receber vários de uma vez
+        for startSq, endSq in (gs.socket.takeMoves() if gs.socket is not None else ()):
+            move = ChessEngine.Move(startSq, endSq, gs.board)
             if move in validMoves:
-                gs.makeMove(move)
+                gs.makeMove(validMoves[validMoves.index(move)])
+                if ponderer is not None:
+                    ponderer.prime(gs)  # os movimentos desta posição já calculados vão para o cache
+                validMoves = gs.getValidMoves()
                 moveMade = True
                 animate = True
                 sqSelected = ()
-                gs.socket.playerClicks = []
                 if (gs.socket.player == '0' or gs.socket.player == '1'):
-                    gs.socket.turn = not gs.socket.turn
+                    gs.socket.setTurn(True)
+
+        if bot and not gs.whiteToMove and not gameOver and not moveMade:
+            result = searcher.search(gs)
+            if result is not None:
+                gs.makeMove(result.bestMove)
+                moveMade = True
+                animate = True
 
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.socket.board, clock, gs)
+                animateMove(gs.moveLog[-1], renderer, gs, clock)
             validMoves = gs.getValidMoves()
 
             moveMade = False
             animate = False
-        drawGameState(screen, gs, validMoves, sqSelected)
 
+        text = None
         if gs.checkMate:
             gameOver = True
-            if gs.socket.whiteToMove:
-                drawText(screen, 'O PRETO VENCEU POR CHECKMATE')
+            if gs.whiteToMove:
+                text = 'O PRETO VENCEU POR CHECKMATE'
             else:
-                drawText(screen, 'O BRANCO VENCEU POR CHECKMATE')
+                text = 'O BRANCO VENCEU POR CHECKMATE'
         elif gs.stalemate:
             gameOver = True
-            drawText(screen, 'stalemate')
-
-        clock.tick(maxfps)
-        p.display.flip()
-
-
-def highlightSquares(screen, gs, validMoves, sqSelected):  # mostra os movimentos possiveis
-    if sqSelected != ():
-        r, c = sqSelected
-        if gs.socket.board[r][c][0] == ('w' if gs.socket.whiteToMove else 'b'):
-            s = p.Surface((sqsize, sqsize))
-            s.set_alpha(100)
-            s.fill(p.Color('dark gray'))
-            screen.blit(s, (c*sqsize, r*sqsize))
-            s.fill(p.Color('blue'))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol*sqsize, move.endRow*sqsize))
-
-
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen, gs)
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.socket.board)
-
-
-def drawBoard(screen, gs):  # desenha o tabuleiro
-    global colours
-    colours = [p.Color("white"), p.Color("black" if (
-        gs.socket.player == '0' or gs.socket.player == '1') else "gray")]
-    for r in range(dim):
-        for c in range(dim):
-            colour = colours[((r + c) % 2)]
-            p.draw.rect(screen, colour, p.Rect(
-                c*sqsize, r*sqsize, sqsize, sqsize))
-
-
-def drawPieces(screen, board):  # desenha as peças no tabuleiro
-    for r in range(dim):
-        for c in range(dim):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(images[piece], p.Rect(
-                    c*sqsize, r*sqsize, sqsize, sqsize))
-
-
-def animateMove(move, screen, board, clock, gs):  # animação da peça
-    global colours
+            text = 'stalemate'
+        elif gs.socket is not None and gs.socket.gameOver is not None:
+            # qualquer fim de partida do servidor encerra a entrada: depois dele nada mais é lido
+            gameOver = True
+            text = gameOverText(*gs.socket.gameOver)
+        elif gs.socket is not None and gs.socket.disconnected:
+            gameOver = True
+            text = 'SEM CONEXÃO COM O SERVIDOR'
+        hint = None
+        if ponderer is not None and not gameOver:
+            if not isHumanTurn(gs, bot):
+                ponderer.start(gs)
+            elif showHint:
+                hint = ponderer.hint(gs)
+        renderer.draw(gs, validMoves, sqSelected, text, hint=hint[0] if hint else None)
+
+
+def gameOverText(result, reason):  # códigos desconhecidos ainda encerram a partida
+    text = resultTexts.get(result, 'FIM DE PARTIDA')
+    return text + ' ' + reasonTexts[reason] if reason in reasonTexts else text
+
+
+def notifyNetwork(notified):  # roda na thread do socket
+    if not notified.is_set():
+        notified.set()
+        p.event.post(p.event.Event(networkEvent))
+
+
+def isHumanTurn(gs, bot):  # o jogador local pode clicar?
+    if bot:
+        return gs.whiteToMove
+    return gs.socket.turn and (gs.socket.player == '0' or gs.socket.player == '1')
+
+
+def isPlayer(gs):  # espectadores veem o tabuleiro em cinza
+    return gs.socket is None or gs.socket.player == '0' or gs.socket.player == '1'
+
+
+class BoardRenderer():
+    # desenha só o que mudou: as casas vazias ficam numa superfície pronta (o fundo), cada casa
+    # guarda o que está desenhado nela e só as casas diferentes são redesenhadas e enviadas para a
+    # tela com display.update(rects), em vez de redesenhar as 64 casas e dar flip a cada quadro
+    def __init__(self, screen):
+        self.screen = screen
+        self.marks = {}
+        self.background = None
+        self.player = None  # isPlayer com que o fundo foi desenhado
+        self.shown = [[None] * dim for _ in range(dim)]  # (peça, destaque) desenhado em cada casa
+        self.dirty = []  # retângulos da tela a atualizar
+        self.text = None  # mensagem desenhada por cima do tabuleiro e o retângulo dela
+        self.textRect = None
+        self.font = None
+        self.textCache = {}
+        self.full = True  # a próxima atualização inclui a janela inteira (bordas fora das casas)
+
+    def resize(self, screen):  # nova janela ou novo tamanho de casa: fundo e destaques refeitos
+        self.screen = screen
+        self.background = None
+        self.marks = {}
+        self.invalidate()
+
+    def invalidate(self):  # a tela foi sobrescrita (ou exposta de novo): tudo é redesenhado
+        self.shown = [[None] * dim for _ in range(dim)]
+        self.text = None
+        self.full = True
+
+    def buildBackground(self, player):
+        self.player = player
+        # destaques: casa selecionada, destinos possíveis e lance sugerido
+        for mark, colour in ((1, 'dark gray'), (2, 'blue'), (3, 'green')):
+            surface = p.Surface((sqsize, sqsize)).convert()
+            surface.set_alpha(100)
+            surface.fill(p.Color(colour))
+            self.marks[mark] = surface
+        self.background = p.Surface((width, height)).convert()
+        self.background.fill(p.Color("White"))
+        colours = [p.Color("white"), p.Color("black" if player else "gray")]
+        for r in range(dim):
+            for c in range(dim):
+                p.draw.rect(self.background, colours[(r + c) % 2], p.Rect(c*sqsize, r*sqsize, sqsize, sqsize))
+        self.invalidate()
+
+    def drawSquare(self, r, c, piece, mark=0):
+        rect = p.Rect(c*sqsize, r*sqsize, sqsize, sqsize)
+        self.screen.blit(self.background, rect, rect)
+        if mark:
+            self.screen.blit(self.marks[mark], rect)
+        if piece != "--":
+            self.screen.blit(images[piece], rect)
+        self.shown[r][c] = (piece, mark)
+        self.dirty.append(rect)
+        return rect
+
+    def draw(self, gs, validMoves, sqSelected, text=None, overrides=None, update=True, hint=None):
+        # overrides: {(linha, coluna): peça} desenhada no lugar da do tabuleiro; com update=False os
+        # retângulos ficam em dirty para quem chamou desenhar por cima antes do flush (animação);
+        # hint é um movimento sugerido, marcado nas casas de saída e de chegada
+        player = isPlayer(gs)
+        if self.background is None or player != self.player:
+            self.buildBackground(player)
+        if self.full:
+            self.screen.blit(self.background, (0, 0))
+            self.dirty.append(self.screen.get_rect())
+            self.full = False
+        marks = {}
+        if hint is not None:
+            marks[(hint.startRow, hint.startCol)] = marks[(hint.endRow, hint.endCol)] = 3
+        if sqSelected != ():
+            r, c = sqSelected
+            if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
+                marks[sqSelected] = 1
+                for move in validMoves:
+                    if move.startRow == r and move.startCol == c:
+                        marks[(move.endRow, move.endCol)] = 2
+        if text != self.text and self.textRect is not None:
+            self.invalidateRect(self.textRect)  # as casas sob a mensagem antiga voltam ao normal
+        for r in range(dim):
+            row = gs.board[r]
+            shown = self.shown[r]
+            for c in range(dim):
+                piece = row[c] if overrides is None else overrides.get((r, c), row[c])
+                state = (piece, marks.get((r, c), 0))
+                if shown[c] != state:
+                    self.drawSquare(r, c, *state)
+        if text is not None and (text != self.text or self.textRect.collidelist(self.dirty) != -1):
+            surface = self.textSurface(text)
+            self.textRect = surface.get_rect(center=(width // 2, height // 2))
+            self.screen.blit(surface, self.textRect)
+            self.dirty.append(self.textRect)
+        elif text is None:
+            self.textRect = None
+        self.text = text
+        if update:
+            self.flush()
+
+    def invalidateRect(self, rect):  # casas que encostam em rect serão redesenhadas
+        for r in range(max(rect.top // sqsize, 0), min((rect.bottom - 1) // sqsize + 1, dim)):
+            for c in range(max(rect.left // sqsize, 0), min((rect.right - 1) // sqsize + 1, dim)):
+                self.shown[r][c] = None
+
+    def flush(self):
+        if self.dirty:
+            p.display.update(self.dirty)
+            self.dirty = []
+
+    def textSurface(self, text):  # mensagem já renderizada (sombra preta e texto vermelho), por texto
+        surface = self.textCache.get(text)
+        if surface is None:
+            if self.font is None:
+                self.font = p.font.SysFont("Helvitca", 32, True, False)
+            shadow = self.font.render(text, 0, p.Color('Black'))
+            surface = p.Surface((shadow.get_width() + 2, shadow.get_height() + 2), p.SRCALPHA)
+            surface.blit(shadow, (0, 0))
+            surface.blit(self.font.render(text, 0, p.Color("red")), (2, 2))
+            self.textCache[text] = surface
+        return surface
+
+
+def animateMove(move, renderer, gs, clock):  # animação da peça
+    # o tabuleiro já está na posição depois do lance: a casa final mostra a peça capturada enquanto
+    # a peça anda, e a cada quadro só as casas sob a peça (antes e agora) são redesenhadas
+    overrides = {(move.endRow, move.endCol): move.pieceCaptured}
     dR = move.endRow - move.startRow
     dC = move.endCol - move.startCol
     framesPerSquare = 7
@@ -148,29 +347,20 @@ def animateMove(move, screen, board, clock, gs):  # animação da peça
     for frame in range(frameCount + 1):
         r, c = ((move.startRow + dR*frame/frameCount,
                 move.startCol + dC*frame/frameCount))
-        drawBoard(screen, gs)
-        drawPieces(screen, board)
-        colour = colours[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol*sqsize,
-                           move.endRow*sqsize, sqsize, sqsize)
-        p.draw.rect(screen, colour, endSquare)
-        if move.pieceCaptured != '--':
-            screen.blit(images[move.pieceCaptured], endSquare)
-        screen.blit(images[move.pieceMoved], p.Rect(
-            c*sqsize, r*sqsize, sqsize, sqsize))
-        p.display.flip()
+        piece = p.Rect(int(c*sqsize), int(r*sqsize), sqsize, sqsize)
+        renderer.draw(gs, [], (), overrides=overrides, update=False)
+        renderer.screen.blit(images[move.pieceMoved], piece)
+        renderer.invalidateRect(piece)  # as casas sob a peça voltam no quadro seguinte
+        renderer.dirty.append(piece)
+        renderer.flush()
         clock.tick(60)
 
 
-def drawText(screen, text):  # tela de gameover
-    font = p.font.SysFont("Helvitca", 32, True, False)
-    textObject = font.render(text, 0, p.Color('Black'))
-    textLocation = p.Rect(0, 0, width, height).move(
-        width/2 - textObject.get_width()/2, height/2 - textObject.get_height()/2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, p.Color("red"))
-    screen.blit(textObject, textLocation.move(2, 2))
-
-
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bot', type=float, nargs='?', const=1.0, metavar='SEGUNDOS',
+                        help='joga contra o computador (segundos por lance, padrão 1)')
+    parser.add_argument('--watch', type=int, nargs='?', const=0, metavar='PARTIDA',
+                        help='assiste uma partida do servidor (padrão: a com mais espectadores)')
+    args = parser.parse_args()
+    main(args.bot, args.watch)
@@ -0,0 +1,181 @@
+''' Métricas de execução do servidor e do motor: contadores, medidores e histogramas de tempo
+com custo de poucas operações de dicionário por evento. A instrumentação do motor e o profiler
+por amostragem só existem quando são ligados; desligados, o caminho quente não muda '''
+
+import bisect
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+
+import ChessEngine
+
+# limites dos baldes dos histogramas, em segundos: de 10µs a ~10s em passos de ~1.78x
+BUCKETS = tuple(1e-5 * 10 ** (i / 4) for i in range(25))
+
+
+class Histogram():
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, point):
+        # limite superior do balde onde cai o percentil (estimativa pelo histograma)
+        if not self.count:
+            return 0.0
+        target = self.count * point / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.total, 'max': self.max,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99)}
+
+
+class Metrics():
+    def __init__(self):
+        self.counters = collections.defaultdict(int)
+        self.gauges = {}  # nome -> função sem argumentos, lida só na hora do snapshot
+        self.histograms = collections.defaultdict(Histogram)
+        self.started = time.time()
+
+    def incr(self, name, amount=1):
+        self.counters[name] += amount
+
+    def observe(self, name, seconds):
+        self.histograms[name].observe(seconds)
+
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def timer(self, name):  # with metrics.timer('x'): ... soma o tempo no histograma 'x'
+        return _Timer(self, name)
+
+    def snapshot(self):
+        return {'uptime': time.time() - self.started,
+                'counters': dict(self.counters),
+                'gauges': {name: function() for name, function in self.gauges.items()},
+                'histograms': {name: h.snapshot() for name, h in self.histograms.items()}}
+
+    def reset(self):  # zera no lugar: os métodos instrumentados guardam os próprios histogramas
+        self.counters.clear()
+        for histogram in self.histograms.values():
+            histogram.__init__(histogram.bounds)
+
+
+class _Timer():
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+# métodos do GameState medidos por instrumentEngine; os que devolvem listas de movimentos também
+# somam os movimentos gerados. Os tempos são inclusivos (getValidMoves contém getLegalMoves etc.)
+ENGINE_METHODS = {'getValidMoves': False, 'getLegalMoves': True, 'getAllPossibleMoves': True,
+                  'squareUnderAttack': False, 'makeMove': False}
+_originalMethods = {}
+
+
+def instrumentEngine(metrics):
+    # troca os métodos do GameState por versões que contam chamadas e tempo em metrics
+    # ('engine.<método>'); 'engine.moves' soma os movimentos gerados e as chamadas de makeMove
+    # são os nós visitados
+    uninstrumentEngine()
+    for name, countsMoves in ENGINE_METHODS.items():
+        original = getattr(ChessEngine.GameState, name)
+        _originalMethods[name] = original
+        setattr(ChessEngine.GameState, name, _timed(metrics, 'engine.' + name, original, countsMoves))
+
+
+def uninstrumentEngine():
+    for name, original in _originalMethods.items():
+        setattr(ChessEngine.GameState, name, original)
+    _originalMethods.clear()
+
+
+def _timed(metrics, key, method, countsMoves):
+    histogram = metrics.histograms[key]
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        result = method(*args, **kwargs)
+        histogram.observe(perf_counter() - start)
+        if countsMoves and result is not None:
+            metrics.counters['engine.moves'] += len(result)
+        return result
+    return wrapper
+
+
+class SamplingProfiler():
+    # a cada intervalo uma thread olha a pilha das outras threads (sys._current_frames) e conta as
+    # funções no topo; custa uma leitura de pilha por amostra em vez de um gancho por chamada
+    def __init__(self, interval=0.005, depth=1):
+        self.interval = interval
+        self.depth = depth  # quantas funções da pilha formam cada amostra
+        self.samples = collections.Counter()
+        self.total = 0
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        own = threading.get_ident()
+        while self.running:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append('%s:%d(%s)' % (os.path.basename(code.co_filename), frame.f_lineno,
+                                                code.co_name))
+                    frame = frame.f_back
+                self.samples[' <- '.join(stack)] += 1
+                self.total += 1
+            time.sleep(self.interval)
+
+    def report(self, limit=20):  # [(pilha, amostras, fração)] das mais frequentes
+        return [(stack, n, n / self.total) for stack, n in self.samples.most_common(limit)]
+
+    def clear(self):
+        self.samples.clear()
+        self.total = 0
@@ -0,0 +1,205 @@
+''' Análise em vários núcleos com ProcessPoolExecutor: busca de uma posição dividida pelos
+movimentos da raiz e análise em lote de muitas posições ou partidas, devolvendo cada resultado
+assim que fica pronto. Cada processo trabalha com o próprio GameState, sem servidor, e as
+posições viajam entre processos em FEN (na busca, com os movimentos da partida, por causa das
+repetições) '''
+
+import argparse
+import collections
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import ChessAI
+import ChessBook
+import ChessEngine
+import ChessTablebase
+
+
+def _gameState(fen, history=()):
+    # history são os movimentos (Move.encode) jogados desde fen, refeitos para o histórico de repetições
+    gs = ChessEngine.GameState()
+    gs.loadFEN(fen)
+    for code in history:
+        gs.makeMove(ChessEngine.Move.decode(code))
+    return gs
+
+
+def _history(gs):
+    # posição inicial da partida em FEN e os movimentos jogados desde ela, para outro processo refazer
+    moves = list(gs.moveLog)
+    for _ in moves:
+        gs.undoMove()
+    fen = gs.getFEN()
+    for move in moves:
+        gs.makeMove(move)
+    return fen, [move.encode() for move in moves]
+
+
+def _searchSubset(fen, history, moveIDs, maxTime, maxNodes):
+    # processo filho: busca só os movimentos da raiz recebidos e devolve cada iteração completa
+    gs = _gameState(fen, history)
+    moves = [m for m in gs.getValidMoves() if m.moveID in moveIDs]
+    result = ChessAI.Searcher(maxTime, maxNodes).search(gs, moves)
+    nodes, timedOut = result.nodes, result.timedOut
+    if not result.iterations:
+        # o limite acabou antes da profundidade 1: termina ela sem limite, para nenhum movimento
+        # da raiz ficar de fora da comparação
+        result = ChessAI.Searcher(None, None, 1).search(gs, moves)
+        nodes += result.nodes
+    iterations = [(depth, score, [m.encode() for m in pv]) for depth, score, pv in result.iterations]
+    return iterations, nodes, timedOut
+
+
+def parallelSearch(gs, maxTime=1.0, maxNodes=None, workers=None, executor=None):
+    # divide os movimentos da raiz entre os processos (cada um com o mesmo limite de tempo/nós)
+    # e compara os melhores de cada parte na maior profundidade que todos completaram
+    moves = gs.getValidMoves()
+    if not moves:
+        return None
+    workers = min(workers or os.cpu_count() or 1, len(moves))
+    # capturas primeiro e distribuição alternada, para cada processo receber movimentos parecidos
+    moves = ChessAI.Searcher().orderMoves(moves, None)
+    parts = [moves[i::workers] for i in range(workers)]
+    fen, history = _history(gs)
+    start = time.perf_counter()
+    ownExecutor = executor is None
+    executor = executor or ProcessPoolExecutor(workers)
+    try:
+        futures = [executor.submit(_searchSubset, fen, history, {m.moveID for m in part},
+                                   maxTime, maxNodes) for part in parts]
+        results = [f.result() for f in futures]
+    finally:
+        if ownExecutor:
+            executor.shutdown()
+
+    nodes = sum(r[1] for r in results)
+    timedOut = any(r[2] for r in results)
+    completed = [r[0] for r in results]  # toda parte completa ao menos a profundidade 1
+    elapsed = time.perf_counter() - start
+    depth = min(iterations[-1][0] for iterations in completed)
+    bestScore, bestPv = None, None
+    for iterations in completed:
+        _, score, pv = iterations[depth - 1]
+        if bestScore is None or score > bestScore:
+            bestScore, bestPv = score, pv
+    pv = [ChessEngine.Move.decode(code) for code in bestPv]
+    return ChessAI.SearchResult(pv[0], bestScore, pv, depth, nodes, elapsed, timedOut)
+
+
+_books = {}  # caminho -> OpeningBook, um mmap por processo
+_tablebases = {}  # pasta -> Tablebase, lida uma vez por processo
+
+
+def analysePosition(fen, maxTime=0.5, maxNodes=None, book=None, tablebases=None):
+    # book é o caminho de um livro de aberturas e tablebases a pasta das tablebases de finais:
+    # nas posições que estão neles não há busca
+    gs = _gameState(fen)
+    if book is not None:
+        if book not in _books:
+            _books[book] = ChessBook.OpeningBook(book)
+        gs.book = _books[book]
+    if tablebases is not None:
+        if tablebases not in _tablebases:
+            _tablebases[tablebases] = ChessTablebase.Tablebase(tablebases)
+        gs.tablebase = _tablebases[tablebases]
+    result = ChessAI.Searcher(maxTime, maxNodes).search(gs)
+    if result is None:
+        return {'fen': fen, 'bestMove': None, 'score': None, 'pv': [], 'depth': 0, 'nodes': 0,
+                'checkMate': gs.checkMate, 'stalemate': gs.stalemate, 'book': False}
+    return {'fen': fen, 'bestMove': result.bestMove.getChessNot(), 'score': result.score,
+            'pv': [m.getChessNot() for m in result.pv], 'depth': result.depth, 'nodes': result.nodes,
+            'checkMate': False, 'stalemate': False, 'book': result.fromBook}
+
+
+def analyseGame(moves, maxTime=0.2, maxNodes=None, fen=ChessEngine.STARTING_FEN):
+    # para cada lance da partida (notação 'e2e4'): o melhor movimento, o valor para quem joga
+    # e se o lance jogado foi o melhor
+    gs = _gameState(fen)
+    searcher = ChessAI.Searcher(maxTime, maxNodes)
+    plies = []
+    for ply, notation in enumerate(moves):
+        move = gs.findMove(notation)
+        if move is None:
+            raise ValueError('lance inválido na posição %d: %s' % (ply, notation))
+        result = searcher.search(gs)
+        plies.append({'ply': ply, 'played': notation, 'best': result.bestMove.getChessNot(),
+                      'score': result.score, 'depth': result.depth})
+        gs.makeMove(move)
+    return {'moves': len(plies), 'plies': plies,
+            'matches': sum(1 for p in plies if p['played'] == p['best'])}
+
+
+def analyseBatch(function, items, workers=None, maxPending=None, **options):
+    # aplica function(item, **options) em processos e gera (índice, resultado) na ordem em que
+    # terminam. A entrada é consumida aos poucos: no máximo maxPending tarefas ficam na fila
+    workers = workers or os.cpu_count() or 1
+    maxPending = maxPending or workers * 4
+    items = iter(items)
+    with ProcessPoolExecutor(workers) as executor:
+        pending = {}
+        index = 0
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < maxPending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(function, item, **options)] = index
+                index += 1
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def orderedBatch(function, items, workers=None, maxPending=None, **options):
+    # como analyseBatch, mas gera só os resultados, na ordem da entrada: espera sempre a tarefa
+    # mais antiga, então nunca há mais que maxPending tarefas ou resultados guardados
+    workers = workers or os.cpu_count() or 1
+    maxPending = maxPending or workers * 4
+    with ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(function, item, **options))
+            if len(pending) >= maxPending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def analysePositions(fens, maxTime=0.5, maxNodes=None, workers=None, book=None, tablebases=None):
+    return analyseBatch(analysePosition, fens, workers, maxTime=maxTime, maxNodes=maxNodes, book=book,
+                        tablebases=tablebases)
+
+
+def analyseGames(games, maxTime=0.2, maxNodes=None, workers=None):
+    # cada partida é uma lista de lances em notação 'e2e4' a partir da posição inicial
+    return analyseBatch(analyseGame, games, workers, maxTime=maxTime, maxNodes=maxNodes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Análise de posições em vários processos')
+    parser.add_argument('file', nargs='?', help='arquivo com uma FEN por linha (padrão: entrada padrão)')
+    parser.add_argument('--time', type=float, default=0.5, help='segundos por posição')
+    parser.add_argument('--nodes', type=int)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--book', metavar='ARQ', help='livro de aberturas (ChessBook)')
+    parser.add_argument('--tablebases', metavar='PASTA', help='tablebases de finais (ChessTablebase)')
+    args = parser.parse_args(argv)
+
+    source = open(args.file) if args.file else sys.stdin
+    with source:
+        fens = (line.strip() for line in source if line.strip())
+        for index, result in analysePositions(fens, args.time, args.nodes, args.workers, args.book,
+                                                 args.tablebases):
+            print('%d\t%s\t%s\t%s' % (index, result['bestMove'], result['score'], ' '.join(result['pv'])),
+                  flush=True)
+
+
+if __name__ == "__main__":
+    main()
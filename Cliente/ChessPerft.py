@@ -0,0 +1,144 @@
+''' Perft: conta os nós da árvore de movimentos até uma profundidade para conferir a geração de
+movimentos do GameState e medir a velocidade (nós/segundo). Roda sem servidor.
+
+Uso: python ChessPerft.py [--fen FEN] [--depth N] [--divide] [--save-baseline ARQ] [--baseline ARQ] '''
+
+import argparse
+import json
+import sys
+import time
+
+import ChessEngine
+
+# posições de referência com o número de nós esperado por profundidade.
+# O motor só promove para rainha, por isso as posições com promoção (kiwipete na profundidade 4,
+# position4 e position5) têm contagens menores que as tabelas publicadas
+POSITIONS = {
+    'start': (ChessEngine.STARTING_FEN,
+              [20, 400, 8902, 197281, 4865609]),
+    'kiwipete': ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4074339]),
+    'position3': ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  [14, 191, 2812, 43238, 674624]),
+    'position4': ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  [6, 228, 8087, 320802]),
+    'position5': ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  [41, 1373, 54041, 1807863]),
+}
+
+DEFAULT_DEPTH = 3
+
+
+def newGameState(fen=ChessEngine.STARTING_FEN, cache=False):
+    # sem cache por padrão, para medir a geração de movimentos e não o acerto no cache
+    gs = ChessEngine.GameState(moveCacheSize=4096 if cache else 0, connect=False)
+    gs.loadFEN(fen)
+    return gs
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+def divide(gs, depth):  # nós abaixo de cada movimento da raiz
+    result = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        result[move.getChessNot()] = perft(gs, depth - 1)
+        gs.undoMove()
+    return result
+
+
+def timedPerft(gs, depth):  # (nós, segundos, nós por segundo)
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else float('inf')
+
+
+def runSuite(depth=DEFAULT_DEPTH, names=None, cache=False):
+    # roda as posições de referência; cada resultado traz o esperado para conferir a contagem
+    results = []
+    for name in names or POSITIONS:
+        fen, expected = POSITIONS[name]
+        d = min(depth, len(expected))
+        nodes, elapsed, nps = timedPerft(newGameState(fen, cache), d)
+        results.append({'name': name, 'depth': d, 'nodes': nodes, 'expected': expected[d - 1],
+                        'seconds': elapsed, 'nps': nps})
+    return results
+
+
+def saveBaseline(results, path):
+    baseline = {'%s:%d' % (r['name'], r['depth']): r['nps'] for r in results}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def compareBaseline(results, path, tolerance=0.1):
+    # lista de (nome, nps atual, nps da base, razão) das posições mais lentas que a tolerância
+    with open(path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for r in results:
+        old = baseline.get('%s:%d' % (r['name'], r['depth']))
+        if old and r['nps'] < old * (1 - tolerance):
+            regressions.append((r['name'], r['nps'], old, r['nps'] / old))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perft do ChessEngine')
+    parser.add_argument('--fen', help='posição a analisar (padrão: posições de referência)')
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    parser.add_argument('--divide', action='store_true', help='nós por movimento da raiz')
+    parser.add_argument('--positions', nargs='*', choices=sorted(POSITIONS))
+    parser.add_argument('--cache', action='store_true', help='liga o cache de movimentos do GameState')
+    parser.add_argument('--save-baseline', metavar='ARQ')
+    parser.add_argument('--baseline', metavar='ARQ', help='compara os nós/s com uma base salva')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.fen or args.divide:
+        gs = newGameState(args.fen or ChessEngine.STARTING_FEN, args.cache)
+        if args.divide:
+            start = time.perf_counter()
+            counts = divide(gs, args.depth)
+            elapsed = time.perf_counter() - start
+            for notation in sorted(counts):
+                print('%s: %d' % (notation, counts[notation]))
+            nodes = sum(counts.values())
+        else:
+            nodes, elapsed, _ = timedPerft(gs, args.depth)
+        print('\nnós: %d  tempo: %.3fs  nós/s: %.0f' % (nodes, elapsed, nodes / max(elapsed, 1e-9)))
+        return 0
+
+    results = runSuite(args.depth, args.positions, args.cache)
+    failed = False
+    for r in results:
+        status = 'ok' if r['nodes'] == r['expected'] else 'ERRO (esperado %d)' % r['expected']
+        failed = failed or r['nodes'] != r['expected']
+        print('%-10s prof %d  nós %9d  %7.3fs  %9.0f nós/s  %s' % (
+            r['name'], r['depth'], r['nodes'], r['seconds'], r['nps'], status))
+
+    if args.save_baseline:
+        saveBaseline(results, args.save_baseline)
+    if args.baseline:
+        regressions = compareBaseline(results, args.baseline, args.tolerance)
+        for name, nps, old, ratio in regressions:
+            print('REGRESSÃO %s: %.0f nós/s (base %.0f, %.0f%%)' % (name, nps, old, ratio * 100))
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
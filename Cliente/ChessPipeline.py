@@ -0,0 +1,168 @@
+''' Processamento em lote de posições em FEN ou EPD, uma por linha, em fluxo: as linhas são lidas
+aos poucos, agrupadas em fatias e cada fatia passa pelas operações pedidas (movimentos legais,
+xeque/mate/afogamento, perft e avaliação estática) num processo, e os resultados saem na ordem da
+entrada assim que ficam prontos. Só algumas fatias ficam em memória ao mesmo tempo, então arquivos
+de dezenas de milhões de linhas (também .gz) passam com memória constante.
+
+Uso: python ChessPipeline.py ENTRADA [-o SAIDA] [--ops moves,flags,perft,eval] [--depth N]
+                             [--workers N] [--chunk N] [--format json|epd] '''
+
+import argparse
+import gzip
+import itertools
+import json
+import sys
+
+import ChessAI
+import ChessEngine
+import ChessParallel
+import ChessPerft
+
+OPERATIONS = ('moves', 'flags', 'perft', 'eval')
+
+
+def openText(path, mode='r'):  # '-' é a entrada/saída padrão; .gz é lido e gravado comprimido
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+def readLines(lines):
+    # gera (número da linha, texto) sem as linhas vazias e os comentários ('#')
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def chunks(items, size):  # listas de até size itens, consumindo items aos poucos
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def loadLine(gs, text):
+    # FEN completa (seis campos, os dois últimos números) ou EPD; devolve as operações da EPD
+    fields = text.split()
+    if len(fields) == 6 and fields[4].isdigit() and fields[5].isdigit():
+        gs.loadFEN(text)
+        return {}
+    return gs.loadEPD(text)
+
+
+def analyse(gs, operations, depth=1):
+    # as operações pedidas na posição de gs, num dicionário
+    result = {}
+    moves = gs.getValidMoves() if 'moves' in operations or 'flags' in operations else None
+    if 'moves' in operations:
+        result['moves'] = [move.getChessNot() for move in moves]
+    if 'flags' in operations:
+        check = gs.inCheck()
+        result['check'] = check
+        result['checkmate'] = check and not moves
+        result['stalemate'] = not check and not moves
+    if 'perft' in operations:
+        result['perft'] = ChessPerft.perft(gs, depth)
+    if 'eval' in operations:
+        result['eval'] = ChessAI.evaluate(gs)  # centipeões, do ponto de vista de quem joga
+    gs.checkMate = gs.stalemate = False
+    return result
+
+
+def processChunk(lines, operations=OPERATIONS, depth=1):
+    # processo filho (ou o próprio, com um só worker): uma fatia de (número, texto) -> registros.
+    # Uma linha inválida vira um registro com 'error' em vez de parar o lote
+    gs = ChessEngine.GameState(moveCacheSize=0)
+    records = []
+    for number, text in lines:
+        try:
+            epd = loadLine(gs, text)
+            record = {'line': number, 'fen': gs.getFEN()}
+            if epd:
+                record['epd'] = epd
+            record.update(analyse(gs, operations, depth))
+        except (ValueError, KeyError, IndexError) as error:
+            records.append({'line': number, 'error': str(error)})
+            gs = ChessEngine.GameState(moveCacheSize=0)  # a falha pode ter deixado a posição pela metade
+            continue
+        expected = epd.get('D%d' % depth)
+        if 'perft' in record and expected:  # suítes de perft em EPD trazem 'D1 20; D2 400; ...'
+            record['perftOk'] = record['perft'] == int(expected[0])
+        records.append(record)
+    return records
+
+
+def runPipeline(lines, operations=OPERATIONS, depth=1, workers=1, chunkSize=1000):
+    # gera os registros na ordem da entrada. Com mais de um worker as fatias vão para processos
+    # (ChessParallel.orderedBatch), com poucas fatias na fila de cada vez
+    batches = chunks(readLines(lines), chunkSize)
+    if workers <= 1:
+        results = (processChunk(batch, operations, depth) for batch in batches)
+    else:
+        results = ChessParallel.orderedBatch(processChunk, batches, workers, operations=operations, depth=depth)
+    for records in results:
+        yield from records
+
+
+def formatRecord(record, outputFormat='json'):
+    if outputFormat == 'json':
+        return json.dumps(record, ensure_ascii=False)
+    # EPD: a posição com as operações de entrada e os resultados como operações
+    if 'error' in record:
+        return '# linha %d: %s' % (record['line'], record['error'])
+    operations = dict(record.get('epd', {}))
+    if 'moves' in record:
+        operations['legal'] = [len(record['moves'])]
+    if 'checkmate' in record:
+        operations['status'] = ['checkmate' if record['checkmate'] else 'stalemate' if record['stalemate']
+                                else 'check' if record['check'] else 'none']
+    if 'perft' in record:
+        operations['perft'] = [record['perft']]
+    if 'eval' in record:
+        operations['ce'] = [record['eval']]
+    # os quatro primeiros campos da FEN já são a posição da EPD
+    epd = ' '.join(record['fen'].split()[:4])
+    return epd + ' ' + ChessEngine.formatEPDOperations(operations) if operations else epd
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Processa arquivos de posições FEN/EPD em lote')
+    parser.add_argument('input', help="arquivo com uma posição por linha ('-' para a entrada padrão)")
+    parser.add_argument('-o', '--output', default='-')
+    parser.add_argument('--ops', default='moves,flags',
+                        help='operações separadas por vírgula: %s' % ','.join(OPERATIONS))
+    parser.add_argument('--depth', type=int, default=1, help='profundidade do perft')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk', type=int, default=1000, help='posições por fatia enviada a um processo')
+    parser.add_argument('--format', choices=('json', 'epd'), default='json')
+    args = parser.parse_args(argv)
+
+    operations = tuple(op for op in args.ops.split(',') if op)
+    unknown = [op for op in operations if op not in OPERATIONS]
+    if unknown:
+        parser.error('operações desconhecidas: %s' % ','.join(unknown))
+
+    count = errors = 0
+    source = openText(args.input)
+    out = openText(args.output, 'w')
+    try:
+        for record in runPipeline(source, operations, args.depth, args.workers, args.chunk):
+            out.write(formatRecord(record, args.format) + '\n')
+            count += 1
+            errors += 'error' in record
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print('%d posições, %d com erro' % (count, errors), file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+''' Cálculo antecipado na vez do adversário: enquanto ele pensa, um processo separado (sem disputar
+o GIL com a interface) gera, para cada resposta possível dele, os movimentos válidos da posição que
+vai ficar e uma sugestão de lance com uma busca curta. Quando o lance chega, os movimentos dessa
+posição já estão no moveCache do GameState e getValidMoves não gera nada.
+
+As posições viajam como getPosition() e os movimentos como Move.encode(); o hash de Zobrist tem
+semente fixa, então o mesmo hash vale nos dois processos '''
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import ChessAI
+import ChessEngine
+
+HINT_TIME = 1.0  # segundos de busca divididos entre todas as respostas do adversário
+
+
+def replyMoves(position):
+    # processo filho: {hash depois da resposta: (movimentos codificados, xeque-mate, afogamento)}
+    gs = ChessEngine.GameState(moveCacheSize=0)
+    gs.setPosition(*position)
+    replies = {}
+    for reply in gs.getValidMoves():
+        gs.makeMove(reply)
+        moves = gs.getValidMoves()
+        checkMate = not moves and gs.inCheck()
+        replies[gs.zobristKey] = ([m.encode() for m in moves], checkMate, not moves and not checkMate)
+        gs.checkMate = gs.stalemate = False
+        gs.undoMove()
+    return replies
+
+
+def replyHints(position, hintTime=HINT_TIME):
+    # processo filho: {hash depois da resposta: (melhor lance codificado, valor)} com uma busca curta
+    gs = ChessEngine.GameState()
+    gs.setPosition(*position)
+    replies = gs.getValidMoves()
+    searcher = ChessAI.Searcher(maxTime=hintTime / max(len(replies), 1))
+    hints = {}
+    for reply in replies:
+        gs.makeMove(reply)
+        result = searcher.search(gs)
+        if result is not None:
+            hints[gs.zobristKey] = (result.bestMove.encode(), result.score)
+        gs.undoMove()
+    return hints
+
+
+class Ponderer():
+    def __init__(self, hintTime=HINT_TIME):
+        self.hintTime = hintTime  # None: só os movimentos válidos, sem sugestões
+        self.executor = None  # criado no primeiro uso
+        self.key = None  # hash da posição que está sendo calculada
+        self.moves = None  # futures dos dois cálculos
+        self.hints = None
+        self.primed = False
+
+    def start(self, gs):
+        # chamada na vez do adversário; não faz nada se a posição já está sendo calculada
+        if gs.zobristKey == self.key:
+            return
+        self.cancel()
+        if self.executor is None:
+            # dois processos: os movimentos de uma posição nova não esperam as sugestões da anterior.
+            # spawn porque a interface tem threads (socket) e o fork copiaria o estado delas
+            self.executor = ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('spawn'))
+        position = gs.getPosition()
+        self.key = gs.zobristKey
+        self.primed = False
+        self.moves = self.executor.submit(replyMoves, position)
+        if self.hintTime:
+            self.hints = self.executor.submit(replyHints, position, self.hintTime)
+
+    def prime(self, gs):
+        # chamada logo depois do lance do adversário, antes do getValidMoves: se o cálculo já
+        # terminou, coloca no cache os movimentos de todas as respostas (nunca espera)
+        if self.primed or self.moves is None or not self.moves.done() or gs.moveCache is None:
+            return False
+        if self.moves.cancelled() or self.moves.exception() is not None:
+            return False
+        for key, (codes, checkMate, stalemate) in self.moves.result().items():
+            gs.moveCache.put(key, (tuple(ChessEngine.Move.decode(code) for code in codes), checkMate, stalemate))
+        self.primed = True
+        return True
+
+    def hint(self, gs):  # (Move sugerido, valor) para a posição atual, ou None se ainda não há
+        if self.hints is None or not self.hints.done() or self.hints.cancelled() or self.hints.exception():
+            return None
+        hint = self.hints.result().get(gs.zobristKey)
+        if hint is None:
+            return None
+        return ChessEngine.Move.decode(hint[0]), hint[1]
+
+    def cancel(self):  # descarta o cálculo da posição anterior (o que já está rodando só é ignorado)
+        for future in (self.moves, self.hints):
+            if future is not None:
+                future.cancel()
+        self.key = None
+
+    def close(self):
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,94 @@
+''' Imagens das peças num atlas: as 12 figuras lado a lado numa única imagem (images/atlas.png),
+montada a partir dos PNGs na primeira vez. O atlas é lido e convertido para o formato da tela uma
+vez só; cada tamanho de casa é gerado com smoothscale no primeiro pedido e guardado em memória, e
+opcionalmente em disco (images/cache/atlas-N.png) para a próxima abertura não refazer a escala.
+
+Os caminhos são relativos ao módulo, não à pasta de onde o cliente foi aberto '''
+
+import os
+
+import pygame as p
+
+PIECES = ("wP", "wR", "wN", "wB", "wQ", "wK", "bP", "bR", "bN", "bB", "bQ", "bK")
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+
+
+def piecePath(imageDir, piece):
+    # os arquivos dos peões estão em minúscula (wp.png, bp.png)
+    path = os.path.join(imageDir, piece + '.png')
+    if not os.path.exists(path):
+        path = os.path.join(imageDir, piece[0] + piece[1].lower() + '.png')
+    return path
+
+
+def _newer(path, sources):  # path existe e não é mais velho que nenhum dos arquivos de origem
+    if not os.path.exists(path):
+        return False
+    mtime = os.path.getmtime(path)
+    return all(os.path.exists(source) and os.path.getmtime(source) <= mtime for source in sources)
+
+
+def _save(surface, path):  # gravar o cache é opcional: sem permissão na pasta, segue sem ele
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        p.image.save(surface, path)
+    except (OSError, p.error):
+        pass
+
+
+def buildAtlas(imageDir=IMAGE_DIR):
+    # junta as 12 figuras numa faixa horizontal, na ordem de PIECES, com o tamanho da maior
+    pieces = [p.image.load(piecePath(imageDir, piece)) for piece in PIECES]
+    cell = max(max(image.get_size()) for image in pieces)
+    atlas = p.Surface((cell * len(PIECES), cell), p.SRCALPHA)
+    for i, image in enumerate(pieces):
+        atlas.blit(image, (i * cell + (cell - image.get_width()) // 2, (cell - image.get_height()) // 2))
+    return atlas
+
+
+class SpriteAtlas():
+    def __init__(self, imageDir=IMAGE_DIR, diskCache=True):
+        self.imageDir = imageDir
+        self.diskCache = diskCache  # grava/lê as versões escaladas em images/cache
+        self.atlas = None  # lido no primeiro pedido: convert_alpha precisa da janela aberta
+        self.sizes = {}  # tamanho da casa -> {peça: Surface}
+
+    def sources(self):
+        return [piecePath(self.imageDir, piece) for piece in PIECES]
+
+    def load(self):
+        if self.atlas is not None:
+            return self.atlas
+        path = os.path.join(self.imageDir, 'atlas.png')
+        if _newer(path, self.sources()):
+            atlas = p.image.load(path)
+        else:
+            atlas = buildAtlas(self.imageDir)
+            _save(atlas, path)
+        self.atlas = atlas.convert_alpha()
+        return self.atlas
+
+    def sprites(self, size):
+        # {peça: Surface size x size} no formato da tela; o mesmo dicionário para o mesmo tamanho
+        sprites = self.sizes.get(size)
+        if sprites is None:
+            strip = self.scaled(size)
+            sprites = {piece: strip.subsurface((i * size, 0, size, size)) for i, piece in enumerate(PIECES)}
+            self.sizes[size] = sprites
+        return sprites
+
+    def scaled(self, size):  # o atlas inteiro com casas de size pixels
+        path = os.path.join(self.imageDir, 'cache', 'atlas-%d.png' % size)
+        atlas = self.load()
+        if self.diskCache and _newer(path, [os.path.join(self.imageDir, 'atlas.png')]):
+            strip = p.image.load(path).convert_alpha()
+            if strip.get_size() == (size * len(PIECES), size):
+                return strip
+        strip = p.transform.smoothscale(atlas, (size * len(PIECES), size)).convert_alpha()
+        if self.diskCache:
+            _save(strip, path)
+        return strip
+
+    def precompute(self, sizes):  # gera (e grava, com diskCache) os tamanhos pedidos de uma vez
+        for size in sizes:
+            self.sprites(size)
@@ -0,0 +1,378 @@
+''' Tablebases de finais com três peças (rei e uma peça contra rei: KQK, KRK, KPK, KBK, KNK) geradas
+por análise retrógrada com a geração de movimentos legais dos bitboards do motor.
+
+Cada final é um arquivo com um byte por posição, para os dois lados jogarem: 0 empate, 1-127 quem
+joga dá mate em tantos meio-lances, 128+n quem joga leva mate em n meio-lances, 255 posição ilegal.
+O lado com a peça é sempre guardado como brancas (as pretas são espelhadas na vertical) e as
+simetrias do tabuleiro reduzem o índice: sem peão o rei forte fica num triângulo de 10 casas
+(a1-d1-d4), com peão só vale o espelho horizontal e o peão fica nas colunas a-d.
+A consulta é uma conta de índice e a leitura de um byte '''
+
+import argparse
+import array
+import os
+import struct
+import sys
+import time
+
+import ChessBitboard
+import ChessEngine
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+ENDINGS = ('KQK', 'KRK', 'KPK', 'KBK', 'KNK')  # KPK depende do KQK (promoção)
+
+_header = struct.Struct('>4sB3s')  # 'FNTB', versão, final
+MAGIC = b'FNTB'
+VERSION = 1
+
+# resultado para quem joga
+WIN, DRAW, LOSS = 1, 0, -1
+
+ILLEGAL = 255
+_UNKNOWN = 254  # só durante a geração: posição legal ainda sem resultado
+
+# as 8 simetrias do tabuleiro como tabelas casa -> casa (a identidade primeiro)
+_SYMMETRIES = []
+for _flipRow in (False, True):
+    for _flipCol in (False, True):
+        for _transpose in (False, True):
+            _mapping = []
+            for _sq in range(64):
+                _r, _c = _sq >> 3, _sq & 7
+                if _flipRow:
+                    _r = 7 - _r
+                if _flipCol:
+                    _c = 7 - _c
+                if _transpose:
+                    _r, _c = _c, _r
+                _mapping.append(_r * 8 + _c)
+            _SYMMETRIES.append(_mapping)
+
+# triângulo do rei forte: casas a1-d1-d4 (linha 7 = primeira fileira)
+_TRIANGLE = [sq for sq in range(64) if (sq >> 3) >= 4 and (sq & 7) <= 3 and 7 - (sq >> 3) <= (sq & 7)]
+_triangleIndex = {sq: i for i, sq in enumerate(_TRIANGLE)}
+# para cada casa do rei forte, a simetria que leva o rei ao triângulo
+_kingSymmetry = [next(m for m in _SYMMETRIES if m[sq] in _triangleIndex) for sq in range(64)]
+
+_MIRROR = [(sq & ~7) | (7 - (sq & 7)) for sq in range(64)]  # espelho horizontal (peões)
+_IDENTITY = list(range(64))
+# casas possíveis do peão depois do espelho: linhas 1-6, colunas a-d
+_pawnIndex = {sq: ((sq >> 3) - 1) * 4 + (sq & 7) for sq in range(8, 56) if (sq & 7) <= 3}
+
+
+def tableSize(kind):
+    return 2 * 64 * 64 * 24 if kind == 'P' else 2 * len(_TRIANGLE) * 64 * 64
+
+
+def index(kind, blackToMove, strongKing, weakKing, piece):
+    # índice da posição (lado forte = brancas) já reduzida pelas simetrias
+    if kind == 'P':
+        m = _MIRROR if piece & 7 > 3 else _IDENTITY
+        return ((blackToMove * 64 + m[strongKing]) * 64 + m[weakKing]) * 24 + _pawnIndex[m[piece]]
+    m = _kingSymmetry[strongKing]
+    return ((blackToMove * len(_TRIANGLE) + _triangleIndex[m[strongKing]]) * 64 + m[weakKing]) * 64 + m[piece]
+
+
+def _positions(kind):
+    # (índice, lado, rei forte, rei fraco, peça) de todas as entradas da tabela
+    if kind == 'P':
+        for blackToMove in (0, 1):
+            for strongKing in range(64):
+                for weakKing in range(64):
+                    for piece in _pawnIndex:
+                        yield (index(kind, blackToMove, strongKing, weakKing, piece), blackToMove,
+                               strongKing, weakKing, piece)
+    else:
+        for blackToMove in (0, 1):
+            for strongKing in _TRIANGLE:
+                for weakKing in range(64):
+                    for piece in range(64):
+                        yield (index(kind, blackToMove, strongKing, weakKing, piece), blackToMove,
+                               strongKing, weakKing, piece)
+
+
+def decode(value):  # byte da tabela -> (resultado, meio-lances até o mate)
+    if value == 0:
+        return DRAW, 0
+    if value < 128:
+        return WIN, value
+    return LOSS, value - 128
+
+
+def generate(kind, queens=None, progress=None):
+    # gera a tabela do final K + peça contra K; para o KPK, queens é a tabela do KQK (promoção).
+    # Cada posição legal guarda quantos movimentos tem e as arestas (filho -> pai) ficam em vetores
+    # compactos; os resultados se propagam dos mates para trás, uma camada de meio-lance por vez
+    size = tableSize(kind)
+    values = array.array('B', [ILLEGAL]) * size
+    counts = array.array('H', [0]) * size
+    childOf = array.array('I')
+    parentOf = array.array('I')
+    layers = [[]]  # layers[n]: posições resolvidas com n meio-lances até o mate
+    external = {}  # n -> pais com um filho fora da tabela (promoção) perdido em n meio-lances
+    strong, weak = 'wK', 'bK'
+    piece = 'w' + kind
+    position = ChessBitboard.BitboardPosition()
+    kingAttacks = ChessBitboard.KING_ATTACKS
+
+    for i, (idx, blackToMove, strongKing, weakKing, sq) in enumerate(_positions(kind)):
+        if progress is not None and not i & 0xFFFF:
+            progress(i)
+        if strongKing == weakKing or sq in (strongKing, weakKing):
+            continue
+        if kingAttacks[strongKing] >> weakKing & 1:
+            continue  # reis vizinhos
+        position.setSquare(strongKing, strong)
+        position.setSquare(weakKing, weak)
+        position.setSquare(sq, piece)
+        try:
+            if not blackToMove and position.attackersTo(weakKing, 'w'):
+                continue  # o rei de quem não joga está em xeque
+            moves = position.generateLegalMoves(not blackToMove)
+            if not moves:
+                if position.attackersTo(strongKing if not blackToMove else weakKing, 'b' if not blackToMove else 'w'):
+                    values[idx] = 128  # xeque-mate
+                    layers[0].append(idx)
+                else:
+                    values[idx] = 0  # afogado
+                continue
+            values[idx] = _UNKNOWN
+            children = 0
+            for start, end, _, _ in moves:
+                if blackToMove:
+                    if end == sq:
+                        children += 1  # o rei fraco captura a peça: empate, o contador nunca zera
+                        continue
+                    child = index(kind, 0, strongKing, end, sq)
+                elif start == sq and kind == 'P' and end < 8:
+                    result, plies = decode(queens[index('Q', 1, strongKing, weakKing, end)])
+                    if result == LOSS:
+                        external.setdefault(plies, []).append(idx)
+                    children += 1
+                    continue
+                elif start == strongKing:
+                    child = index(kind, 1, end, weakKing, sq)
+                else:
+                    child = index(kind, 1, strongKing, weakKing, end)
+                childOf.append(child)
+                parentOf.append(idx)
+                children += 1
+            counts[idx] = children
+        finally:
+            position.setSquare(strongKing, ChessBitboard.EMPTY)
+            position.setSquare(weakKing, ChessBitboard.EMPTY)
+            position.setSquare(sq, ChessBitboard.EMPTY)
+
+    # arestas agrupadas por filho (ordenação por contagem): pais de c = parents[first[c]:first[c + 1]]
+    first = array.array('I', [0]) * (size + 1)
+    for child in childOf:
+        first[child + 1] += 1
+    for i in range(size):
+        first[i + 1] += first[i]
+    parents = array.array('I', [0]) * len(childOf)
+    fill = array.array('I', first)
+    for child, parent in zip(childOf, parentOf):
+        parents[fill[child]] = parent
+        fill[child] += 1
+    del childOf, parentOf, fill
+
+    plies = 0
+    while plies < len(layers) or any(n >= plies for n in external):
+        if plies == len(layers):
+            layers.append([])
+        nextLayer = []
+        # um filho perdido resolve o pai como vitória; um filho ganho só desconta um movimento e o
+        # pai perde quando todos os filhos são vitórias do adversário (o último é o mais longo)
+        for parent in external.pop(plies, ()):
+            if values[parent] == _UNKNOWN:
+                values[parent] = plies + 1
+                nextLayer.append(parent)
+        for child in layers[plies]:
+            lost = values[child] >= 128
+            for k in range(first[child], first[child + 1]):
+                parent = parents[k]
+                if values[parent] != _UNKNOWN:
+                    continue
+                if lost:
+                    values[parent] = plies + 1
+                    nextLayer.append(parent)
+                else:
+                    counts[parent] -= 1
+                    if not counts[parent]:
+                        values[parent] = 128 + plies + 1
+                        nextLayer.append(parent)
+        plies += 1
+        if nextLayer:
+            if plies == len(layers):
+                layers.append([])
+            layers[plies].extend(nextLayer)
+
+    for idx in range(size):
+        if values[idx] == _UNKNOWN:
+            values[idx] = 0  # nunca resolvida: empate
+    return bytes(values)
+
+
+def tablePath(directory, ending):
+    return os.path.join(directory, ending + '.tb')
+
+
+def writeTable(path, ending, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(_header.pack(MAGIC, VERSION, ending.encode()))
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def readTable(path, ending):  # bytes da tabela, ou None se o arquivo não existe ou não confere
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) != _header.size + tableSize(ending[1]) or \
+            _header.unpack_from(data) != (MAGIC, VERSION, ending.encode()):
+        return None
+    return data[_header.size:]
+
+
+class Tablebase():
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self.tables = {}  # peça -> bytes da tabela (None se não há arquivo), lidas no primeiro uso
+
+    def table(self, kind):
+        if kind not in self.tables:
+            self.tables[kind] = readTable(tablePath(self.directory, 'K' + kind + 'K'), 'K' + kind + 'K')
+        return self.tables[kind]
+
+    def probe(self, gs):
+        # (WIN | DRAW | LOSS para quem joga, meio-lances até o mate) ou None fora das tabelas
+        if gs.useBitboards:
+            bitboards = gs.bitboards
+            count = ChessBitboard.popCount(bitboards.occupied)
+            if count != 3:
+                return (DRAW, 0) if count == 2 else None  # só os reis: empate
+            squares = bitboards.squares
+            found = list(ChessBitboard.iterBits(bitboards.occupied))
+        else:
+            squares = [piece for row in gs.board for piece in row]
+            found = [sq for sq in range(64) if squares[sq] != '--']
+            if len(found) != 3:
+                return (DRAW, 0) if len(found) == 2 else None
+        strongKing = weakKing = sq = None
+        for s in found:
+            if squares[s][1] != 'K':
+                sq = s
+        colour, kind = squares[sq]
+        for s in found:
+            if squares[s][1] == 'K':
+                if squares[s][0] == colour:
+                    strongKing = s
+                else:
+                    weakKing = s
+        if strongKing is None or weakKing is None:
+            return None
+        table = self.table(kind)
+        if table is None:
+            return None
+        rights = gs.currentCastlingRight
+        if kind == 'R' and (rights.wks or rights.wqs if colour == 'w' else rights.bks or rights.bqs):
+            return None  # o roque não existe nas tabelas
+        if colour == 'b':  # guarda o lado forte como brancas
+            strongKing, weakKing, sq = strongKing ^ 56, weakKing ^ 56, sq ^ 56
+        blackToMove = 0 if gs.whiteToMove == (colour == 'w') else 1
+        value = table[index(kind, blackToMove, strongKing, weakKing, sq)]
+        if value == ILLEGAL:
+            return None
+        return decode(value)
+
+    def bestMove(self, gs):
+        # (movimento, resultado, meio-lances) que mantém o resultado da posição pelo caminho mais
+        # curto (ou mais longo, perdendo), ou None fora das tabelas
+        root = self.probe(gs)
+        if root is None:
+            return None
+        checkMate, stalemate = gs.checkMate, gs.stalemate
+        best, bestKey = None, None
+        try:
+            for move in gs.getValidMoves():
+                gs.makeMove(move)
+                try:
+                    child = self.probe(gs)
+                finally:
+                    gs.undoMove()
+                if child is None:
+                    continue
+                result, plies = -child[0], child[1] + 1
+                # vitória mais curta, depois empate, depois derrota mais longa
+                key = (result, -plies if result == WIN else plies)
+                if bestKey is None or key > bestKey:
+                    best, bestKey = move, key
+        finally:
+            gs.checkMate, gs.stalemate = checkMate, stalemate
+        if best is None:
+            return None
+        return best, root[0], root[1]
+
+
+def defaultTablebase():  # tabelas ao lado do módulo; sem os arquivos toda consulta volta None
+    return Tablebase(DEFAULT_DIR)
+
+
+def build(directory=DEFAULT_DIR, endings=ENDINGS, verbose=True):
+    os.makedirs(directory, exist_ok=True)
+    queens = None
+    for ending in endings:
+        kind = ending[1]
+        if kind == 'P' and queens is None:
+            queens = readTable(tablePath(directory, 'KQK'), 'KQK')
+            if queens is None:
+                queens = generate('Q')
+                writeTable(tablePath(directory, 'KQK'), 'KQK', queens)
+        start = time.perf_counter()
+        data = generate(kind, queens)
+        writeTable(tablePath(directory, ending), ending, data)
+        if kind == 'Q':
+            queens = data
+        if verbose:
+            longest = max((v for v in data if v < 128), default=0)
+            print('%s  %7d posições  %6d legais  mate mais longo %2d meio-lances  %.1fs' % (
+                ending, len(data), sum(1 for v in data if v != ILLEGAL), longest, time.perf_counter() - start))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tablebases de finais com três peças')
+    sub = parser.add_subparsers(dest='command', required=True)
+    generateParser = sub.add_parser('build', help='gera as tabelas')
+    generateParser.add_argument('--dir', default=DEFAULT_DIR)
+    generateParser.add_argument('endings', nargs='*', default=list(ENDINGS), metavar='FINAL')
+    probeParser = sub.add_parser('probe', help='resultado de uma posição')
+    probeParser.add_argument('fen')
+    probeParser.add_argument('--dir', default=DEFAULT_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        unknown = [e for e in args.endings if e not in ENDINGS]
+        if unknown:
+            parser.error('finais desconhecidos: %s' % ' '.join(unknown))
+        build(args.dir, args.endings)
+        return 0
+
+    gs = ChessEngine.GameState(moveCacheSize=0)
+    gs.loadFEN(args.fen)
+    tablebase = Tablebase(args.dir)
+    hit = tablebase.bestMove(gs)
+    if hit is None:
+        print('fora das tabelas')
+        return 1
+    move, result, plies = hit
+    if result == DRAW:
+        print('empate, melhor %s' % gs.getSAN(move))
+    else:
+        print('%s em %d meio-lances, melhor %s' % ('dá mate' if result == WIN else 'leva mate', plies,
+                                                   gs.getSAN(move)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
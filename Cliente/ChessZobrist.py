@@ -0,0 +1,68 @@
+''' Hash de Zobrist de 64 bits para as posições do GameState e cache limitado (LRU)
+dos movimentos válidos indexado por esse hash '''
+
+import random
+from collections import OrderedDict
+
+import ChessBitboard
+
+# semente fixa: o mesmo hash para a mesma posição em qualquer processo (tabelas de busca, livros, etc.)
+_rng = random.Random(0x5EED)
+
+PIECE_KEYS = {piece: [_rng.getrandbits(64) for _ in range(64)] for piece in ChessBitboard.PIECES}
+PIECE_KEYS[ChessBitboard.EMPTY] = [0] * 64
+SIDE_KEY = _rng.getrandbits(64)  # aplicado quando é a vez das brancas
+CASTLE_KEYS = [_rng.getrandbits(64) for _ in range(16)]
+ENPASSANT_KEYS = [_rng.getrandbits(64) for _ in range(64)]
+
+
+def castleIndex(rights):  # os quatro direitos de roque em um número de 0 a 15
+    return rights.wks | (rights.bks << 1) | (rights.wqs << 2) | (rights.bqs << 3)
+
+
+def enpassantKey(enpassantPossible):
+    if enpassantPossible:
+        return ENPASSANT_KEYS[enpassantPossible[0] * 8 + enpassantPossible[1]]
+    return 0
+
+
+def computeHash(board, whiteToMove, rights, enpassantPossible):  # hash completo, do zero
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            key ^= PIECE_KEYS[board[r][c]][r * 8 + c]
+    if whiteToMove:
+        key ^= SIDE_KEY
+    return key ^ CASTLE_KEYS[castleIndex(rights)] ^ enpassantKey(enpassantPossible)
+
+
+class PositionCache():
+    # cache LRU: guarda no máximo maxSize posições e descarta a usada há mais tempo
+    def __init__(self, maxSize=4096):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
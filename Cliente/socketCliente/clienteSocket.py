@@ -1,14 +1,21 @@
+import collections
 import threading
 import socket
+import time
+
+from socketCliente import protocol
 
 HOST = '127.0.0.1'
 PORT = 5555
+RECONNECT_ATTEMPTS = 5  # tentativas de voltar à partida quando a conexão cai
+MAX_REDIRECTS = 3  # REDIRECTs seguidos aceitos no handshake
 clients = []
 
 
 class socketClient:
 
-    def __init__(self) -> None:
+    def __init__(self, connect=True, watch=None) -> None:
+        # watch: id da partida para assistir como espectador (0 = a partida com mais espectadores)
 
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.board = [
@@ -20,49 +27,155 @@ class socketClient:
             ["--", "--", "--", "--", "--", "--", "--", "--"],
             ["--", "--", "--", "--", "--", "--", "--", "--"],
             ["--", "--", "--", "--", "--", "--", "--", "--"],]
-        self.whiteToMove = True
         self.player = ''
         self.turn = True
-        self.playerClicks = []
+        self.receivedMoves = collections.deque()  # (casa inicial, casa final) ainda não aplicados
+        self.gameId = 0
+        self.token = 0
+        self.gameOver = None  # (resultado, motivo) quando o servidor encerra a partida
+        # posição completa do servidor ainda não aplicada no GameState: chega ao entrar, ao voltar
+        # para a partida e quando o servidor recusa um movimento
+        self.snapshot = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.disconnected = False  # a conexão caiu e não foi possível voltar para a partida
+        # chamado pela thread de leitura sempre que chega algo para a interface (lance, posição,
+        # fim de partida ou queda da conexão); não deve bloquear
+        self.listener = None
+
+        if not connect:  # sem servidor (análise, perft, testes)
+            return
 
         try:
             self.client.connect((HOST, PORT))
         except:
+            self.disconnected = True
             return print('\nNão foi possívvel se conectar ao servidor!\n')
 
         print('\nConectado')
 
-        self.player = self.client.recv(4096).decode('utf-8')
-        if self.player != '0':
-            self.turn = False
-
-        board = eval(self.client.recv(4096).decode('utf-8'))
-        self.board = board
+        try:
+            if watch is None:
+                self.handshake(protocol.PLAY)
+            else:
+                self.gameId = watch
+                self.handshake(protocol.WATCH)
+        except (OSError, protocol.ProtocolError):
+            # o servidor recusou a entrada (partida inexistente, nenhuma partida para assistir) ou
+            # fechou a conexão: o cliente abre sem partida, como se estivesse desconectado
+            self.client.close()
+            self.disconnected = True
+            return print('\nO servidor recusou a conexão!\n')
 
-        leitor = threading.Thread(target=self.receiveMessages)
+        leitor = threading.Thread(target=self.receiveMessages, daemon=True)
         leitor.start()
 
+    def handshake(self, mode):
+        # apresentação: o servidor responde com o número do jogador e a posição completa, ou manda
+        # para a porta do processo que tem a partida (ou, para PLAY, a sala com o adversário
+        # esperando; ela pode ter sido ocupada no caminho e haver um novo REDIRECT)
+        self.client.sendall(protocol.encodeHello(mode, self.gameId, self.token))
+        msgType, payload = protocol.readFrame(self.client)
+        for attempt in range(MAX_REDIRECTS):
+            if msgType != protocol.REDIRECT:
+                break
+            port = protocol.decodeRedirect(payload)
+            self.client.close()
+            self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.client.connect((HOST, port))
+            self.client.sendall(protocol.encodeHello(mode, self.gameId, self.token))
+            msgType, payload = protocol.readFrame(self.client)
+        if msgType != protocol.WELCOME:
+            raise protocol.ProtocolError('esperava WELCOME')
+        player, self.gameId, self.token = protocol.decodeWelcome(payload)
+        self.player = str(player)
+
+        msgType, payload = protocol.readFrame(self.client)
+        if msgType != protocol.SNAPSHOT:
+            raise protocol.ProtocolError('esperava SNAPSHOT')
+        self.setSnapshot(protocol.decodeSnapshot(payload))
+
+    def setSnapshot(self, snapshot):
+        board, whiteToMove, castling, enpassant, ply = snapshot
+        with self.lock:
+            self.board = board
+            self.snapshot = snapshot
+            self.receivedMoves.clear()
+            # espectadores nunca jogam
+            self.turn = self.player in ('0', '1') and (self.player == '0') == whiteToMove
+
+    def takeSnapshot(self):  # devolve a posição pendente (ou None) e limpa
+        with self.lock:
+            snapshot, self.snapshot = self.snapshot, None
+        return snapshot
+
+    def takeMoves(self):  # devolve os lances recebidos ainda não aplicados e limpa
+        with self.lock:
+            moves = list(self.receivedMoves)
+            self.receivedMoves.clear()
+        return moves
+
+    def setTurn(self, turn):  # a thread de leitura também muda a vez (no snapshot)
+        with self.lock:
+            self.turn = turn
+
+    def setListener(self, listener):
+        self.listener = listener
+
+    def notify(self):
+        if self.listener is not None:
+            self.listener()
+
+    def isSpectator(self):
+        return self.player == str(protocol.SPECTATOR)
+
+    def reconnect(self):
+        # volta para a mesma partida com o id e o token recebidos no WELCOME (espectadores só com o
+        # id); o servidor devolve a posição atual num único snapshot
+        for attempt in range(RECONNECT_ATTEMPTS):
+            self.client.close()
+            self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                self.client.connect((HOST, PORT))
+                self.handshake(protocol.WATCH if self.isSpectator() else protocol.RESUME)
+                return True
+            except (OSError, protocol.ProtocolError):
+                time.sleep(0.5 * (attempt + 1))
+        return False
+
     def receiveMessages(self):
-        while True:
+        while self.gameOver is None:
 
             try:
-                board = eval(self.client.recv(4096).decode('utf-8'))
-                self.playerClicks = board
-                print('recebido')
+                msgType, payload = protocol.readFrame(self.client)
+                if msgType == protocol.MOVE:
+                    # lance já validado pelo servidor (do adversário ou, para espectadores, dos dois)
+                    startSq, endSq, ply = protocol.decodeMove(payload)
+                    with self.lock:
+                        self.receivedMoves.append((startSq, endSq))
+                elif msgType == protocol.SNAPSHOT:
+                    self.setSnapshot(protocol.decodeSnapshot(payload))
+                elif msgType == protocol.GAME_OVER:
+                    self.gameOver = protocol.decodeGameOver(payload)
+                self.notify()
 
-            except:
+            except (OSError, protocol.ProtocolError):
+                if not self.closed and self.gameOver is None and self.reconnect():
+                    self.notify()
+                    continue
                 print('\nNão foi possível permanecer conectado no servidor!\n')
-                print('Pressione <Enter> Para continuar...')
                 self.client.close()
+                self.disconnected = True
+                self.notify()
                 break
 
-    def clicks(self, board):
+    def clicks(self, board, ply=0):
+        # envia o movimento (as duas casas clicadas) e o número do lance
         try:
-            tabua = str(board).encode()
-            self.client.send(tabua)
-            print('Enviado')
-        except:
+            self.client.sendall(protocol.encodeMove(board[0], board[1], ply))
+        except OSError:
             return "fora de conexão"
 
     def close(self):
+        self.closed = True
         self.client.close()
@@ -0,0 +1,172 @@
+''' Protocolo binário entre cliente e servidor. Cada mensagem é um quadro com 2 bytes de tamanho
+do conteúdo, 1 byte de tipo e o conteúdo; assim duas mensagens nunca se misturam numa leitura
+e nenhuma mensagem chega pela metade. Todos os números são big-endian e a decodificação usa só
+struct, sem eval '''
+
+import struct
+
+HEADER = struct.Struct('!HB')
+
+# tipos de mensagem
+HELLO = 1      # cliente -> servidor: modo, id da partida e token (para voltar ou assistir)
+WELCOME = 2    # servidor -> cliente: número do jogador, id da partida e token
+MOVE = 3       # os dois sentidos: movimento em 2 bytes + número do lance
+SNAPSHOT = 4   # servidor -> cliente: posição completa
+GAME_OVER = 5  # servidor -> cliente: resultado
+REDIRECT = 6   # servidor -> cliente: a partida está em outro processo, conectar na porta indicada
+
+# modos do HELLO
+PLAY = 0
+RESUME = 1
+WATCH = 2
+
+SPECTATOR = 255  # número de "jogador" de quem só assiste
+
+# resultados do GAME_OVER
+WHITE_WINS = 0
+BLACK_WINS = 1
+DRAW = 2
+ABANDONED = 3
+
+# motivos do GAME_OVER
+CHECKMATE = 0
+STALEMATE = 1
+REPETITION = 2
+DISCONNECTED = 3
+
+PIECES = ("wP", "wR", "wN", "wB", "wQ", "wK",
+          "bP", "bR", "bN", "bB", "bQ", "bK", "--")
+PIECE_CODES = {piece: i for i, piece in enumerate(PIECES)}
+
+_hello = struct.Struct('!BII')
+_welcome = struct.Struct('!BII')
+_move = struct.Struct('!HH')
+_snapshotTail = struct.Struct('!BBBH')
+_gameOver = struct.Struct('!BB')
+_redirect = struct.Struct('!H')
+
+MAX_PAYLOAD = 0xFFFF
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def frame(msgType, payload=b''):
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError('mensagem grande demais')
+    return HEADER.pack(len(payload), msgType) + payload
+
+
+class FrameDecoder():
+    # junta os bytes recebidos e devolve só os quadros completos
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while len(self.buffer) >= HEADER.size:
+            length, msgType = HEADER.unpack_from(self.buffer)
+            end = HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((msgType, bytes(self.buffer[HEADER.size:end])))
+            del self.buffer[:end]
+        return frames
+
+
+def recvExact(sock, size):  # leitura bloqueante de exatamente size bytes
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('conexão encerrada')
+        data += chunk
+    return bytes(data)
+
+
+def readFrame(sock):  # lê um quadro de um socket bloqueante: (tipo, conteúdo)
+    length, msgType = HEADER.unpack(recvExact(sock, HEADER.size))
+    return msgType, recvExact(sock, length) if length else b''
+
+
+async def readFrameAsync(reader):  # o mesmo para um asyncio.StreamReader
+    length, msgType = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return msgType, await reader.readexactly(length) if length else b''
+
+
+def encodeHello(mode=PLAY, gameId=0, token=0):
+    return frame(HELLO, _hello.pack(mode, gameId, token))
+
+
+def decodeHello(payload):  # (modo, id da partida, token)
+    return _unpack(_hello, payload)
+
+
+def encodeWelcome(player, gameId, token):
+    return frame(WELCOME, _welcome.pack(player, gameId, token))
+
+
+def decodeWelcome(payload):  # (jogador, id da partida, token)
+    return _unpack(_welcome, payload)
+
+
+def packMove(startSq, endSq):
+    # movimento em 16 bits: 6 bits da casa inicial e 6 da final (casa = linha * 8 + coluna)
+    return (startSq[0] * 8 + startSq[1]) << 6 | (endSq[0] * 8 + endSq[1])
+
+
+def unpackMove(code):
+    start, end = code >> 6 & 63, code & 63
+    return (start >> 3, start & 7), (end >> 3, end & 7)
+
+
+def encodeMove(startSq, endSq, ply):
+    return frame(MOVE, _move.pack(packMove(startSq, endSq), ply))
+
+
+def decodeMove(payload):  # (casa inicial, casa final, lance)
+    code, ply = _unpack(_move, payload)
+    startSq, endSq = unpackMove(code)
+    return startSq, endSq, ply
+
+
+def encodeSnapshot(board, whiteToMove, castling, enpassantPossible, ply):
+    # castling: (wks, bks, wqs, bqs); enpassantPossible: () ou (linha, coluna)
+    cells = bytes(PIECE_CODES[piece] for row in board for piece in row)
+    rights = sum(1 << i for i, allowed in enumerate(castling) if allowed)
+    ep = enpassantPossible[0] * 8 + enpassantPossible[1] if enpassantPossible else 255
+    return frame(SNAPSHOT, cells + _snapshotTail.pack(int(whiteToMove), rights, ep, ply))
+
+
+def decodeSnapshot(payload):  # (tabuleiro 8x8, whiteToMove, (wks, bks, wqs, bqs), enpassant, lance)
+    if len(payload) != 64 + _snapshotTail.size or max(payload[:64]) >= len(PIECES):
+        raise ProtocolError('snapshot inválido')
+    board = [[PIECES[code] for code in payload[r * 8:r * 8 + 8]] for r in range(8)]
+    side, rights, ep, ply = _snapshotTail.unpack_from(payload, 64)
+    castling = tuple(bool(rights >> i & 1) for i in range(4))
+    enpassant = (ep >> 3, ep & 7) if ep < 64 else ()
+    return board, bool(side), castling, enpassant, ply
+
+
+def encodeGameOver(result, reason=0):
+    return frame(GAME_OVER, _gameOver.pack(result, reason))
+
+
+def decodeGameOver(payload):  # (resultado, motivo)
+    return _unpack(_gameOver, payload)
+
+
+def encodeRedirect(port):
+    return frame(REDIRECT, _redirect.pack(port))
+
+
+def decodeRedirect(payload):  # porta
+    return _unpack(_redirect, payload)[0]
+
+
+def _unpack(layout, payload):
+    if len(payload) != layout.size:
+        raise ProtocolError('tamanho inválido: %d bytes' % len(payload))
+    return layout.unpack(payload)
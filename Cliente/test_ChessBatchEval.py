@@ -0,0 +1,76 @@
+''' Testes da avaliação em lote: evaluateBatch (NumPy) tem que dar o mesmo valor que
+evaluateReference (Python puro) em posições de partidas aleatórias, com sementes fixas.
+
+Uso: python -m unittest test_ChessBatchEval (na pasta Cliente) '''
+
+import random
+import unittest
+
+import ChessBatchEval
+import ChessEngine
+from ChessBatchEval import np
+
+GAMES = 20
+PLIES = 80
+
+
+def randomPositions(seed):
+    # FENs das posições de GAMES partidas com lances sorteados
+    rng = random.Random(seed)
+    fens = []
+    for game in range(GAMES):
+        gs = ChessEngine.GameState(moveCacheSize=0)
+        for ply in range(PLIES):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+            fens.append(gs.getFEN())
+    return fens
+
+
+def gameState(fen, useBitboards=True):
+    gs = ChessEngine.GameState(moveCacheSize=0, useBitboards=useBitboards)
+    gs.loadFEN(fen)
+    return gs
+
+
+@unittest.skipIf(np is None, 'NumPy não instalado')
+class BatchEvalTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fens = randomPositions(2024)
+        cls.states = [gameState(fen) for fen in cls.fens]
+
+    def testMatchesReference(self):
+        for terms in [ChessBatchEval.TERMS] + [(term,) for term in ChessBatchEval.TERMS]:
+            scores = ChessBatchEval.evaluateBatch(*ChessBatchEval.pack(self.states), terms).tolist()
+            expected = [ChessBatchEval.evaluateReference(gs, terms) for gs in self.states]
+            for fen, score, value in zip(self.fens, scores, expected):
+                self.assertEqual(score, value, '%s %s' % (terms, fen))
+
+    def testPackFEN(self):
+        bitboards, whiteToMove = ChessBatchEval.packFEN(self.fens)
+        expectedBitboards, expectedSides = ChessBatchEval.pack(self.states)
+        self.assertEqual(bitboards.dtype, np.uint64)
+        self.assertTrue((bitboards == expectedBitboards).all())
+        self.assertTrue((whiteToMove == expectedSides).all())
+
+    def testWithoutBitboards(self):
+        # com useBitboards desligado os bitboards do GameState ficam parados na posição inicial
+        gs = ChessEngine.GameState(moveCacheSize=0, useBitboards=False)
+        for notation in ('e2e4', 'd7d5', 'e4d5', 'd8d5'):
+            gs.makeMove(gs.findMove(notation))
+        expected = ChessBatchEval.evaluateReference(gameState(gs.getFEN()))
+        self.assertEqual(ChessBatchEval.evaluateStates([gs]), [expected])
+        self.assertEqual(ChessBatchEval.evaluateReference(gs), expected)
+
+    def testInvalidFEN(self):
+        for fen in ('8/8/8/8/8/8/8/8 w - -', 'rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -',
+                    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq -', 'Pnbqkbnr/8/8/8/8/8/8/RNBQKBNR w - -'):
+            with self.assertRaises(ValueError):
+                ChessBatchEval.parseFEN(fen)
+
+
+if __name__ == "__main__":
+    unittest.main()
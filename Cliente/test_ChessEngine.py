@@ -0,0 +1,67 @@
+''' Testes do motor: os bitboards (useBitboards=True) têm que gerar os mesmos movimentos e o mesmo
+hash de Zobrist que a lista 8x8 em partidas aleatórias com sementes fixas, e o perft das posições de
+referência (ChessPerft) tem que bater com as contagens conhecidas.
+
+Uso: python -m unittest test_ChessEngine (na pasta Cliente) '''
+
+import random
+import unittest
+
+import ChessBitboard
+import ChessEngine
+import ChessPerft
+import ChessZobrist
+
+GAMES = 20
+PLIES = 120
+
+
+def moveSet(gs):  # movimentos com as flags, para comparar os dois geradores
+    moves = gs.getValidMoves()
+    gs.checkMate = gs.stalemate = False
+    return {(move.moveID, move.flags) for move in moves}
+
+
+class BitboardTest(unittest.TestCase):
+    def testRandomGames(self):
+        for seed in range(GAMES):
+            rng = random.Random(seed)
+            bitboards = ChessEngine.GameState(useBitboards=True, moveCacheSize=0)
+            board = ChessEngine.GameState(useBitboards=False, moveCacheSize=0)
+            for ply in range(PLIES):
+                position = 'semente %d, lance %d: %s' % (seed, ply, board.getFEN())
+                moves = moveSet(bitboards)
+                self.assertEqual(moves, moveSet(board), position)
+                self.assertEqual(bitboards.zobristKey, board.zobristKey, position)
+                self.assertEqual(bitboards.zobristKey, ChessZobrist.computeHash(
+                    board.board, board.whiteToMove, board.currentCastlingRight, board.enpassantPossible), position)
+                if not moves:
+                    break
+                moveID, _ = rng.choice(sorted(moves))
+                for gs in (bitboards, board):
+                    gs.makeMove(next(move for move in gs.getValidMoves() if move.moveID == moveID))
+            # desfazendo tudo as duas voltam juntas para a posição inicial
+            while bitboards.moveLog:
+                bitboards.undoMove()
+                board.undoMove()
+                self.assertEqual(bitboards.zobristKey, board.zobristKey)
+            self.assertEqual(bitboards.getFEN(), ChessEngine.STARTING_FEN)
+            self.assertEqual(bitboards.bitboards.pieces,
+                             ChessBitboard.BitboardPosition.fromBoard(bitboards.board).pieces)
+
+
+class PerftTest(unittest.TestCase):
+    def testSuite(self):
+        for result in ChessPerft.runSuite(3):
+            self.assertEqual(result['nodes'], result['expected'], result['name'])
+
+    def testSuiteWithAttackMap(self):
+        # o mapa de ataques atualizado em makeMove/undoMove responde inCheck durante todo o perft
+        for name, (fen, expected) in ChessPerft.POSITIONS.items():
+            gs = ChessPerft.newGameState(fen)
+            gs.enableAttackMap()
+            self.assertEqual(ChessPerft.perft(gs, 2), expected[1], name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,341 @@
+''' Teste de carga do servidor, todo em localhost: inicia o serverSocket.py num subprocesso e abre
+muitos clientes sem interface que usam o protocolo real e jogam partidas de lances legais (sorteados
+ou de um arquivo) com o ChessEngine. No fim mostra conexões/s, a latência de cada lance (do envio
+até a chegada no adversário, passando pelo servidor), lances/s e CPU/memória do servidor.
+
+Os clientes podem ser divididos em vários processos (--procs) para que o gerador de carga não seja
+o gargalo; os tempos usam time.monotonic, que é o mesmo relógio para todos os processos da máquina '''
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Cliente'))
+from socketCliente import protocol  # noqa: E402
+import ChessEngine  # noqa: E402
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serverSocket.py')
+HOST = '127.0.0.1'
+PORT = 6555  # porta própria para não atrapalhar um servidor de verdade na 5555
+
+
+async def simulatedClient(index, options, script, stats):
+    # um jogador: conecta, joga até options['plies'] lances (ou o fim da partida) e desconecta
+    rng = random.Random(options['seed'] * 100003 + index)
+    await asyncio.sleep(options['ramp'] * index / max(options['clients'], 1))
+    start = time.monotonic()
+    try:
+        reader, writer = await asyncio.open_connection(options['host'], options['port'])
+    except OSError:
+        stats['errors'] += 1
+        return
+    try:
+        writer.write(protocol.encodeHello(protocol.PLAY))
+        msgType, payload = await protocol.readFrameAsync(reader)
+        while msgType == protocol.REDIRECT:  # o adversário espera em outro processo do servidor
+            writer.close()
+            reader, writer = await asyncio.open_connection(options['host'], protocol.decodeRedirect(payload))
+            writer.write(protocol.encodeHello(protocol.PLAY))
+            msgType, payload = await protocol.readFrameAsync(reader)
+        player, gameId, token = protocol.decodeWelcome(payload)
+        msgType, payload = await protocol.readFrameAsync(reader)
+        stats['connect'].append(time.monotonic() - start)
+        stats['connectedAt'].append(time.monotonic())
+
+        gs = ChessEngine.GameState(moveCacheSize=64)
+        gs.setPosition(*protocol.decodeSnapshot(payload))
+        line = script[index // 2 % len(script)] if script else []
+        while gs.ply() < options['plies']:
+            if (player == 0) == gs.whiteToMove:
+                moves = gs.getValidMoves()
+                if not moves:
+                    break
+                move = gs.findMove(line[gs.ply()]) if gs.ply() < len(line) else None
+                move = move or rng.choice(moves)
+                if options['think']:
+                    await asyncio.sleep(options['think'])
+                gs.makeMove(move)
+                stats['sent'].append((gameId, gs.ply() - 1, time.monotonic()))
+                writer.write(protocol.encodeMove((move.startRow, move.startCol), (move.endRow, move.endCol),
+                                                 gs.ply() - 1))
+                await writer.drain()
+                continue
+
+            try:
+                msgType, payload = await asyncio.wait_for(protocol.readFrameAsync(reader),
+                                                         options['idle'] + options['think'])
+            except asyncio.TimeoutError:
+                # sem lance do adversário (ele caiu ou o servidor parou de repassar)
+                stats['idle'] += 1
+                return
+            if msgType == protocol.MOVE:
+                startSq, endSq, ply = protocol.decodeMove(payload)
+                stats['received'].append((gameId, ply, time.monotonic()))
+                move = ChessEngine.Move(startSq, endSq, gs.board)
+                moves = gs.getValidMoves()
+                if move not in moves:
+                    stats['errors'] += 1
+                    break
+                gs.makeMove(moves[moves.index(move)])
+            elif msgType == protocol.SNAPSHOT:  # o servidor recusou um lance nosso
+                stats['resyncs'] += 1
+                gs.setPosition(*protocol.decodeSnapshot(payload))
+            elif msgType == protocol.GAME_OVER:
+                break
+        stats['games'] += 1
+    except (asyncio.IncompleteReadError, ConnectionError, protocol.ProtocolError):
+        stats['errors'] += 1
+    finally:
+        writer.close()
+
+
+async def _runClients(indices, options, script):
+    stats = {'connect': [], 'connectedAt': [], 'sent': [], 'received': [],
+             'errors': 0, 'resyncs': 0, 'idle': 0, 'games': 0}
+    tasks = [simulatedClient(i, options, script, stats) for i in indices]
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), options['timeout'])
+    except asyncio.TimeoutError:
+        stats['timedOut'] = True
+    return stats
+
+
+def runClients(indices, options, script):  # processo gerador de carga
+    _raiseFileLimit()
+    return asyncio.run(_runClients(indices, options, script))
+
+
+def _raiseFileLimit():
+    # milhares de sockets abertos passam do limite padrão de arquivos
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+class ProcessMonitor():
+    # amostra CPU e memória do servidor (e dos processos filhos dele) pelo /proc; fora do Linux
+    # os valores ficam None
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peakRss = 0
+        self.running = False
+        self.thread = None
+        self.startTicks = self.startTime = None
+
+    def processes(self):
+        pids = [self.pid]
+        for name in os.listdir('/proc'):
+            if name.isdigit() and self.readStat(int(name), 1) == self.pid:
+                pids.append(int(name))
+        return pids
+
+    def readStat(self, pid, field):
+        # campos depois do nome do processo: 0 estado, 1 ppid, 11 utime, 12 stime
+        try:
+            with open('/proc/%d/stat' % pid) as f:
+                data = f.read()
+        except OSError:
+            return None
+        return int(data[data.rindex(')') + 2:].split()[field])
+
+    def ticks(self):
+        return sum((self.readStat(pid, 11) or 0) + (self.readStat(pid, 12) or 0) for pid in self.processes())
+
+    def rss(self):  # em bytes
+        total = 0
+        for pid in self.processes():
+            try:
+                with open('/proc/%d/status' % pid) as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1]) * 1024
+            except OSError:
+                pass
+        return total
+
+    def start(self):
+        if not os.path.isdir('/proc'):
+            return
+        self.startTicks, self.startTime = self.ticks(), time.monotonic()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while self.running:
+            self.peakRss = max(self.peakRss, self.rss())
+            time.sleep(self.interval)
+
+    def stop(self):
+        if self.thread is None:
+            return None, None
+        self.running = False
+        self.thread.join()
+        cpuSeconds = (self.ticks() - self.startTicks) / os.sysconf('SC_CLK_TCK')
+        elapsed = time.monotonic() - self.startTime
+        return 100.0 * cpuSeconds / max(elapsed, 1e-9), self.peakRss
+
+
+def startServer(host, port, workers):
+    command = [sys.executable, SERVER, '--host', host, '--port', str(port), '--workers', str(workers)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), 0.2).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError('o servidor não abriu a porta %d' % port)
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {'p%d' % point: values[min(len(values) - 1, len(values) * point // 100)] for point in points}
+    result['max'] = values[-1]
+    return result
+
+
+def runLoad(options, script=None, procs=1, serverPid=None):
+    # executa a carga e devolve o relatório (dicionário)
+    indices = list(range(options['clients']))
+    monitor = ProcessMonitor(serverPid) if serverPid else None
+    if monitor:
+        monitor.start()
+    start = time.monotonic()
+    if procs > 1:
+        with ProcessPoolExecutor(procs) as executor:
+            parts = list(executor.map(runClients, [indices[i::procs] for i in range(procs)],
+                                      [options] * procs, [script] * procs))
+    else:
+        parts = [runClients(indices, options, script)]
+    elapsed = time.monotonic() - start
+    cpu, memory = monitor.stop() if monitor else (None, None)
+
+    connect = [t for part in parts for t in part['connect']]
+    sent = {(gameId, ply): t for part in parts for gameId, ply, t in part['sent']}
+    latencies = [t - sent[gameId, ply] for part in parts for gameId, ply, t in part['received']
+                 if (gameId, ply) in sent]
+    moves = len(sent)
+    firstMove = min(sent.values(), default=start)
+    lastMove = max((t for part in parts for _, _, t in part['received']), default=firstMove)
+    connectTime = max((t for part in parts for t in part['connectedAt']), default=start) - start
+    return {
+        'clients': options['clients'],
+        'connected': len(connect),
+        'connectionsPerSecond': len(connect) / max(connectTime, 1e-9),
+        'connectMs': {k: v * 1000 for k, v in percentiles(connect).items()},
+        'moves': moves,
+        'movesPerSecond': moves / max(lastMove - firstMove, 1e-9),
+        'latencyMs': {k: v * 1000 for k, v in percentiles(latencies).items()},
+        'games': sum(part['games'] for part in parts) // 2,
+        'errors': sum(part['errors'] for part in parts),
+        'resyncs': sum(part['resyncs'] for part in parts),
+        'idle': sum(part['idle'] for part in parts),
+        'timedOut': any(part.get('timedOut') for part in parts),
+        'seconds': elapsed,
+        'serverCpuPercent': cpu,
+        'serverPeakRssMB': memory / 2 ** 20 if memory is not None else None,
+    }
+
+
+def printReport(report):
+    def row(values):
+        return '  '.join('%s %.2f' % (k, v) for k, v in values.items()) or '-'
+    print('clientes %d  conectados %d  partidas %d  tempo %.2fs' % (
+        report['clients'], report['connected'], report['games'], report['seconds']))
+    print('conexões/s %.1f  (ms até o snapshot: %s)' % (report['connectionsPerSecond'], row(report['connectMs'])))
+    print('lances %d  lances/s %.1f' % (report['moves'], report['movesPerSecond']))
+    print('latência do lance (ms): %s' % row(report['latencyMs']))
+    if report['serverCpuPercent'] is not None:
+        print('servidor: CPU %.1f%%  memória pico %.1f MB' % (report['serverCpuPercent'], report['serverPeakRssMB']))
+    print('erros %d  resincronizações %d  sem adversário %d%s' % (
+        report['errors'], report['resyncs'], report['idle'], '  (tempo limite atingido)' if report['timedOut'] else ''))
+
+
+def compareBaseline(report, path, tolerance=0.2):
+    # lista de (medida, atual, base) que pioraram mais que a tolerância
+    with open(path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for key in ('connectionsPerSecond', 'movesPerSecond'):
+        if baseline.get(key) and report[key] < baseline[key] * (1 - tolerance):
+            regressions.append((key, report[key], baseline[key]))
+    for key in ('p50', 'p99'):
+        old, new = baseline.get('latencyMs', {}).get(key), report['latencyMs'].get(key)
+        if old and new is not None and new > old * (1 + tolerance):
+            regressions.append(('latencyMs.' + key, new, old))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de carga do servidor de xadrez (localhost)')
+    parser.add_argument('--clients', type=int, default=200, help='jogadores simulados (pares formam partidas)')
+    parser.add_argument('--plies', type=int, default=40, help='lances por partida')
+    parser.add_argument('--think', type=float, default=0.0, help='segundos antes de cada lance')
+    parser.add_argument('--ramp', type=float, default=0.0, help='segundos para abrir todas as conexões')
+    parser.add_argument('--procs', type=int, default=1, help='processos geradores de carga')
+    parser.add_argument('--workers', type=int, default=1, help='processos do servidor')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--external', action='store_true', help='usa um servidor já iniciado em --port')
+    parser.add_argument('--script', metavar='ARQ', help="partidas roteirizadas, uma por linha ('e2e4 e7e5 ...')")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=120.0, help='limite para o teste inteiro')
+    parser.add_argument('--idle', type=float, default=5.0, help='segundos sem lance do adversário para desistir')
+    parser.add_argument('--json', metavar='ARQ', help='salva o relatório')
+    parser.add_argument('--baseline', metavar='ARQ', help='compara com um relatório salvo')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = [line.split() for line in f if line.strip()]
+    options = {'host': HOST, 'port': args.port, 'clients': args.clients, 'plies': args.plies,
+               'think': args.think, 'ramp': args.ramp, 'seed': args.seed, 'timeout': args.timeout, 'idle': args.idle}
+
+    server = None if args.external else startServer(HOST, args.port, args.workers)
+    try:
+        report = runLoad(options, script, args.procs, server.pid if server else None)
+    finally:
+        if server is not None:
+            # SIGINT em vez de terminate: o supervisor encerra os processos dele antes de sair
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    printReport(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline:
+        regressions = compareBaseline(report, args.baseline, args.tolerance)
+        for key, new, old in regressions:
+            print('REGRESSÃO %s: %.2f (base %.2f)' % (key, new, old))
+        if regressions:
+            return 1
+    return 1 if report['errors'] or report['timedOut'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
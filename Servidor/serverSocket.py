@@ -1,81 +1,548 @@
-import threading
+''' Servidor do jogo com asyncio: um único processo e uma única thread atendem muitas salas
+independentes. Cada conexão nova entra na sala que está esperando o segundo jogador ou abre
+uma sala nova. O servidor é a autoridade da partida: cada sala guarda o próprio GameState,
+confere os movimentos recebidos e repassa só o lance aceito; a posição completa vai apenas
+para quem entra ou volta para a partida. Cada conexão da sala (jogadores e espectadores) tem uma
+fila de saída limitada; cada atualização é codificada uma vez e os mesmos bytes vão para todas as
+filas, e quem fica para trás recebe só a posição mais recente ou é desconectado.
+
+Com --workers N o processo principal vira supervisor de N processos que escutam a mesma porta
+(SO_REUSEPORT, o sistema distribui as conexões novas). Cada processo tem as próprias salas e o
+número dele fica nos bits altos do id da partida; quem volta ou vai assistir uma partida de outro
+processo recebe um REDIRECT para a porta particular dele (PORT + 1 + número do processo). A sala que
+espera o segundo jogador é uma só para todos os processos: o id dela fica num valor compartilhado
+criado pelo supervisor, e quem chega por outro processo é mandado com REDIRECT para o dono da sala.
+
+As métricas (ChessMetrics) ficam sempre ligadas e custam alguns incrementos por mensagem; saem em
+JSON por --stats-port (HTTP local, uma porta por processo) ou a cada --stats-interval segundos na
+saída padrão. --engine-metrics mede também o ChessEngine e --profile liga o profiler por amostragem
+(que também pode ser ligado e desligado em /profile/start e /profile/stop).
+
+Com --archive PASTA cada lance aceito vai para o arquivo de partidas (ChessArchive), e a partida
+inteira é gravada quando termina. A escrita no disco fica numa thread só dela, na ordem dos lances,
+para um flush ou fsync lento não parar as salas do processo '''
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import secrets
 import socket
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+# o protocolo (e o motor) ficam na pasta do cliente
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Cliente'))
+from socketCliente import protocol  # noqa: E402
+import ChessArchive  # noqa: E402
+import ChessEngine  # noqa: E402
+import ChessMetrics  # noqa: E402
 
 HOST = '127.0.0.1'
 PORT = 5555
-clients = []
-board = [
-    ["bR", "bN", "bB", "bQ", "bK", "bB", "bR", "bR"],
-    ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
-    ["--", "--", "--", "--", "--", "--", "--", "--"],
-    ["--", "--", "--", "--", "--", "--", "--", "--"],
-    ["--", "--", "--", "--", "--", "--", "--", "--"],
-    ["--", "--", "--", "--", "--", "--", "--", "--"],
-    ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
-    ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
+RECONNECT_TIMEOUT = 60  # segundos que a sala espera um jogador desconectado voltar
+WORKER_BITS = 24  # o id da partida é (processo << WORKER_BITS) | contador
+SUBSCRIBER_QUEUE = 64  # mensagens pendentes por conexão antes de ela ser considerada lenta
+MAX_CATCH_UPS = 3  # vezes que um espectador lento é resincronizado antes de ser desconectado
 
 
-def main():
+class Subscriber():
+    # fila de saída de uma conexão, esvaziada por uma tarefa própria: quem publica nunca espera
+    # pelo socket de ninguém
+    def __init__(self, writer, room, canDrop=True):
+        self.writer = writer
+        self.room = room
+        self.canDrop = canDrop  # jogadores não são desconectados, só resincronizados
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE)
+        self.catchUps = 0
+        self.task = asyncio.ensure_future(self.pump())
 
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def send(self, data):
+        counters = self.room.metrics.counters
+        counters['messages.out'] += 1
+        counters['bytes.out'] += len(data)
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.catchUp()
 
-    try:
-        server.bind((HOST, PORT))
-        print("Servidor iniciado")
-        server.listen()
-    except:
-        return print('\nNão foi possível iniciar o servidor!\n')
+    def catchUp(self):
+        # a conexão ficou para trás: o que estava na fila é descartado e no lugar vai só a posição
+        # atual (que já inclui todos os lances descartados)
+        self.catchUps += 1
+        if self.canDrop and self.catchUps > MAX_CATCH_UPS:
+            self.room.metrics.incr('subscribers.dropped')
+            self.room.unsubscribe(self.writer)
+            return
+        self.room.metrics.incr('subscribers.catchUps')
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(self.room.snapshot())
+        if self.room.result is not None:
+            self.queue.put_nowait(protocol.encodeGameOver(*self.room.result))
+
+    async def pump(self):
+        try:
+            while True:
+                # tudo o que estiver na fila vai junto, com uma única espera pelo socket
+                self.writer.write(await self.queue.get())
+                while not self.queue.empty():
+                    self.writer.write(self.queue.get_nowait())
+                await self.writer.drain()
+        except ConnectionError:
+            self.writer.close()
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+class GameRoom():
+    def __init__(self, roomId, metrics=None):
+        self.roomId = roomId
+        self.metrics = metrics or ChessMetrics.Metrics()
+        self.gs = ChessEngine.GameState()
+        self.legalMoves = self.legalMoveSet()
+        self.players = [None, None]  # writers dos jogadores; o índice é o número do jogador ('0' brancas, '1' pretas)
+        self.subscribers = {}  # writer -> Subscriber, de jogadores e espectadores
+        self.spectators = set()
+        self.snapshotCache = (None, b'')  # (lance, snapshot codificado) compartilhado pelas conexões
+        self.tokens = [secrets.randbits(32), secrets.randbits(32)]  # para o jogador voltar à partida
+        self.timers = [None, None]  # prazo para cada jogador desconectado voltar
+        self.started = False
+        self.result = None
+        self.archived = False
+
+    def legalMoveSet(self):
+        # movimentos válidos da posição atual pelo código de 12 bits do protocolo (igual ao moveID);
+        # o GameState ainda guarda as listas no próprio cache por hash
+        return {move.moveID: move for move in self.gs.getValidMoves()}
+
+    def snapshot(self):  # codificado uma vez por lance
+        ply, data = self.snapshotCache
+        if ply != self.gs.ply():
+            data = protocol.encodeSnapshot(*self.gs.getPosition())
+            self.snapshotCache = (self.gs.ply(), data)
+        return data
+
+    def isFull(self):
+        return None not in self.players
+
+    def isEmpty(self):
+        return self.players == [None, None]
+
+    def subscribe(self, writer, canDrop=True):
+        self.subscribers[writer] = Subscriber(writer, self, canDrop)
+        return self.subscribers[writer]
+
+    def unsubscribe(self, writer):
+        subscriber = self.subscribers.pop(writer, None)
+        if subscriber is not None:
+            subscriber.close()
+        self.spectators.discard(writer)
+
+    def watch(self, writer):
+        self.spectators.add(writer)
+        return self.subscribe(writer)
+
+    def join(self, writer, player):
+        self.players[player] = writer
+        self.subscribe(writer, canDrop=False)
+        if self.timers[player] is not None:
+            self.timers[player].cancel()
+            self.timers[player] = None
+        if self.isFull():
+            self.started = True
+
+    def applyMove(self, player, startSq, endSq, ply):
+        # devolve o movimento aceito, ou None se não for a vez do jogador, se o lance estiver
+        # fora de ordem ou se o movimento não for válido na posição do servidor
+        if self.result is not None or player != (0 if self.gs.whiteToMove else 1) or ply != self.gs.ply():
+            return None
+        move = self.legalMoves.get(protocol.packMove(startSq, endSq))
+        if move is None:
+            return None
+        self.gs.makeMove(move)
+        self.legalMoves = self.legalMoveSet()
+        if not self.legalMoves:
+            if self.gs.checkMate:
+                winner = protocol.BLACK_WINS if self.gs.whiteToMove else protocol.WHITE_WINS
+                self.result = (winner, protocol.CHECKMATE)
+            else:
+                self.result = (protocol.DRAW, protocol.STALEMATE)
+        elif self.gs.repetitionCount() >= 3:
+            self.result = (protocol.DRAW, protocol.REPETITION)
+        return move
+
+    def publish(self, data, sender=None):
+        # os mesmos bytes vão para a fila de cada conexão (menos a de quem enviou), sem esperar
+        start = time.perf_counter()
+        for writer, subscriber in list(self.subscribers.items()):
+            if writer is not sender:
+                subscriber.send(data)
+        self.metrics.observe('publish', time.perf_counter() - start)
+
+    def remove(self, writer):
+        if writer in self.players:
+            self.players[self.players.index(writer)] = None
+        self.unsubscribe(writer)
+
+
+class GameServer():
+    def __init__(self, worker=0, workers=1, port=PORT, metrics=None, profiler=None, archive=None, lobby=None):
+        self.rooms = {}
+        self.waiting = None  # sala com um jogador esperando o adversário
+        # com vários processos: multiprocessing.Value com o id da sala que espera o adversário (0 se
+        # nenhuma), o mesmo em todos os processos; o dono da sala é quem a coloca e quem a tira
+        self.lobby = lobby
+        self.worker = worker
+        self.workers = workers
+        self.port = port
+        self.archive = archive  # ChessArchive.ArchiveWriter do processo, ou None
+        # uma thread só para o arquivo: as gravações saem do laço de eventos e ficam na ordem
+        self.archiveExecutor = ThreadPoolExecutor(1) if archive is not None else None
+        # com arquivo, os ids continuam de onde pararam para não sobrescrever partidas gravadas
+        first = archive.nextCounter() if archive is not None else 1
+        self.roomIds = (worker << WORKER_BITS | n for n in itertools.count(first))
+        self.connections = 0
+        self.metrics = metrics or ChessMetrics.Metrics()
+        self.metrics.gauge('connections', lambda: self.connections)
+        self.metrics.gauge('rooms', lambda: len(self.rooms))
+        self.metrics.gauge('spectators', lambda: sum(len(room.spectators) for room in self.rooms.values()))
+        self.profiler = profiler  # ChessMetrics.SamplingProfiler, ligado por --profile ou /profile/start
+
+    def ownerPort(self, gameId):
+        # porta particular do processo dono da partida, ou None se a partida é deste processo
+        owner = gameId >> WORKER_BITS
+        if self.workers == 1 or owner == self.worker:
+            return None
+        if owner >= self.workers:
+            raise protocol.ProtocolError('partida inexistente')
+        return self.port + 1 + owner
+
+    def matchmake(self, writer):
+        # coloca a conexão numa sala e devolve (sala, número do jogador), ou (None, porta) quando a
+        # sala que espera o adversário é de outro processo
+        if self.lobby is None:
+            return self.joinWaiting(writer)
+        with self.lobby.get_lock():
+            if self.lobby.value and self.ownerPort(self.lobby.value) is not None:
+                return None, self.ownerPort(self.lobby.value)
+            room, player = self.joinWaiting(writer)
+            self.lobby.value = self.waiting.roomId if self.waiting is not None else 0
+            return room, player
 
-    while True:
-        client, addr = server.accept()
-        clients.append(client)
+    def joinWaiting(self, writer):
+        if self.waiting is None or self.waiting.isFull():
+            room = GameRoom(next(self.roomIds), self.metrics)
+            self.rooms[room.roomId] = room
+            self.waiting = room
+        room = self.waiting
+        player = room.players.index(None)
+        room.join(writer, player)
+        if room.isFull():
+            self.waiting = None
+        return room, player
 
-        client.send(str(clients.index(client)).encode())
-        time.sleep(0.2)
+    def resume(self, writer, gameId, token):  # jogador voltando para a partida com o token do WELCOME
+        room = self.rooms.get(gameId)
+        if room is None or token not in room.tokens:
+            raise protocol.ProtocolError('partida ou token inválido')
+        player = room.tokens.index(token)
+        if room.players[player] is not None:  # a conexão antiga ainda não caiu: a nova assume
+            room.players[player].close()
+        room.join(writer, player)
+        return room, player
 
-        tabua = str(board).encode()
-        client.send(tabua)
+    def topRoom(self):
+        # sala para quem quer assistir sem escolher: a partida em andamento com mais espectadores
+        rooms = [room for room in self.rooms.values() if room.started and room.result is None]
+        if not rooms:
+            raise protocol.ProtocolError('nenhuma partida em andamento')
+        return max(rooms, key=lambda room: len(room.spectators))
 
-        thread = threading.Thread(target=messagesTreatment, args=[client])
-        thread.start()
+    def leave(self, room, writer):
+        if writer in room.spectators:
+            room.unsubscribe(writer)
+            return
+        if writer not in room.players:
+            room.unsubscribe(writer)
+            return
+        player = room.players.index(writer)
+        room.remove(writer)
+        if not room.started or room.result is not None:
+            if room.isEmpty():
+                self.close(room)
+        else:
+            # partida em andamento: o jogador tem um prazo para voltar antes de perder por abandono
+            loop = asyncio.get_running_loop()
+            room.timers[player] = loop.call_later(RECONNECT_TIMEOUT, self.abandon, room, player)
 
+    def abandon(self, room, player):
+        room.timers[player] = None
+        if room.players[player] is not None or room.result is not None:
+            return
+        room.result = (protocol.WHITE_WINS if player == 1 else protocol.BLACK_WINS, protocol.DISCONNECTED)
+        room.publish(protocol.encodeGameOver(*room.result))  # o mesmo resultado que vai para o arquivo
+        self.archiveGame(room)
+        if room.isEmpty():
+            self.close(room)
 
-def messagesTreatment(client):
-    bolean = True
-    while True:
+    def archiveGame(self, room):
+        if self.archive is not None and room.started and not room.archived:
+            result, reason = room.result or (ChessArchive.NO_RESULT, 0)
+            self.writeArchive(self.archive.finishGame, room.roomId, result, reason)
+            room.archived = True
+
+    def writeArchive(self, method, *args):  # chama um método do ArchiveWriter na thread do arquivo
+        asyncio.get_running_loop().run_in_executor(self.archiveExecutor, method, *args)
+
+    def close(self, room):
+        for timer in room.timers:
+            if timer is not None:
+                timer.cancel()
+        for writer in list(room.subscribers):
+            room.unsubscribe(writer)
+        self.archiveGame(room)
+        self.rooms.pop(room.roomId, None)
+        if self.waiting is room:
+            self.waiting = None
+            if self.lobby is not None:
+                with self.lobby.get_lock():
+                    if self.lobby.value == room.roomId:
+                        self.lobby.value = 0
+
+    async def handleClient(self, reader, writer):
+        self.metrics.incr('connections.total')
+        self.connections += 1
+        try:
+            await self.play(reader, writer)
+        finally:
+            self.connections -= 1
+
+    async def play(self, reader, writer):
+        counters = self.metrics.counters
         try:
-            if bolean:
-                board = eval(clients[0].recv(4096).decode('utf-8'))
-                attboard = str(board).encode()
-                print("recebido player1")
-                broadcast(attboard, clients[0])
-                bolean = not bolean
+            msgType, payload = await protocol.readFrameAsync(reader)
+            if msgType != protocol.HELLO:
+                raise protocol.ProtocolError('esperava HELLO')
+            mode, gameId, token = protocol.decodeHello(payload)
+            if mode != protocol.PLAY and gameId and self.ownerPort(gameId) is not None:
+                writer.write(protocol.encodeRedirect(self.ownerPort(gameId)))
+                await writer.drain()
+                writer.close()
+                return
+            if mode == protocol.RESUME:
+                room, player = self.resume(writer, gameId, token)
+            elif mode == protocol.WATCH:
+                room = self.rooms.get(gameId) if gameId else self.topRoom()
+                if room is None:
+                    raise protocol.ProtocolError('partida inexistente')
+                room.watch(writer)
+                player = protocol.SPECTATOR
             else:
-                board = eval(clients[1].recv(4096).decode('utf-8'))
-                attboard = str(board).encode()
-                print("recebido player 2")
-                broadcast(attboard, clients[1])
-                bolean = not bolean
-
-        except:
-            print("Usuário desconectado")
-            deleteClient(client)
-            break
-
-
-def broadcast(board, client):
-    for clientItem in clients:
-        if clientItem != client:
-            try:
-                clientItem.send(board)
-                print("Enviado!")
-            except:
-                deleteClient(clientItem)
-
-
-def deleteClient(client):
-    clients.remove(client)
+                room, player = self.matchmake(writer)
+                if room is None:  # o adversário espera em outro processo
+                    writer.write(protocol.encodeRedirect(player))
+                    await writer.drain()
+                    writer.close()
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, protocol.ProtocolError):
+            writer.close()
+            return
+
+        subscriber = room.subscribers[writer]
+        try:
+            # com as mensagens delimitadas o número do jogador e a posição vão juntos, sem espera
+            token = room.tokens[player] if player != protocol.SPECTATOR else 0
+            subscriber.send(protocol.encodeWelcome(player, room.roomId, token) + room.snapshot())
+            if room.result is not None:
+                subscriber.send(protocol.encodeGameOver(*room.result))
+
+            while True:
+                msgType, payload = await protocol.readFrameAsync(reader)
+                counters['messages.in'] += 1
+                counters['bytes.in'] += protocol.HEADER.size + len(payload)
+                if msgType != protocol.MOVE or player == protocol.SPECTATOR:
+                    continue
+                start = time.perf_counter()
+                startSq, endSq, ply = protocol.decodeMove(payload)
+                if room.applyMove(player, startSq, endSq, ply) is None:
+                    # movimento recusado: o cliente volta para a posição do servidor
+                    counters['moves.rejected'] += 1
+                    subscriber.send(room.snapshot())
+                    continue
+                if self.archive is not None:
+                    self.writeArchive(self.archive.recordMove, room.roomId, ply, protocol.packMove(startSq, endSq))
+                # o adversário e os espectadores recebem só o lance; quem jogou já tem a posição
+                room.publish(protocol.frame(msgType, payload), writer)
+                if room.result is not None:
+                    counters['games.finished'] += 1
+                    room.publish(protocol.encodeGameOver(*room.result))
+                    self.archiveGame(room)
+                self.metrics.observe('handle.move', time.perf_counter() - start)
+        except (asyncio.IncompleteReadError, ConnectionError, protocol.ProtocolError):
+            pass
+        finally:
+            self.leave(room, writer)
+            writer.close()
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats['worker'] = self.worker
+        if self.profiler is not None and self.profiler.total:
+            stats['profile'] = {'running': self.profiler.running, 'samples': self.profiler.total,
+                                'top': self.profiler.report()}
+        return stats
+
+    async def handleStats(self, reader, writer):
+        # HTTP mínimo: GET / devolve as métricas em JSON; /profile/start e /profile/stop ligam e
+        # desligam o profiler, /reset zera os contadores
+        try:
+            request = await reader.readline()
+            path = request.split()[1].decode() if len(request.split()) > 1 else '/'
+            if path == '/profile/start':
+                self.profiler = self.profiler or ChessMetrics.SamplingProfiler()
+                self.profiler.start()
+            elif path == '/profile/stop' and self.profiler is not None:
+                self.profiler.stop()
+            elif path == '/reset':
+                self.metrics.reset()
+                if self.profiler is not None:
+                    self.profiler.clear()
+            body = json.dumps(self.stats(), indent=2, sort_keys=True).encode()
+            writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                         % len(body) + body)
+            await writer.drain()
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
+
+    async def dumpStats(self, interval):  # uma linha de JSON por intervalo na saída padrão
+        while True:
+            await asyncio.sleep(interval)
+            print(json.dumps(self.stats(), sort_keys=True), flush=True)
+
+    async def serve(self, host=HOST, announce=True, statsPort=None, statsInterval=None):
+        if self.workers == 1:
+            servers = [await asyncio.start_server(self.handleClient, host, self.port)]
+        else:
+            # porta pública compartilhada com os outros processos e porta particular para os REDIRECT
+            servers = [await asyncio.start_server(self.handleClient, host, self.port, reuse_port=True),
+                       await asyncio.start_server(self.handleClient, host, self.port + 1 + self.worker)]
+        if statsPort:
+            servers.append(await asyncio.start_server(self.handleStats, host, statsPort + self.worker))
+        if statsInterval:
+            asyncio.ensure_future(self.dumpStats(statsInterval))
+        if announce:
+            print("Servidor iniciado")
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in servers))
+        finally:
+            if self.archive is not None:
+                self.archiveExecutor.shutdown()  # espera as gravações pendentes
+                self.archive.close()  # partidas abertas ficam no journal
+
+
+def newServer(worker=0, workers=1, port=PORT, options=None, lobby=None):
+    # options: statsPort, statsInterval, engineMetrics, profile e archive (ver main)
+    options = options or {}
+    archive = None
+    if options.get('archive'):
+        archive = ChessArchive.ArchiveWriter(ChessArchive.shardPath(options['archive'], worker))
+    metrics = ChessMetrics.Metrics()
+    if options.get('engineMetrics'):
+        ChessMetrics.instrumentEngine(metrics)
+    profiler = None
+    if options.get('profile'):
+        profiler = ChessMetrics.SamplingProfiler()
+        profiler.start()
+    return GameServer(worker, workers, port, metrics, profiler, archive, lobby)
+
+
+def runWorker(worker, workers, host, port, options=None, lobby=None):
+    options = options or {}
+    server = newServer(worker, workers, port, options, lobby)
+    try:
+        asyncio.run(server.serve(host, False, options.get('statsPort'), options.get('statsInterval')))
+    except OSError:
+        print('\nO processo %d não conseguiu abrir as portas!\n' % worker)
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise(workers, host=HOST, port=PORT, options=None):
+    # inicia os processos e reinicia quem cair com erro (as salas dele se perdem); quem termina
+    # normalmente, como um processo que não conseguiu abrir a porta, não volta
+    lobby = multiprocessing.Value('Q', 0)  # id da sala que espera o adversário, de qualquer processo
+    processes = {}
+
+    def startWorker(worker):
+        processes[worker] = multiprocessing.Process(target=runWorker,
+                                                    args=(worker, workers, host, port, options, lobby))
+        processes[worker].start()
+
+    def releaseLobby(worker):  # a sala anunciada morreu com o processo
+        with lobby.get_lock():
+            if lobby.value and lobby.value >> WORKER_BITS == worker:
+                lobby.value = 0
+
+    for worker in range(workers):
+        startWorker(worker)
+    print("Servidor iniciado com %d processos" % workers)
+    try:
+        while processes:
+            for worker, process in list(processes.items()):
+                process.join(1.0 / workers)
+                if process.exitcode is not None:
+                    releaseLobby(worker)
+                if process.exitcode == 0:
+                    del processes[worker]
+                elif process.exitcode is not None:
+                    print('Processo %d terminou (código %d), reiniciando' % (worker, process.exitcode))
+                    time.sleep(1)  # sem isso um erro na inicialização vira um laço de reinícios
+                    startWorker(worker)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor do jogo de xadrez')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos que dividem a porta (cada um com as próprias salas)')
+    parser.add_argument('--stats-port', type=int, help='porta HTTP local das métricas (+ número do processo)')
+    parser.add_argument('--stats-interval', type=float, help='mostra as métricas a cada N segundos')
+    parser.add_argument('--engine-metrics', action='store_true', help='mede também os métodos do ChessEngine')
+    parser.add_argument('--profile', action='store_true', help='liga o profiler por amostragem')
+    parser.add_argument('--archive', metavar='PASTA', help='grava as partidas (ChessArchive)')
+    args = parser.parse_args(argv)
+    options = {'statsPort': args.stats_port, 'statsInterval': args.stats_interval,
+               'engineMetrics': args.engine_metrics, 'profile': args.profile, 'archive': args.archive}
+    if args.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        return print('\nEste sistema não permite vários processos na mesma porta (SO_REUSEPORT)\n')
+    if args.workers > 1 << (32 - WORKER_BITS):
+        return print('\nNúmero de processos grande demais\n')
+    try:
+        if args.workers > 1:
+            supervise(args.workers, args.host, args.port, options)
+        else:
+            server = newServer(port=args.port, options=options)
+            asyncio.run(server.serve(args.host, True, args.stats_port, args.stats_interval))
+    except OSError:
+        return print('\nNão foi possível iniciar o servidor!\n')
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+''' Testes do servidor com vários processos: sobe o serverSocket.py num subprocesso (como o
+loadTest.py) e confere que dois jogadores que chegam em processos diferentes caem na mesma sala.
+
+Uso: python -m unittest test_serverSocket (na pasta Servidor) '''
+
+import os
+import signal
+import socket
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Cliente'))
+from socketCliente import protocol  # noqa: E402
+import loadTest  # noqa: E402
+
+HOST = '127.0.0.1'
+PORT = 6655  # usa também as portas PORT + 1 ... PORT + WORKERS
+WORKERS = 4
+
+
+def connectPlayer(port):
+    # conecta como jogador, seguindo os REDIRECT: (socket, número do jogador, id da partida)
+    sock = socket.create_connection((HOST, port), 5)
+    sock.sendall(protocol.encodeHello(protocol.PLAY))
+    msgType, payload = protocol.readFrame(sock)
+    while msgType == protocol.REDIRECT:
+        sock.close()
+        sock = socket.create_connection((HOST, protocol.decodeRedirect(payload)), 5)
+        sock.sendall(protocol.encodeHello(protocol.PLAY))
+        msgType, payload = protocol.readFrame(sock)
+    player, gameId, token = protocol.decodeWelcome(payload)
+    protocol.readFrame(sock)  # SNAPSHOT
+    return sock, player, gameId
+
+
+class MatchmakingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = loadTest.startServer(HOST, PORT, WORKERS)
+
+    @classmethod
+    def tearDownClass(cls):
+        # SIGINT em vez de terminate: o supervisor encerra os processos dele antes de sair
+        cls.server.send_signal(signal.SIGINT)
+        cls.server.wait(10)
+
+    def testPairsAcrossWorkers(self):
+        # com SO_REUSEPORT as conexões se espalham pelos processos; cada par tem que formar uma sala
+        games = set()
+        for attempt in range(12):
+            first, firstPlayer, firstGame = connectPlayer(PORT)
+            second, secondPlayer, secondGame = connectPlayer(PORT)
+            try:
+                self.assertEqual(firstGame, secondGame)
+                self.assertEqual((firstPlayer, secondPlayer), (0, 1))
+                games.add(firstGame)
+            finally:
+                first.close()
+                second.close()
+        self.assertEqual(len(games), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()